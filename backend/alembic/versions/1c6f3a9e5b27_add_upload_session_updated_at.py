@@ -0,0 +1,31 @@
+"""add_upload_session_updated_at
+
+Revision ID: 1c6f3a9e5b27
+Revises: 8b4e1f7c2a60
+Create Date: 2026-10-19 08:03:17.482915
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '1c6f3a9e5b27'
+down_revision: Union[str, Sequence[str], None] = '8b4e1f7c2a60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'upload_sessions', sa.Column('updated_at', sa.DateTime(), nullable=True)
+    )
+    op.execute("UPDATE upload_sessions SET updated_at = created_at")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('upload_sessions', 'updated_at')
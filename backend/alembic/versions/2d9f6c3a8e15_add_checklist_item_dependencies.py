@@ -0,0 +1,63 @@
+"""add_checklist_item_dependencies
+
+Revision ID: 2d9f6c3a8e15
+Revises: 5c1e7b3f9d42
+Create Date: 2026-10-18 22:41:37.219406
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '2d9f6c3a8e15'
+down_revision: Union[str, Sequence[str], None] = '5c1e7b3f9d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('checklist_item_dependencies',
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('depends_on_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['item_id'], ['checklist_items.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['depends_on_id'], ['checklist_items.id'],
+                            ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('item_id', 'depends_on_id')
+    )
+    op.create_index('ix_checklist_item_dependencies_depends_on_id',
+                    'checklist_item_dependencies', ['depends_on_id'], unique=False)
+    # Dependencies across checklists were never meant to exist; drop them
+    op.execute("""
+        INSERT INTO checklist_item_dependencies (item_id, depends_on_id)
+        SELECT item.id, item.depends_on_id
+        FROM checklist_items AS item
+        JOIN checklist_items AS dependency ON dependency.id = item.depends_on_id
+        WHERE dependency.checklist_id = item.checklist_id
+    """)
+    op.drop_column('checklist_items', 'depends_on_id')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('checklist_items',
+                  sa.Column('depends_on_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(None, 'checklist_items', 'checklist_items',
+                          ['depends_on_id'], ['id'])
+    # Only the first of several dependencies survives
+    op.execute("""
+        UPDATE checklist_items
+        SET depends_on_id = dependency.depends_on_id
+        FROM (
+            SELECT item_id, min(depends_on_id) AS depends_on_id
+            FROM checklist_item_dependencies
+            GROUP BY item_id
+        ) AS dependency
+        WHERE dependency.item_id = checklist_items.id
+    """)
+    op.drop_index('ix_checklist_item_dependencies_depends_on_id',
+                  table_name='checklist_item_dependencies')
+    op.drop_table('checklist_item_dependencies')
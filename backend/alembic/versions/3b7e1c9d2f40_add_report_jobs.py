@@ -0,0 +1,49 @@
+"""add_report_jobs
+
+Revision ID: 3b7e1c9d2f40
+Revises: 53f16aae0420
+Create Date: 2026-10-18 09:12:44.218301
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7e1c9d2f40'
+down_revision: Union[str, Sequence[str], None] = '53f16aae0420'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'audit_reports', sa.Column('template_version', sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        'audit_reports',
+        sa.Column(
+            'status', sa.String(length=20), server_default='done', nullable=False
+        ),
+    )
+    op.add_column('audit_reports', sa.Column('file_path', sa.String(), nullable=True))
+    op.add_column('audit_reports', sa.Column('error', sa.Text(), nullable=True))
+    op.add_column(
+        'audit_reports', sa.Column('completed_at', sa.DateTime(), nullable=True)
+    )
+    op.create_index(
+        op.f('ix_audit_reports_status'), 'audit_reports', ['status'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_audit_reports_status'), table_name='audit_reports')
+    op.drop_column('audit_reports', 'completed_at')
+    op.drop_column('audit_reports', 'error')
+    op.drop_column('audit_reports', 'file_path')
+    op.drop_column('audit_reports', 'status')
+    op.drop_column('audit_reports', 'template_version')
@@ -0,0 +1,36 @@
+"""cascade_template_version_deletes
+
+Revision ID: 3f8d5a2c6b91
+Revises: 6e2b9d4a8c17
+Create Date: 2026-10-18 21:08:52.140377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8d5a2c6b91'
+down_revision: Union[str, Sequence[str], None] = '6e2b9d4a8c17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_constraint('template_versions_template_id_fkey', 'template_versions',
+                       type_='foreignkey')
+    op.create_foreign_key(
+        'template_versions_template_id_fkey', 'template_versions', 'audit_templates',
+        ['template_id'], ['id'], ondelete='CASCADE',
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('template_versions_template_id_fkey', 'template_versions',
+                       type_='foreignkey')
+    op.create_foreign_key(
+        'template_versions_template_id_fkey', 'template_versions', 'audit_templates',
+        ['template_id'], ['id'],
+    )
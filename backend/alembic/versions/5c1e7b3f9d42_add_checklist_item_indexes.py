@@ -0,0 +1,30 @@
+"""add_checklist_item_indexes
+
+Revision ID: 5c1e7b3f9d42
+Revises: 3f8d5a2c6b91
+Create Date: 2026-10-18 21:47:15.802963
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e7b3f9d42'
+down_revision: Union[str, Sequence[str], None] = '3f8d5a2c6b91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_checklists_template_id'), 'checklists', ['template_id'],
+                    unique=False)
+    op.create_index('ix_checklist_items_checklist_id_order', 'checklist_items',
+                    ['checklist_id', 'order', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_checklist_items_checklist_id_order', table_name='checklist_items')
+    op.drop_index(op.f('ix_checklists_template_id'), table_name='checklists')
@@ -0,0 +1,77 @@
+"""add_version_content_size_and_hash
+
+Revision ID: 6e2b9d4a8c17
+Revises: 9a3c6e1d7f24
+Create Date: 2026-10-18 20:26:09.581734
+
+"""
+import hashlib
+import json
+import zlib
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '6e2b9d4a8c17'
+down_revision: Union[str, Sequence[str], None] = '9a3c6e1d7f24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The delta format and content hash as of this revision, frozen here so that
+# replaying it never depends on the current app code
+DELTA_ENCODING = "delta"
+
+
+def apply_delta(base: str, delta: bytes) -> str:
+    base_lines = base.splitlines(keepends=True)
+    return "".join(
+        op if isinstance(op, str) else "".join(base_lines[op[0]:op[1]])
+        for op in json.loads(zlib.decompress(delta))
+    )
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('template_versions',
+                  sa.Column('content_size', sa.Integer(), nullable=True))
+    op.add_column('template_versions',
+                  sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.execute("""
+        UPDATE template_versions
+        SET content_size = octet_length(content),
+            content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')
+        WHERE content IS NOT NULL
+    """)
+    connection = op.get_bind()
+    rows = connection.execute(sa.text("""
+        SELECT version.id, version.content_delta, keyframe.content
+        FROM template_versions AS version
+        JOIN template_versions AS keyframe ON keyframe.id = version.base_version_id
+        WHERE version.content_encoding = :encoding
+    """), {"encoding": DELTA_ENCODING}).all()
+    update = sa.text(
+        "UPDATE template_versions SET content_size = :size, content_hash = :hash"
+        " WHERE id = :id"
+    )
+    for row in rows:
+        content = apply_delta(row.content, row.content_delta)
+        connection.execute(update, {
+            "size": len(content.encode()),
+            "hash": content_hash(content),
+            "id": row.id,
+        })
+    op.alter_column('template_versions', 'content_size', nullable=False)
+    op.alter_column('template_versions', 'content_hash', nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('template_versions', 'content_hash')
+    op.drop_column('template_versions', 'content_size')
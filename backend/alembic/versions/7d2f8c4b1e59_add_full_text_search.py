@@ -0,0 +1,55 @@
+"""add_full_text_search
+
+Revision ID: 7d2f8c4b1e59
+Revises: e3b7d91f4a65
+Create Date: 2026-10-18 16:41:27.905113
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2f8c4b1e59'
+down_revision: Union[str, Sequence[str], None] = 'e3b7d91f4a65'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Stored generated columns: adding them rewrites both tables once
+    op.add_column('audit_templates', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(content, '')), 'C')",
+            persisted=True,
+        ),
+        nullable=True,
+    ))
+    op.create_index('ix_audit_templates_search_vector', 'audit_templates',
+                    ['search_vector'], unique=False, postgresql_using='gin')
+    op.add_column('template_comments', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('english', coalesce(content, ''))", persisted=True),
+        nullable=True,
+    ))
+    op.create_index('ix_template_comments_search_vector', 'template_comments',
+                    ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_template_comments_search_vector', table_name='template_comments',
+                  postgresql_using='gin')
+    op.drop_column('template_comments', 'search_vector')
+    op.drop_index('ix_audit_templates_search_vector', table_name='audit_templates',
+                  postgresql_using='gin')
+    op.drop_column('audit_templates', 'search_vector')
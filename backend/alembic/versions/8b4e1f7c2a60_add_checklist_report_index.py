@@ -0,0 +1,27 @@
+"""add_checklist_report_index
+
+Revision ID: 8b4e1f7c2a60
+Revises: 2d9f6c3a8e15
+Create Date: 2026-10-18 23:12:54.630218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4e1f7c2a60'
+down_revision: Union[str, Sequence[str], None] = '2d9f6c3a8e15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_checklists_report_id'), 'checklists', ['report_id'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_checklists_report_id'), table_name='checklists')
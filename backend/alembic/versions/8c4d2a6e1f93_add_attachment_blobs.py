@@ -0,0 +1,56 @@
+"""add_attachment_blobs
+
+Revision ID: 8c4d2a6e1f93
+Revises: 3b7e1c9d2f40
+Create Date: 2026-10-18 10:41:07.530912
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4d2a6e1f93'
+down_revision: Union[str, Sequence[str], None] = '3b7e1c9d2f40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('attachment_blobs',
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('file_path', sa.String(), nullable=False),
+    sa.Column('file_size', sa.Integer(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('content_hash')
+    )
+    op.add_column(
+        'attachments', sa.Column('content_hash', sa.String(length=64), nullable=True)
+    )
+    op.create_index(
+        op.f('ix_attachments_content_hash'),
+        'attachments',
+        ['content_hash'],
+        unique=False,
+    )
+    op.create_foreign_key(
+        'attachments_content_hash_fkey',
+        'attachments',
+        'attachment_blobs',
+        ['content_hash'],
+        ['content_hash'],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint(
+        'attachments_content_hash_fkey', 'attachments', type_='foreignkey'
+    )
+    op.drop_index(op.f('ix_attachments_content_hash'), table_name='attachments')
+    op.drop_column('attachments', 'content_hash')
+    op.drop_table('attachment_blobs')
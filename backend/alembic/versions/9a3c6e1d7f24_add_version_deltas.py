@@ -0,0 +1,146 @@
+"""add_version_deltas
+
+Revision ID: 9a3c6e1d7f24
+Revises: b8e4f2a7c039
+Create Date: 2026-10-18 19:12:44.316208
+
+"""
+import difflib
+import json
+import zlib
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '9a3c6e1d7f24'
+down_revision: Union[str, Sequence[str], None] = 'b8e4f2a7c039'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The delta format and backfill parameters as of this revision, frozen here so
+# that replaying it never depends on the current app code or settings
+DELTA_ENCODING = "delta"
+KEYFRAME_INTERVAL = 20
+
+
+def encode_delta(base: str, content: str) -> bytes:
+    base_lines = base.splitlines(keepends=True)
+    lines = content.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(lines[j1:j2]))
+    return zlib.compress(
+        json.dumps(ops, ensure_ascii=False, separators=(",", ":")).encode(), 9
+    )
+
+
+def apply_delta(base: str, delta: bytes) -> str:
+    base_lines = base.splitlines(keepends=True)
+    return "".join(
+        op if isinstance(op, str) else "".join(base_lines[op[0]:op[1]])
+        for op in json.loads(zlib.decompress(delta))
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'template_versions',
+        sa.Column('content_encoding', sa.String(length=20), nullable=True),
+    )
+    op.add_column(
+        'template_versions', sa.Column('base_version_id', sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        'template_versions', sa.Column('content_delta', sa.LargeBinary(), nullable=True)
+    )
+    op.create_foreign_key(
+        'template_versions_base_version_id_fkey',
+        'template_versions',
+        'template_versions',
+        ['base_version_id'],
+        ['id'],
+        deferrable=True,
+        initially='DEFERRED',
+    )
+    op.create_index(
+        'ix_template_versions_template_id_version',
+        'template_versions',
+        ['template_id', 'version'],
+        unique=False,
+    )
+    op.alter_column(
+        'template_versions', 'content', existing_type=sa.Text(), nullable=True
+    )
+
+    # Re-encode existing history one template at a time, as create_snapshot would have
+    connection = op.get_bind()
+    template_ids = connection.execute(
+        sa.text("SELECT DISTINCT template_id FROM template_versions")
+    ).scalars().all()
+    for template_id in template_ids:
+        rows = connection.execute(sa.text(
+            "SELECT id, version, content FROM template_versions"
+            " WHERE template_id = :template_id ORDER BY version, id"
+        ), {"template_id": template_id}).all()
+        keyframe = None
+        for row in rows:
+            if (
+                keyframe is not None
+                and row.version - keyframe.version < KEYFRAME_INTERVAL
+            ):
+                delta = encode_delta(keyframe.content, row.content)
+                if len(delta) < len(row.content.encode()):
+                    connection.execute(sa.text("""
+                        UPDATE template_versions
+                        SET content = NULL, content_encoding = :encoding,
+                            base_version_id = :base, content_delta = :delta
+                        WHERE id = :id
+                    """), {
+                        "encoding": DELTA_ENCODING,
+                        "base": keyframe.id,
+                        "delta": delta,
+                        "id": row.id,
+                    })
+                    continue
+            keyframe = row
+    # Check the deferred foreign key now: later revisions run in the same
+    # transaction and cannot alter the table while its checks are pending
+    op.execute("SET CONSTRAINTS template_versions_base_version_id_fkey IMMEDIATE")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    connection = op.get_bind()
+    rows = connection.execute(sa.text("""
+        SELECT version.id, version.content_delta, keyframe.content
+        FROM template_versions AS version
+        JOIN template_versions AS keyframe ON keyframe.id = version.base_version_id
+        WHERE version.content_encoding = :encoding
+    """), {"encoding": DELTA_ENCODING}).all()
+    for row in rows:
+        connection.execute(
+            sa.text("UPDATE template_versions SET content = :content WHERE id = :id"),
+            {"content": apply_delta(row.content, row.content_delta), "id": row.id},
+        )
+    op.alter_column(
+        'template_versions', 'content', existing_type=sa.Text(), nullable=False
+    )
+    op.drop_index(
+        'ix_template_versions_template_id_version', table_name='template_versions'
+    )
+    op.drop_constraint(
+        'template_versions_base_version_id_fkey',
+        'template_versions',
+        type_='foreignkey',
+    )
+    op.drop_column('template_versions', 'content_delta')
+    op.drop_column('template_versions', 'base_version_id')
+    op.drop_column('template_versions', 'content_encoding')
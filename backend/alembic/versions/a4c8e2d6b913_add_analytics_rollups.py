@@ -0,0 +1,108 @@
+"""add_analytics_rollups
+
+Revision ID: a4c8e2d6b913
+Revises: f2a95e7b4c16
+Create Date: 2026-10-18 14:22:41.306518
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c8e2d6b913'
+down_revision: Union[str, Sequence[str], None] = 'f2a95e7b4c16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('daily_rollups',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('templates_created', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('reports_generated', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('comments_created', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('attachments_created', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('attachment_bytes', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+    op.create_table('template_rollups',
+    sa.Column('template_id', sa.Integer(), nullable=False),
+    sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('attachment_count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['template_id'], ['audit_templates.id'],
+                            ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('template_id')
+    )
+    op.create_index('ix_template_rollups_comment_count', 'template_rollups',
+                    [sa.text('comment_count DESC'), 'template_id'], unique=False)
+    op.create_index('ix_template_rollups_attachment_count', 'template_rollups',
+                    [sa.text('attachment_count DESC'), 'template_id'], unique=False)
+    op.create_table('rollup_counters',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    # Backfill from the existing data (same as `python -m app.rollups rebuild`)
+    op.execute("""
+        INSERT INTO daily_rollups
+            (day, templates_created, reports_generated, comments_created,
+             attachments_created, attachment_bytes)
+        SELECT day, sum(templates), sum(reports), sum(comments),
+               sum(attachments), sum(bytes)
+        FROM (
+            SELECT coalesce(CAST(created_at AS date), DATE '1970-01-01') AS day,
+                   count(*) AS templates, 0 AS reports, 0 AS comments,
+                   0 AS attachments, 0 AS bytes
+            FROM audit_templates GROUP BY 1
+            UNION ALL
+            SELECT coalesce(CAST(created_at AS date), DATE '1970-01-01'),
+                   0, count(*), 0, 0, 0
+            FROM audit_reports GROUP BY 1
+            UNION ALL
+            SELECT coalesce(CAST(created_at AS date), DATE '1970-01-01'),
+                   0, 0, count(*), 0, 0
+            FROM template_comments GROUP BY 1
+            UNION ALL
+            SELECT coalesce(CAST(created_at AS date), DATE '1970-01-01'),
+                   0, 0, 0, count(*), sum(file_size)
+            FROM attachments GROUP BY 1
+        ) AS counts
+        GROUP BY day
+    """)
+    op.execute("""
+        INSERT INTO template_rollups (template_id, comment_count, attachment_count)
+        SELECT audit_templates.id, coalesce(comments.n, 0), coalesce(attachments.n, 0)
+        FROM audit_templates
+        LEFT JOIN (
+            SELECT template_id, count(*) AS n
+            FROM template_comments GROUP BY template_id
+        ) AS comments ON comments.template_id = audit_templates.id
+        LEFT JOIN (
+            SELECT template_id, count(*) AS n
+            FROM attachments WHERE template_id IS NOT NULL
+            GROUP BY template_id
+        ) AS attachments ON attachments.template_id = audit_templates.id
+    """)
+    op.execute("""
+        INSERT INTO rollup_counters (name, value)
+        SELECT 'templates_' || status, count(*) FROM audit_templates GROUP BY status
+        UNION ALL
+        SELECT 'storage_bytes',
+               (SELECT coalesce(sum(stored_size), 0) FROM attachment_blobs)
+               + (SELECT coalesce(sum(stored_size), 0) FROM attachments
+                  WHERE content_hash IS NULL)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('rollup_counters')
+    op.drop_index('ix_template_rollups_attachment_count', table_name='template_rollups')
+    op.drop_index('ix_template_rollups_comment_count', table_name='template_rollups')
+    op.drop_table('template_rollups')
+    op.drop_table('daily_rollups')
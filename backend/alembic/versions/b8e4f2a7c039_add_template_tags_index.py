@@ -0,0 +1,28 @@
+"""add_template_tags_index
+
+Revision ID: b8e4f2a7c039
+Revises: 7d2f8c4b1e59
+Create Date: 2026-10-18 17:20:13.558409
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e4f2a7c039'
+down_revision: Union[str, Sequence[str], None] = '7d2f8c4b1e59'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_audit_templates_tags', 'audit_templates', ['tags'],
+                    unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_audit_templates_tags', table_name='audit_templates',
+                  postgresql_using='gin')
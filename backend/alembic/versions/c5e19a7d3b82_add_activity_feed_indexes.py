@@ -0,0 +1,44 @@
+"""add_activity_feed_indexes
+
+Revision ID: c5e19a7d3b82
+Revises: a4c8e2d6b913
+Create Date: 2026-10-18 15:10:52.418207
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e19a7d3b82'
+down_revision: Union[str, Sequence[str], None] = 'a4c8e2d6b913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = (
+    'audit_templates',
+    'audit_reports',
+    'template_comments',
+    'attachments',
+    'template_versions',
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in TABLES:
+        op.create_index(f'ix_{table}_created_at_id', table, ['created_at', 'id'],
+                        unique=False)
+    op.create_index('ix_checklist_items_completed_at_id', 'checklist_items',
+                    ['completed_at', 'id'], unique=False,
+                    postgresql_where=sa.text('completed_at IS NOT NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_checklist_items_completed_at_id', table_name='checklist_items',
+                  postgresql_where=sa.text('completed_at IS NOT NULL'))
+    for table in reversed(TABLES):
+        op.drop_index(f'ix_{table}_created_at_id', table_name=table)
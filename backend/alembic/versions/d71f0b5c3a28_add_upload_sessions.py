@@ -0,0 +1,42 @@
+"""add_upload_sessions
+
+Revision ID: d71f0b5c3a28
+Revises: 8c4d2a6e1f93
+Create Date: 2026-10-18 11:26:53.104377
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'd71f0b5c3a28'
+down_revision: Union[str, Sequence[str], None] = '8c4d2a6e1f93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('upload_sessions',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('template_id', sa.Integer(), nullable=True),
+    sa.Column('report_id', sa.Integer(), nullable=True),
+    sa.Column('original_filename', sa.String(), nullable=False),
+    sa.Column('mime_type', sa.String(), nullable=False),
+    sa.Column('total_size', sa.Integer(), nullable=True),
+    sa.Column('created_by', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['report_id'], ['audit_reports.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(
+        ['template_id'], ['audit_templates.id'], ondelete='CASCADE'
+    ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('upload_sessions')
@@ -0,0 +1,30 @@
+"""add_template_listing_index
+
+Revision ID: e3b7d91f4a65
+Revises: c5e19a7d3b82
+Create Date: 2026-10-18 15:58:04.127334
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b7d91f4a65'
+down_revision: Union[str, Sequence[str], None] = 'c5e19a7d3b82'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keyset pagination on (updated_at, id) needs every row to have a value
+    op.execute("UPDATE audit_templates SET updated_at = coalesce(created_at, now())"
+               " WHERE updated_at IS NULL")
+    op.create_index('ix_audit_templates_updated_at_id', 'audit_templates',
+                    ['updated_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_audit_templates_updated_at_id', table_name='audit_templates')
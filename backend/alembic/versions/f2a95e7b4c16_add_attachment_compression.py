@@ -0,0 +1,37 @@
+"""add_attachment_compression
+
+Revision ID: f2a95e7b4c16
+Revises: d71f0b5c3a28
+Create Date: 2026-10-18 12:03:18.772650
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a95e7b4c16'
+down_revision: Union[str, Sequence[str], None] = 'd71f0b5c3a28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('attachment_blobs', 'attachments'):
+        op.add_column(
+            table, sa.Column('content_encoding', sa.String(length=20), nullable=True)
+        )
+        op.add_column(table, sa.Column('stored_size', sa.Integer(), nullable=True))
+        # Everything stored so far is uncompressed
+        op.execute(f"UPDATE {table} SET stored_size = file_size")
+        op.alter_column(table, 'stored_size', nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ('attachments', 'attachment_blobs'):
+        op.drop_column(table, 'stored_size')
+        op.drop_column(table, 'content_encoding')
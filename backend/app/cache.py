@@ -0,0 +1,284 @@
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from pydantic_settings import BaseSettings
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class CacheSettings(BaseSettings):
+    cache_backend: str = "memory"
+    cache_redis_url: str = "redis://localhost:6379/0"
+    cache_lock_timeout_seconds: float = 30.0
+    analytics_cache_ttl_seconds: float = 15.0
+    analytics_cache_stale_seconds: float = 60.0
+    diff_cache_ttl_seconds: float = 3600.0
+    checklist_graph_cache_ttl_seconds: float = 300.0
+    cache_memory_max_entries: int = 10000
+
+    model_config = {"env_file": ".env", "extra": "ignore"}
+
+
+cache_settings = CacheSettings()
+
+# Deletes a lock only if it still holds the caller's token, so a worker whose
+# lock expired mid-compute cannot release the lock another worker took since
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class MemoryBackend:
+    """
+    In-process backend implementing the subset of the Redis client API used
+    by ResponseCache (get, set with ex/nx, delete, incr, expire, and eval of
+    RELEASE_LOCK_SCRIPT). Only shared by the
+    threads of one worker process. Beyond ``max_entries`` keys, expired and
+    then the oldest expiring entries are evicted.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+
+    def _get_live(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._get_live(key)
+
+    def set(
+        self, key: str, value: bytes, ex: Optional[int] = None, nx: bool = False
+    ) -> Optional[bool]:
+        with self._lock:
+            if nx and self._get_live(key) is not None:
+                return None
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+            if len(self._data) > self.max_entries:
+                self._evict()
+            return True
+
+    def _evict(self) -> None:
+        # Keys without an expiry (e.g. cache generations) are never evicted
+        now = time.monotonic()
+        expiring = [
+            key for key, (_, expires_at) in self._data.items() if expires_at is not None
+        ]
+        for key in expiring:
+            if self._data[key][1] <= now:
+                del self._data[key]
+        for key in expiring:
+            if len(self._data) <= self.max_entries:
+                break
+            self._data.pop(key, None)
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._get_live(key) or 0) + 1
+            _, expires_at = self._data.get(key, (None, None))
+            self._data[key] = (str(value).encode(), expires_at)
+            return value
+
+    def eval(self, script: str, numkeys: int, *keys_and_args) -> int:
+        if script != RELEASE_LOCK_SCRIPT or numkeys != 1:
+            raise ValueError("unsupported script")
+        key, token = keys_and_args
+        if isinstance(token, str):
+            token = token.encode()
+        with self._lock:
+            if self._get_live(key) != token:
+                return 0
+            del self._data[key]
+            return 1
+
+    def expire(self, key: str, seconds: int) -> bool:
+        with self._lock:
+            value = self._get_live(key)
+            if value is None:
+                return False
+            self._data[key] = (value, time.monotonic() + seconds)
+            return True
+
+
+def create_backend(settings: CacheSettings = cache_settings):
+    if settings.cache_backend == "memory":
+        return MemoryBackend(settings.cache_memory_max_entries)
+    if settings.cache_backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+        return redis.Redis.from_url(settings.cache_redis_url)
+    raise ValueError(f"Unknown cache backend: {settings.cache_backend}")
+
+
+class ResponseCache:
+    """
+    Cache of JSON-serialisable responses with a TTL, stale-while-revalidate
+    and single-flight recomputation.
+
+    Entries are stored as ``{"g": generation, "t": computed at, "v": value}``.
+    An entry is fresh while it is younger than ``ttl`` and was computed under
+    the current generation; ``invalidate()`` just bumps the generation, which
+    every worker sharing the backend sees at once. Entries computed with a
+    ``scope`` (e.g. a checklist id) also carry that scope's generation, so
+    ``invalidate(scope)`` drops just them. Only the request holding
+    the recompute lock for a key recomputes it: the others get the stale
+    entry if one is still within ``stale`` seconds, or wait for the result.
+
+    ``backend`` is anything with the Redis client's get/set/delete/incr/expire/eval
+    signatures, e.g. MemoryBackend, ``redis.Redis`` or a local fake of it.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        backend,
+        ttl: float,
+        stale: float,
+        lock_timeout: float,
+        poll_interval: float = 0.05,
+    ):
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = ttl
+        self.stale = stale
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+
+    def _key(self, name: str, params: Dict[str, Any]) -> str:
+        encoded = json.dumps(params, sort_keys=True, default=str)
+        return f"{self.namespace}:{name}:{encoded}"
+
+    def _generation_key(self, scope: Any = None) -> str:
+        if scope is None:
+            return f"{self.namespace}:generation"
+        return f"{self.namespace}:generation:{scope}"
+
+    def generation(self, scope: Any = None):
+        generation = int(self.backend.get(self._generation_key()) or 0)
+        if scope is None:
+            return generation
+        return [generation, int(self.backend.get(self._generation_key(scope)) or 0)]
+
+    def _load(self, key: str) -> Optional[dict]:
+        raw = self.backend.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def get_or_compute(
+        self,
+        name: str,
+        params: Dict[str, Any],
+        compute: Callable[[], Any],
+        scope: Any = None,
+    ) -> Any:
+        key = self._key(name, params)
+        lock_key = f"{key}:lock"
+        generation = self.generation(scope)
+        deadline = time.monotonic() + self.lock_timeout
+        lock_expiry = math.ceil(self.lock_timeout)
+        expiry = math.ceil(self.ttl + self.stale)
+        while True:
+            entry = self._load(key)
+            if (
+                entry is not None
+                and entry["g"] == generation
+                and time.time() - entry["t"] < self.ttl
+            ):
+                return entry["v"]
+
+            token = uuid.uuid4().hex.encode()
+            if self.backend.set(lock_key, token, ex=lock_expiry, nx=True):
+                try:
+                    value = jsonable_encoder(compute())
+                    entry = {"g": generation, "t": time.time(), "v": value}
+                    self.backend.set(key, json.dumps(entry).encode(), ex=expiry)
+                    return value
+                finally:
+                    self.backend.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+            if entry is not None:
+                # Someone else is refreshing it
+                return entry["v"]
+            if time.monotonic() >= deadline:
+                # The lock holder is stuck or gone; don't wait forever
+                return jsonable_encoder(compute())
+            time.sleep(self.poll_interval)
+
+    def invalidate(self, scope: Any = None) -> None:
+        key = self._generation_key(scope)
+        self.backend.incr(key)
+        if scope is not None:
+            # Scope generations outlive the entries they guard, then go away
+            self.backend.expire(key, math.ceil(self.ttl + self.stale))
+
+    def invalidate_on_commit(self, db: Session, scope: Any = None) -> None:
+        """Invalidate once ``db`` commits; nothing happens if it rolls back."""
+        db.info.setdefault("invalidate_caches", set()).add((self, scope))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    for cache, scope in session.info.pop("invalidate_caches", ()):
+        try:
+            cache.invalidate(scope)
+        except Exception:
+            logger.exception("Failed to invalidate the %s cache", cache.namespace)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session: Session) -> None:
+    session.info.pop("invalidate_caches", None)
+
+
+cache_backend = create_backend()
+
+analytics_cache = ResponseCache(
+    "analytics",
+    cache_backend,
+    ttl=cache_settings.analytics_cache_ttl_seconds,
+    stale=cache_settings.analytics_cache_stale_seconds,
+    lock_timeout=cache_settings.cache_lock_timeout_seconds,
+)
+
+# Diffs are keyed by the hashes of both contents, so entries never go stale
+diff_cache = ResponseCache(
+    "diffs",
+    cache_backend,
+    ttl=cache_settings.diff_cache_ttl_seconds,
+    stale=0,
+    lock_timeout=cache_settings.cache_lock_timeout_seconds,
+)
+
+# Scoped by checklist id, invalidated by every write to its items
+checklist_graph_cache = ResponseCache(
+    "checklist_graphs",
+    cache_backend,
+    ttl=cache_settings.checklist_graph_cache_ttl_seconds,
+    stale=0,
+    lock_timeout=cache_settings.cache_lock_timeout_seconds,
+)
@@ -0,0 +1,88 @@
+"""
+Copy a template's checklists onto a report.
+
+``instantiate_checklists`` copies every checklist of the report's template
+(those not themselves attached to a report), with their items and the
+dependencies between them, in one INSERT ... SELECT statement. New ids are
+drawn from the sequences up front in two materialised CTEs mapping each
+source row to its copy, which lets the dependency rows be remapped in the
+same statement. Copies belong to the report only, not to the template, and
+start with no item completed.
+"""
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .models import AuditReport, Checklist
+
+_INSTANTIATE = text("""
+    WITH checklist_map AS MATERIALIZED (
+        SELECT source.id AS source_id,
+               nextval(pg_get_serial_sequence('checklists', 'id')) AS id
+        FROM (
+            SELECT id FROM checklists
+            WHERE template_id = :template_id AND report_id IS NULL
+            ORDER BY id
+        ) AS source
+    ),
+    item_map AS MATERIALIZED (
+        SELECT source.id AS source_id,
+               nextval(pg_get_serial_sequence('checklist_items', 'id')) AS id,
+               source.checklist_id
+        FROM (
+            SELECT item.id, checklist_map.id AS checklist_id
+            FROM checklist_items AS item
+            JOIN checklist_map ON checklist_map.source_id = item.checklist_id
+            ORDER BY item.checklist_id, item."order", item.id
+        ) AS source
+    ),
+    new_checklists AS (
+        INSERT INTO checklists
+            (id, report_id, name, description, created_by, created_at, updated_at)
+        SELECT checklist_map.id, :report_id, source.name, source.description,
+               :created_by, :now, :now
+        FROM checklist_map
+        JOIN checklists AS source ON source.id = checklist_map.source_id
+        RETURNING id
+    ),
+    new_items AS (
+        INSERT INTO checklist_items (
+            id, checklist_id, title, description, is_completed, is_mandatory,
+            "order", due_date, created_at
+        )
+        SELECT item_map.id, item_map.checklist_id, source.title, source.description,
+               false, source.is_mandatory, source."order", source.due_date, :now
+        FROM item_map
+        JOIN checklist_items AS source ON source.id = item_map.source_id
+    ),
+    new_dependencies AS (
+        INSERT INTO checklist_item_dependencies (item_id, depends_on_id)
+        SELECT item.id, dependency.id
+        FROM checklist_item_dependencies AS edge
+        JOIN item_map AS item ON item.source_id = edge.item_id
+        JOIN item_map AS dependency ON dependency.source_id = edge.depends_on_id
+    )
+    SELECT id FROM new_checklists ORDER BY id
+""")
+
+
+def instantiate_checklists(
+    db: Session, report: AuditReport, created_by: str
+) -> List[int]:
+    """
+    Copy the checklists of the report's template onto the report and return
+    the ids of the copies. Runs in the caller's transaction.
+    """
+    return db.execute(_INSTANTIATE, {
+        "template_id": report.template_id,
+        "report_id": report.id,
+        "created_by": created_by,
+        "now": datetime.utcnow(),
+    }).scalars().all()
+
+
+def has_checklists(db: Session, report_id: int) -> bool:
+    query = db.query(Checklist.id).filter(Checklist.report_id == report_id)
+    return query.first() is not None
@@ -0,0 +1,201 @@
+"""
+Dependency graph of a checklist's items.
+
+An item may depend on any number of other items of its checklist, one
+``checklist_item_dependencies`` row per edge. ``load_graph`` reads a
+checklist's items and edges in two queries. The resulting ChecklistGraph
+gives a topological order (dependencies first, ties broken by ``order`` and
+id), the actionable items (incomplete, every dependency completed) and the
+blocked ones, and checks proposed edges for cycles before they are written.
+
+Writes that change the graph lock the checklist row (``lock_checklist``) so
+concurrent requests cannot together close a cycle, and call
+``invalidate_graph``. The ``/checklists/{id}/graph`` response is cached per
+checklist until then (``cached_graph``).
+"""
+import heapq
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from .cache import checklist_graph_cache
+from .models import Checklist, ChecklistItem, ChecklistItemDependency
+
+
+@dataclass
+class GraphNode:
+    id: int
+    title: str
+    order: int
+    is_completed: bool
+    is_mandatory: bool
+    depends_on_ids: List[int] = field(default_factory=list)
+
+
+def find_cycle(edges: Dict[int, Iterable[int]]) -> Optional[List[int]]:
+    """
+    A cycle in the ``node -> dependencies`` mapping as the list of nodes on
+    it, or None. Iterative, so long dependency chains cannot hit the
+    recursion limit.
+    """
+    done = set()
+    for start in edges:
+        if start in done:
+            continue
+        path = [start]
+        on_path = {start}
+        stack = [iter(edges.get(start, ()))]
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                finished = path.pop()
+                on_path.discard(finished)
+                done.add(finished)
+                continue
+            if node in on_path:
+                return path[path.index(node):]
+            if node in done:
+                continue
+            path.append(node)
+            on_path.add(node)
+            stack.append(iter(edges.get(node, ())))
+    return None
+
+
+class ChecklistGraph:
+    def __init__(self, checklist_id: int, nodes: Iterable[GraphNode]):
+        self.checklist_id = checklist_id
+        self.nodes: Dict[int, GraphNode] = {node.id: node for node in nodes}
+
+    def edges(self) -> Dict[int, List[int]]:
+        return {node.id: node.depends_on_ids for node in self.nodes.values()}
+
+    def find_cycle(
+        self, changes: Optional[Dict[int, List[int]]] = None
+    ) -> Optional[List[int]]:
+        """The cycle the graph would have with ``changes`` applied, if any."""
+        return find_cycle({**self.edges(), **(changes or {})})
+
+    def blocked_by(self, item_id: int) -> List[int]:
+        """The incomplete dependencies of an item."""
+        return [
+            dependency_id for dependency_id in self.nodes[item_id].depends_on_ids
+            if not self.nodes[dependency_id].is_completed
+        ]
+
+    def topological_order(self) -> List[int]:
+        """
+        Item ids with every item after its dependencies. Items on or behind
+        a cycle, which only legacy data can contain, are left out.
+        """
+        pending = {node.id: len(node.depends_on_ids) for node in self.nodes.values()}
+        dependents: Dict[int, List[int]] = {node_id: [] for node_id in self.nodes}
+        for node in self.nodes.values():
+            for dependency_id in node.depends_on_ids:
+                dependents[dependency_id].append(node.id)
+        ready = [
+            (node.order, node.id)
+            for node in self.nodes.values()
+            if not node.depends_on_ids
+        ]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            _, node_id = heapq.heappop(ready)
+            order.append(node_id)
+            for dependent_id in dependents[node_id]:
+                pending[dependent_id] -= 1
+                if not pending[dependent_id]:
+                    dependent = self.nodes[dependent_id]
+                    heapq.heappush(ready, (dependent.order, dependent_id))
+        return order
+
+    def to_dict(self) -> dict:
+        order = self.topological_order()
+        blocked_by = {
+            node.id: self.blocked_by(node.id)
+            for node in self.nodes.values()
+            if not node.is_completed
+        }
+        actionable = [
+            node_id
+            for node_id in order
+            if node_id in blocked_by and not blocked_by[node_id]
+        ]
+        return {
+            "checklist_id": self.checklist_id,
+            "order": order,
+            "actionable": actionable,
+            "blocked": [node_id for node_id in order if blocked_by.get(node_id)],
+            "cyclic": sorted(self.nodes.keys() - set(order)),
+            "items": [
+                {
+                    "id": node.id,
+                    "title": node.title,
+                    "is_completed": node.is_completed,
+                    "is_mandatory": node.is_mandatory,
+                    "depends_on_ids": node.depends_on_ids,
+                    "blocked_by": blocked_by.get(node.id, []),
+                }
+                for node in sorted(
+                    self.nodes.values(), key=lambda node: (node.order, node.id)
+                )
+            ],
+        }
+
+
+def load_graph(db: Session, checklist_id: int) -> ChecklistGraph:
+    rows = db.query(
+        ChecklistItem.id,
+        ChecklistItem.title,
+        ChecklistItem.order,
+        ChecklistItem.is_completed,
+        ChecklistItem.is_mandatory,
+    ).filter(ChecklistItem.checklist_id == checklist_id)
+    nodes = {
+        row.id: GraphNode(
+            row.id, row.title, row.order, row.is_completed, row.is_mandatory
+        )
+        for row in rows
+    }
+    columns = (ChecklistItemDependency.item_id, ChecklistItemDependency.depends_on_id)
+    edges = (
+        db.query(*columns)
+        .join(ChecklistItem, ChecklistItem.id == ChecklistItemDependency.item_id)
+        .filter(ChecklistItem.checklist_id == checklist_id)
+        .order_by(*columns)
+    )
+    for item_id, depends_on_id in edges:
+        nodes[item_id].depends_on_ids.append(depends_on_id)
+    return ChecklistGraph(checklist_id, nodes.values())
+
+
+def lock_checklist(db: Session, checklist_id: int) -> Optional[Checklist]:
+    """Fetch a checklist for update, serialising writes to its graph."""
+    query = db.query(Checklist).filter(Checklist.id == checklist_id)
+    return query.with_for_update().first()
+
+
+def set_dependencies(item: ChecklistItem, depends_on_ids: Iterable[int]) -> None:
+    """Replace the dependencies of an item; the flush writes only the difference."""
+    current = {dependency.depends_on_id: dependency for dependency in item.dependencies}
+    item.dependencies = [
+        current.get(depends_on_id)
+        or ChecklistItemDependency(depends_on_id=depends_on_id)
+        for depends_on_id in sorted(set(depends_on_ids))
+    ]
+
+
+def invalidate_graph(db: Session, checklist_id: int) -> None:
+    checklist_graph_cache.invalidate_on_commit(db, scope=checklist_id)
+
+
+def cached_graph(db: Session, checklist_id: int) -> dict:
+    return checklist_graph_cache.get_or_compute(
+        "graph",
+        {"checklist_id": checklist_id},
+        lambda: load_graph(db, checklist_id).to_dict(),
+        scope=checklist_id,
+    )
@@ -0,0 +1,259 @@
+"""
+Live event fan-out for the analytics stream.
+
+Write paths queue events on their session with ``publish_on_commit`` (or
+``add_deltas_on_commit`` for dashboard counters); nothing is sent unless the
+transaction commits. Two kinds of events exist:
+
+- ``activity``: the same items as ``/analytics/activity``.
+- ``dashboard_delta``: increments to the ``/analytics/dashboard`` overview
+  and status counters, merged into one event per transaction.
+
+Each subscriber gets a bounded queue. A client that falls ``events_queue_size``
+events behind is dropped (it receives a final ``dropped`` event) rather than
+letting its backlog grow; clients should reload the dashboard and reconnect.
+
+With ``EVENTS_BACKEND=postgres`` events travel through Postgres
+LISTEN/NOTIFY so that every worker process sees every write. NOTIFY is
+issued inside the writing transaction, so Postgres itself delivers it only
+on commit.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+from pydantic_settings import BaseSettings
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "ledgerly_events"
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_NOTIFY_PAYLOAD = 7900
+
+
+class EventSettings(BaseSettings):
+    events_backend: str = "memory"
+    events_queue_size: int = 100
+    events_heartbeat_seconds: float = 15.0
+
+    model_config = {"env_file": ".env", "extra": "ignore"}
+
+
+event_settings = EventSettings()
+
+
+def activity_event(
+    kind: str, timestamp: Optional[datetime], data: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Build an ``activity`` event shaped like an /analytics/activity item."""
+    timestamp = timestamp or datetime.utcnow()
+    item = {"type": kind, "timestamp": timestamp.isoformat(), "data": data}
+    return {"type": "activity", "data": item}
+
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_queue: int):
+        self.loop = loop
+        self.queue: "asyncio.Queue[Optional[dict]]" = asyncio.Queue(max_queue)
+        self.dropped = False
+
+
+class EventBroker:
+    """In-process pub/sub: publish() may be called from any thread."""
+
+    def __init__(self, max_queue: int):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscriptions: Set[Subscription] = set()
+
+    def subscribe(self) -> Subscription:
+        """Register a subscriber; must be called from its event loop."""
+        subscription = Subscription(asyncio.get_running_loop(), self.max_queue)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscriptions)
+
+    def publish(self, event: dict) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    self._deliver, subscription, event
+                )
+            except RuntimeError:
+                # Its event loop is closed
+                self.unsubscribe(subscription)
+
+    def _deliver(self, subscription: Subscription, event: dict) -> None:
+        if subscription.dropped:
+            return
+        try:
+            subscription.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow consumer: drop it instead of buffering without bound
+            subscription.dropped = True
+            self.unsubscribe(subscription)
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+            subscription.queue.put_nowait(None)
+
+
+broker = EventBroker(max_queue=event_settings.events_queue_size)
+
+
+def publish_on_commit(db: Session, event: dict) -> None:
+    db.info.setdefault("pending_events", []).append(event)
+
+
+def add_deltas_on_commit(db: Session, section: str, deltas: Dict[str, int]) -> None:
+    """Add dashboard counter deltas, e.g. ``("overview", {"total_comments": 1})``."""
+    pending = db.info.setdefault(
+        "pending_deltas", defaultdict(lambda: defaultdict(int))
+    )
+    for key, delta in deltas.items():
+        pending[section][key] += delta
+
+
+def _take_pending(session: Session) -> list:
+    events = session.info.pop("pending_events", [])
+    deltas = session.info.pop("pending_deltas", None)
+    if deltas:
+        data = {
+            section: {key: delta for key, delta in values.items() if delta}
+            for section, values in deltas.items()
+        }
+        data = {section: values for section, values in data.items() if values}
+        if data:
+            events.append({"type": "dashboard_delta", "data": data})
+    return events
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_before_commit(session: Session) -> None:
+    if event_settings.events_backend != "postgres":
+        return
+    for pending in _take_pending(session):
+        payload = json.dumps(pending, default=str)
+        if len(payload.encode()) > MAX_NOTIFY_PAYLOAD:
+            logger.warning(
+                "Dropping %s event of %d bytes", pending["type"], len(payload)
+            )
+            continue
+        params = {"channel": NOTIFY_CHANNEL, "payload": payload}
+        session.execute(text("SELECT pg_notify(:channel, :payload)"), params)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session: Session) -> None:
+    if event_settings.events_backend == "postgres":
+        return
+    for pending in _take_pending(session):
+        broker.publish(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop("pending_events", None)
+    session.info.pop("pending_deltas", None)
+
+
+class PostgresListener:
+    """Background thread relaying NOTIFY payloads to the local broker."""
+
+    def __init__(self, channel: str, poll_seconds: float = 5.0):
+        self.channel = channel
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="event-listener", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds + 1)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Event listener lost its connection; reconnecting")
+                self._stop.wait(self.poll_seconds)
+
+    def _listen(self) -> None:
+        # A dedicated connection, taken out of the pool for good
+        connection = engine.raw_connection()
+        conn = connection.driver_connection
+        connection.detach()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel}")
+            while not self._stop.is_set():
+                if select.select([conn], [], [], self.poll_seconds) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    try:
+                        broker.publish(json.loads(notification.payload))
+                    except ValueError:
+                        logger.warning("Ignoring malformed event payload")
+        finally:
+            connection.close()
+
+
+event_listener = PostgresListener(NOTIFY_CHANNEL)
+
+
+async def stream_events(subscription: Subscription, is_disconnected, heartbeat: float):
+    """Yield a subscription's events in text/event-stream format."""
+    event_id = 0
+    yield "retry: 3000\n\n"
+    try:
+        while True:
+            try:
+                pending = await asyncio.wait_for(
+                    subscription.queue.get(), timeout=heartbeat
+                )
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+                yield f": keep-alive {int(time.time())}\n\n"
+                continue
+            if pending is None:
+                yield "event: dropped\ndata: {}\n\n"
+                return
+            event_id += 1
+            data = json.dumps(pending["data"], default=str)
+            yield f"id: {event_id}\nevent: {pending['type']}\ndata: {data}\n\n"
+    finally:
+        broker.unsubscribe(subscription)
@@ -1,8 +1,50 @@
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import templates, reports, comments, versions, attachments, analytics, checklists
+from .database import QUERY_COUNT_HEADER, SessionLocal, count_queries, settings
+from .routers import (
+    templates,
+    reports,
+    comments,
+    versions,
+    attachments,
+    analytics,
+    checklists,
+    search,
+)
+from .rendering import render_pool
+from .report_jobs import report_jobs
+from .events import event_listener, event_settings
+from .storage import expire_upload_sessions
+from .pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
+
+logger = logging.getLogger(__name__)
+
 
-app = FastAPI(title="Ledgerly Backend", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    report_jobs.start()
+    try:
+        report_jobs.resume_pending()
+    except Exception:
+        logger.exception("Could not resume pending report jobs")
+    db = SessionLocal()
+    try:
+        expire_upload_sessions(db)
+    except Exception:
+        logger.exception("Could not expire upload sessions")
+    finally:
+        db.close()
+    if event_settings.events_backend == "postgres":
+        event_listener.start()
+    yield
+    event_listener.stop()
+    report_jobs.stop()
+    render_pool.shutdown()
+
+
+app = FastAPI(title="Ledgerly Backend", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -10,8 +52,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # The frontend runs on another origin and pages with these
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER],
 )
 
+if settings.query_count_header:
+    @app.middleware("http")
+    async def add_query_count_header(request: Request, call_next):
+        with count_queries() as counter:
+            response = await call_next(request)
+        response.headers[QUERY_COUNT_HEADER] = str(counter.count)
+        return response
+
 app.include_router(templates.router)
 app.include_router(reports.router)
 app.include_router(comments.router)
@@ -19,6 +71,7 @@ app.include_router(versions.router)
 app.include_router(attachments.router)
 app.include_router(analytics.router)
 app.include_router(checklists.router)
+app.include_router(search.router)
 
 
 @app.get("/health")
@@ -1,5 +1,21 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, ARRAY, Enum as SQLEnum, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column,
+    Integer,
+    BigInteger,
+    String,
+    Text,
+    Date,
+    DateTime,
+    ForeignKey,
+    ARRAY,
+    Enum as SQLEnum,
+    Boolean,
+    Index,
+    Computed,
+    LargeBinary,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 import enum
@@ -7,12 +23,29 @@ import enum
 Base = declarative_base()
 
 
+# Full-text search documents; names weigh more than descriptions, which weigh
+# more than the body
+TEMPLATE_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(content, '')), 'C')"
+)
+COMMENT_SEARCH_VECTOR = "to_tsvector('english', coalesce(content, ''))"
+
+
 class TemplateStatus(str, enum.Enum):
     DRAFT = "draft"
     ACTIVE = "active"
     ARCHIVED = "archived"
 
 
+class ReportStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
 class AuditTemplate(Base):
     __tablename__ = "audit_templates"
 
@@ -25,13 +58,31 @@ class AuditTemplate(Base):
     version = Column(Integer, default=1, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    search_vector = deferred(
+        Column(TSVECTOR, Computed(TEMPLATE_SEARCH_VECTOR, persisted=True))
+    )
 
     reports = relationship("AuditReport", back_populates="template")
     comments = relationship("TemplateComment", back_populates="template", cascade="all, delete-orphan")
-    versions = relationship("TemplateVersion", back_populates="template", cascade="all, delete-orphan")
+    # Deleted by the database (ON DELETE CASCADE) without loading them
+    versions = relationship(
+        "TemplateVersion",
+        back_populates="template",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
     attachments = relationship("Attachment", back_populates="template", cascade="all, delete-orphan")
     checklists = relationship("Checklist", back_populates="template", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_audit_templates_created_at_id", "created_at", "id"),
+        Index("ix_audit_templates_updated_at_id", "updated_at", "id"),
+        Index(
+            "ix_audit_templates_search_vector", "search_vector", postgresql_using="gin"
+        ),
+        Index("ix_audit_templates_tags", "tags", postgresql_using="gin"),
+    )
+
 
 class AuditReport(Base):
     __tablename__ = "audit_reports"
@@ -41,12 +92,21 @@ class AuditReport(Base):
     title = Column(String, nullable=False)
     generated_by = Column(String, nullable=False)
     due_date = Column(DateTime, nullable=True)
+    template_version = Column(Integer, nullable=True)
+    status = Column(
+        String(20), default="done", nullable=False, server_default="done", index=True
+    )
+    file_path = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
 
     template = relationship("AuditTemplate", back_populates="reports")
     attachments = relationship("Attachment", back_populates="report", cascade="all, delete-orphan")
     checklists = relationship("Checklist", back_populates="report", cascade="all, delete-orphan")
 
+    __table_args__ = (Index("ix_audit_reports_created_at_id", "created_at", "id"),)
+
 
 class TemplateComment(Base):
     __tablename__ = "template_comments"
@@ -56,19 +116,45 @@ class TemplateComment(Base):
     author = Column(String, nullable=False)
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    search_vector = deferred(
+        Column(TSVECTOR, Computed(COMMENT_SEARCH_VECTOR, persisted=True))
+    )
 
     template = relationship("AuditTemplate", back_populates="comments")
 
+    __table_args__ = (
+        Index("ix_template_comments_created_at_id", "created_at", "id"),
+        Index(
+            "ix_template_comments_search_vector",
+            "search_vector",
+            postgresql_using="gin",
+        ),
+    )
+
 
 class TemplateVersion(Base):
     __tablename__ = "template_versions"
 
     id = Column(Integer, primary_key=True, index=True)
-    template_id = Column(Integer, ForeignKey("audit_templates.id"), nullable=False)
+    template_id = Column(
+        Integer, ForeignKey("audit_templates.id", ondelete="CASCADE"), nullable=False
+    )
     version = Column(Integer, nullable=False)
     name = Column(String, nullable=False)
     description = Column(Text, nullable=True)
-    content = Column(Text, nullable=False)
+    # NULL for delta-encoded versions, see app/version_store.py
+    content = Column(Text, nullable=True)
+    content_encoding = Column(String(20), nullable=True)
+    # Deferred, so a template's versions can be deleted in any order
+    base_version_id = Column(
+        Integer,
+        ForeignKey("template_versions.id", deferrable=True, initially="DEFERRED"),
+        nullable=True,
+    )
+    content_delta = Column(LargeBinary, nullable=True)
+    # Of the full content: UTF-8 length and SHA-256
+    content_size = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=False)
     tags = Column(ARRAY(String), default=list, nullable=False, server_default='{}')
     status = Column(String(20), nullable=False)
     changed_by = Column(String, nullable=False)
@@ -76,6 +162,11 @@ class TemplateVersion(Base):
 
     template = relationship("AuditTemplate", back_populates="versions")
 
+    __table_args__ = (
+        Index("ix_template_versions_created_at_id", "created_at", "id"),
+        Index("ix_template_versions_template_id_version", "template_id", "version"),
+    )
+
 
 class Attachment(Base):
     __tablename__ = "attachments"
@@ -88,19 +179,100 @@ class Attachment(Base):
     file_path = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
     mime_type = Column(String, nullable=False)
+    content_hash = Column(
+        String(64),
+        ForeignKey("attachment_blobs.content_hash"),
+        nullable=True,
+        index=True,
+    )
+    content_encoding = Column(String(20), nullable=True)
+    stored_size = Column(Integer, nullable=False)
     uploaded_by = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     template = relationship("AuditTemplate", back_populates="attachments")
     report = relationship("AuditReport", back_populates="attachments")
+    blob = relationship("AttachmentBlob")
+
+    __table_args__ = (Index("ix_attachments_created_at_id", "created_at", "id"),)
+
+
+class AttachmentBlob(Base):
+    __tablename__ = "attachment_blobs"
+
+    content_hash = Column(String(64), primary_key=True)
+    file_path = Column(String, nullable=False)
+    file_size = Column(Integer, nullable=False)
+    content_encoding = Column(String(20), nullable=True)
+    stored_size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(36), primary_key=True)
+    template_id = Column(
+        Integer, ForeignKey("audit_templates.id", ondelete="CASCADE"), nullable=True
+    )
+    report_id = Column(
+        Integer, ForeignKey("audit_reports.id", ondelete="CASCADE"), nullable=True
+    )
+    original_filename = Column(String, nullable=False)
+    mime_type = Column(String, nullable=False)
+    total_size = Column(Integer, nullable=True)
+    created_by = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Bumped by every received part; the session expires relative to it
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DailyRollup(Base):
+    __tablename__ = "daily_rollups"
+
+    day = Column(Date, primary_key=True)
+    templates_created = Column(Integer, default=0, nullable=False, server_default="0")
+    reports_generated = Column(Integer, default=0, nullable=False, server_default="0")
+    comments_created = Column(Integer, default=0, nullable=False, server_default="0")
+    attachments_created = Column(Integer, default=0, nullable=False, server_default="0")
+    attachment_bytes = Column(BigInteger, default=0, nullable=False, server_default="0")
+
+
+class TemplateRollup(Base):
+    __tablename__ = "template_rollups"
+
+    template_id = Column(
+        Integer, ForeignKey("audit_templates.id", ondelete="CASCADE"), primary_key=True
+    )
+    comment_count = Column(Integer, default=0, nullable=False, server_default="0")
+    attachment_count = Column(Integer, default=0, nullable=False, server_default="0")
+
+    __table_args__ = (
+        Index("ix_template_rollups_comment_count", comment_count.desc(), template_id),
+        Index(
+            "ix_template_rollups_attachment_count", attachment_count.desc(), template_id
+        ),
+    )
+
+
+class RollupCounter(Base):
+    __tablename__ = "rollup_counters"
+
+    name = Column(String(50), primary_key=True)
+    value = Column(BigInteger, default=0, nullable=False, server_default="0")
 
 
 class Checklist(Base):
     __tablename__ = "checklists"
 
     id = Column(Integer, primary_key=True, index=True)
-    template_id = Column(Integer, ForeignKey("audit_templates.id"), nullable=True)
-    report_id = Column(Integer, ForeignKey("audit_reports.id"), nullable=True)
+    template_id = Column(
+        Integer, ForeignKey("audit_templates.id"), nullable=True, index=True
+    )
+    report_id = Column(
+        Integer, ForeignKey("audit_reports.id"), nullable=True, index=True
+    )
     name = Column(String, nullable=False)
     description = Column(Text, nullable=True)
     created_by = Column(String, nullable=False)
@@ -109,7 +281,12 @@ class Checklist(Base):
 
     template = relationship("AuditTemplate", back_populates="checklists")
     report = relationship("AuditReport", back_populates="checklists")
-    items = relationship("ChecklistItem", back_populates="checklist", cascade="all, delete-orphan")
+    items = relationship(
+        "ChecklistItem",
+        back_populates="checklist",
+        cascade="all, delete-orphan",
+        order_by="[ChecklistItem.order, ChecklistItem.id]",
+    )
 
 
 class ChecklistItem(Base):
@@ -122,11 +299,48 @@ class ChecklistItem(Base):
     is_completed = Column(Boolean, default=False, nullable=False)
     is_mandatory = Column(Boolean, default=False, nullable=False)
     order = Column(Integer, default=0, nullable=False)
-    depends_on_id = Column(Integer, ForeignKey("checklist_items.id"), nullable=True)
     completed_by = Column(String, nullable=True)
     completed_at = Column(DateTime, nullable=True)
     due_date = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     checklist = relationship("Checklist", back_populates="items")
-    depends_on = relationship("ChecklistItem", remote_side=[id], backref="dependent_items")
+    dependencies = relationship(
+        "ChecklistItemDependency",
+        foreign_keys="ChecklistItemDependency.item_id",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="ChecklistItemDependency.depends_on_id",
+    )
+
+    __table_args__ = (
+        Index("ix_checklist_items_checklist_id_order", "checklist_id", "order", "id"),
+        Index(
+            "ix_checklist_items_completed_at_id", "completed_at", "id",
+            postgresql_where=completed_at.isnot(None),
+        ),
+    )
+
+    @property
+    def depends_on_ids(self):
+        return [dependency.depends_on_id for dependency in self.dependencies]
+
+    @property
+    def depends_on_id(self):
+        # The first dependency, for clients from before items had several
+        return self.dependencies[0].depends_on_id if self.dependencies else None
+
+
+class ChecklistItemDependency(Base):
+    __tablename__ = "checklist_item_dependencies"
+
+    item_id = Column(
+        Integer, ForeignKey("checklist_items.id", ondelete="CASCADE"), primary_key=True
+    )
+    depends_on_id = Column(
+        Integer, ForeignKey("checklist_items.id", ondelete="CASCADE"), primary_key=True
+    )
+
+    __table_args__ = (
+        Index("ix_checklist_item_dependencies_depends_on_id", "depends_on_id"),
+    )
@@ -0,0 +1,54 @@
+import base64
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Query, Session
+
+# Names of the response headers carrying the cursor of the next page and the
+# (possibly estimated) total number of matching rows
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+# Above this many rows a requested estimate is not replaced by an exact count
+EXACT_COUNT_THRESHOLD = 10000
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """Encode a keyset position as an opaque, URL-safe cursor."""
+    raw = json.dumps(position, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(position, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+
+def estimate_count(db: Session, query: Query) -> int:
+    """Row count estimated by the planner, without running the query."""
+    compiled = query.statement.compile(dialect=db.bind.dialect)
+    statement = f"EXPLAIN (FORMAT JSON) {compiled}"
+    plan = db.connection().exec_driver_sql(statement, compiled.params).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def total_count(db: Session, query: Query, mode: str) -> Optional[int]:
+    """
+    Count the rows matched by ``query``: ``exact`` always counts, ``estimate``
+    counts only when the planner expects at most EXACT_COUNT_THRESHOLD rows
+    and returns its estimate otherwise. ``none`` skips counting.
+    """
+    if mode == "none":
+        return None
+    if mode == "estimate":
+        estimate = estimate_count(db, query)
+        if estimate > EXACT_COUNT_THRESHOLD:
+            return estimate
+    return query.order_by(None).count()
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from .models import AuditTemplate
+from .rendering import (
+    RENDERER_VERSION,
+    render_pool,
+    render_report_pdf,
+    render_settings,
+    stamp_generated,
+)
+
+
+class RenderCache:
+    """
+    Two-tier cache of rendered report PDFs.
+
+    Entries are keyed on (template id, template version, title, renderer
+    version); the template version is bumped on every edit or restore, so a
+    key always maps to the same document. The in-memory tier is an LRU bounded
+    by total bytes and spills to an on-disk tier that is also LRU-evicted by
+    size. Cached PDFs hold a placeholder for their generation time, which is
+    stamped on every copy handed out (``stamp_generated``).
+    """
+
+    def __init__(self, memory_max_bytes: int, disk_dir: Path, disk_max_bytes: int):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_dir = disk_dir
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+        self._load_disk_index()
+
+    @staticmethod
+    def key(template_id: int, template_version: int, title: str) -> str:
+        raw = json.dumps([template_id, template_version, title, RENDERER_VERSION])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.pdf"
+
+    def _load_disk_index(self) -> None:
+        entries = []
+        for path in self.disk_dir.glob("*.pdf"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return data
+
+        path = self._disk_path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                self._counters["misses"] += 1
+            return None
+        os.utime(path)
+
+        with self._lock:
+            self._counters["disk_hits"] += 1
+            # The file may have been written by another worker process
+            if key not in self._disk:
+                self._disk[key] = len(data)
+                self._disk_bytes += len(data)
+            self._disk.move_to_end(key)
+            self._put_memory(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._disk_path(key)
+        tmp_path = self.disk_dir / f"{key}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._put_memory(key, data)
+            if key in self._disk:
+                self._disk_bytes -= self._disk.pop(key)
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            evicted = []
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self._counters["disk_evictions"] += 1
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            try:
+                self._disk_path(old_key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old)
+            self._counters["memory_evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_max_bytes": self.memory_max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+            }
+
+
+render_cache = RenderCache(
+    memory_max_bytes=render_settings.render_cache_memory_bytes,
+    disk_dir=Path(render_settings.render_cache_dir),
+    disk_max_bytes=render_settings.render_cache_disk_bytes,
+)
+
+
+def render_template_pdf(
+    template: AuditTemplate, title: str, block: bool = False
+) -> bytes:
+    """
+    Return the report PDF for ``template``, stamped with the current time,
+    rendering it on the pool only when it is not cached. Raises
+    RenderPoolBusy / RenderTimeout like the pool.
+    """
+    key = render_cache.key(template.id, template.version, title)
+    pdf_bytes = render_cache.get(key)
+    if pdf_bytes is None:
+        pdf_bytes = render_pool.render(
+            render_report_pdf, template.name, template.description, template.content,
+            title, block=block,
+        )
+        render_cache.put(key, pdf_bytes)
+    return stamp_generated(pdf_bytes)
@@ -0,0 +1,174 @@
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import Optional
+
+from pydantic_settings import BaseSettings
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+
+class RenderSettings(BaseSettings):
+    render_workers: int = 2
+    render_max_queue: int = 8
+    render_timeout_seconds: float = 60.0
+    render_retry_after_seconds: int = 5
+    render_batch_max_items: int = 200
+    report_storage_dir: str = "generated_reports"
+    render_cache_dir: str = "generated_reports/cache"
+    render_cache_memory_bytes: int = 64 * 1024 * 1024
+    render_cache_disk_bytes: int = 1024 * 1024 * 1024
+
+    model_config = {"env_file": ".env", "extra": "ignore"}
+
+
+render_settings = RenderSettings()
+
+# Bump whenever render_report_pdf changes its output so cached PDFs are not reused
+RENDERER_VERSION = 2
+
+# Rendered PDFs carry these in place of their generation time, see stamp_generated
+GENERATED_PLACEHOLDER = "0000-00-00 00:00:00 UTC"
+GENERATED_FORMAT = "%Y-%m-%d %H:%M:%S UTC"
+# The creation and modification dates ReportLab writes with invariant=1
+INVARIANT_PDF_DATE = b"D:20000101000000+00'00'"
+
+
+class RenderPoolBusy(Exception):
+    """Raised when every worker is busy and the queue is full."""
+
+
+class RenderTimeout(Exception):
+    """Raised when a render job does not finish within the configured timeout."""
+
+
+def render_report_pdf(
+    name: str, description: Optional[str], content: str, title: str
+) -> bytes:
+    """
+    Build the report PDF. Runs inside a worker process, so it only takes plain
+    values (no ORM objects) and returns the finished document as bytes.
+
+    The document does not depend on when it is rendered, so it can be cached:
+    its generation time is left as a placeholder for ``stamp_generated``.
+    Pages are not compressed so the placeholder can be found in the bytes.
+    """
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, pageCompression=0, invariant=1)
+    styles = getSampleStyleSheet()
+    story = []
+
+    story.append(Paragraph(f"<b>{title}</b>", styles['Title']))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph(f"Template: {name}", styles['Heading2']))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph(f"Generated: {GENERATED_PLACEHOLDER}", styles['Normal']))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph("<b>Description:</b>", styles['Heading3']))
+    story.append(Paragraph(description or "No description", styles['Normal']))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph("<b>Content:</b>", styles['Heading3']))
+    story.append(Paragraph(content, styles['Normal']))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+def stamp_generated(pdf_bytes: bytes, generated_at: Optional[datetime] = None) -> bytes:
+    """
+    Fill in the generation time (now by default) of a PDF from
+    render_report_pdf. The stamps have the same length as the placeholders,
+    so no offset in the document moves.
+    """
+    generated_at = generated_at or datetime.now(timezone.utc)
+    placeholder = f"(Generated: {GENERATED_PLACEHOLDER})".encode()
+    stamp = f"(Generated: {generated_at.strftime(GENERATED_FORMAT)})".encode()
+    pdf_bytes = pdf_bytes.replace(placeholder, stamp, 1)
+    pdf_date = generated_at.strftime("D:%Y%m%d%H%M%S+00'00'").encode()
+    return pdf_bytes.replace(INVARIANT_PDF_DATE, pdf_date)
+
+
+class RenderPool:
+    """
+    Process pool for PDF rendering.
+
+    ReportLab is pure-Python and CPU bound, so rendering in the request thread
+    holds the GIL and stalls every other endpoint on the worker. Jobs are
+    admitted through a semaphore sized ``workers + max_queue``; once it is
+    exhausted new jobs are rejected with RenderPoolBusy instead of piling up.
+    """
+
+    def __init__(self, workers: int, max_queue: int, timeout: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _release(self, _future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args, block: bool = False) -> Future:
+        """
+        Queue ``fn(*args)`` on the pool. With ``block=False`` raise
+        RenderPoolBusy when no slot is free; otherwise wait for one.
+        """
+        if not self._slots.acquire(blocking=block):
+            raise RenderPoolBusy()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        # The slot is held until the job really finishes, even if the caller
+        # gave up waiting, so a hung render keeps counting against capacity.
+        future.add_done_callback(self._release)
+        return future
+
+    def wait(self, future: Future) -> bytes:
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise RenderTimeout()
+
+    def render(self, fn, *args, block: bool = False) -> bytes:
+        return self.wait(self.submit(fn, *args, block=block))
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": in_flight,
+            "queued": max(in_flight - self.workers, 0),
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+render_pool = RenderPool(
+    workers=render_settings.render_workers,
+    max_queue=render_settings.render_max_queue,
+    timeout=render_settings.render_timeout_seconds,
+)
@@ -0,0 +1,141 @@
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from .database import SessionLocal
+from .models import AuditReport, ReportStatus
+from .render_cache import render_template_pdf
+from .rendering import RenderTimeout, render_settings
+
+logger = logging.getLogger(__name__)
+
+# Rendered reports are kept next to uploads/ so they can be downloaded again
+REPORT_DIR = Path(render_settings.report_storage_dir)
+REPORT_DIR.mkdir(exist_ok=True)
+
+
+def store_report_pdf(report_id: int, pdf_bytes: bytes) -> str:
+    """Write a rendered report atomically and return its path."""
+    path = REPORT_DIR / f"report_{report_id}.pdf"
+    tmp_path = REPORT_DIR / f"report_{report_id}.pdf.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, path)
+    return str(path)
+
+
+def run_report_job(report_id: int) -> None:
+    """Render a queued report and record the outcome on its row."""
+    db = SessionLocal()
+    try:
+        # Claim the job atomically so a report is never rendered twice
+        claimed = (
+            db.query(AuditReport)
+            .filter(
+                AuditReport.id == report_id,
+                AuditReport.status == ReportStatus.QUEUED.value,
+            )
+            .update({"status": ReportStatus.RUNNING.value}, synchronize_session=False)
+        )
+        db.commit()
+        if not claimed:
+            return
+
+        report = db.query(AuditReport).filter(AuditReport.id == report_id).first()
+        template = report.template
+        report.template_version = template.version
+        try:
+            pdf_bytes = render_template_pdf(template, report.title, block=True)
+            report.file_path = store_report_pdf(report.id, pdf_bytes)
+            report.status = ReportStatus.DONE.value
+        except RenderTimeout:
+            report.status = ReportStatus.FAILED.value
+            report.error = "Report rendering timed out"
+        except Exception as e:
+            logger.exception("Report job %s failed", report_id)
+            report.status = ReportStatus.FAILED.value
+            report.error = str(e)
+        report.completed_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+class ReportJobQueue:
+    """
+    In-process queue of report ids waiting to be rendered.
+
+    One dispatcher thread per render worker keeps the pool busy while leaving
+    its queue slots free for interactive ``/generate`` requests.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._queue: "queue.Queue[Optional[int]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._run, name=f"report-job-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self) -> None:
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+
+    def enqueue(self, report_id: int) -> None:
+        self.start()
+        self._queue.put(report_id)
+
+    def resume_pending(self) -> None:
+        """
+        Re-enqueue reports left queued by a previous process. Reports it left
+        running (claimed jobs and batch renders) died with it, as the app runs
+        a single process, so they are queued again first.
+        """
+        db = SessionLocal()
+        try:
+            (
+                db.query(AuditReport)
+                .filter(AuditReport.status == ReportStatus.RUNNING.value)
+                .update(
+                    {"status": ReportStatus.QUEUED.value}, synchronize_session=False
+                )
+            )
+            db.commit()
+            pending = (
+                db.query(AuditReport.id)
+                .filter(AuditReport.status == ReportStatus.QUEUED.value)
+                .order_by(AuditReport.id)
+                .all()
+            )
+        finally:
+            db.close()
+        for (report_id,) in pending:
+            self.enqueue(report_id)
+
+    def _run(self) -> None:
+        while True:
+            report_id = self._queue.get()
+            if report_id is None:
+                return
+            try:
+                run_report_job(report_id)
+            except Exception:
+                logger.exception("Report job %s crashed", report_id)
+
+
+report_jobs = ReportJobQueue(workers=render_settings.render_workers)
@@ -0,0 +1,334 @@
+"""
+Incrementally maintained analytics counters.
+
+Writers call the helpers below in the same transaction as the rows they
+create or delete, so the rollups never drift from the base tables:
+
+- ``daily_rollups``: per-day net counts of templates, reports, comments and
+  attachments (plus attachment bytes), keyed by the day the row was created.
+  Deleting a row decrements the day it was created on.
+- ``template_rollups``: comment and attachment count per template.
+- ``rollup_counters``: scalar totals, i.e. templates per status and the
+  physical bytes held by the attachment store.
+
+Increments are single ``INSERT ... ON CONFLICT DO UPDATE`` statements, so
+concurrent writers never lose updates. Every change also invalidates the
+analytics response cache and is pushed to the live analytics stream (see
+app/events.py) once the transaction commits. If the rollups are ever out of sync
+(e.g. after manual SQL), rebuild them from the base tables with::
+
+    python -m app.rollups rebuild
+"""
+import argparse
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import delete, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import events
+from .cache import analytics_cache
+from .database import SessionLocal
+from .models import (
+    Attachment,
+    AuditReport,
+    AuditTemplate,
+    DailyRollup,
+    RollupCounter,
+    TemplateComment,
+    TemplateRollup,
+)
+
+STORAGE_BYTES = "storage_bytes"
+
+# Rows missing a creation time are filed under the epoch, here and in rebuild()
+_EPOCH = date(1970, 1, 1)
+
+# How rollup changes show up in the dashboard response
+DASHBOARD_TOTALS = {
+    "templates_created": "total_templates",
+    "reports_generated": "total_reports",
+    "comments_created": "total_comments",
+    "attachments_created": "total_attachments",
+    "attachment_bytes": "total_storage_bytes",
+}
+DASHBOARD_RECENT = {
+    "templates_created": "recent_templates_30d",
+    "reports_generated": "recent_reports_30d",
+}
+
+REBUILD_STATEMENTS = [
+    text("""
+        INSERT INTO daily_rollups
+            (day, templates_created, reports_generated, comments_created,
+             attachments_created, attachment_bytes)
+        SELECT day, sum(templates), sum(reports), sum(comments),
+               sum(attachments), sum(bytes)
+        FROM (
+            SELECT coalesce(CAST(created_at AS date), DATE '1970-01-01') AS day,
+                   count(*) AS templates, 0 AS reports, 0 AS comments,
+                   0 AS attachments, 0 AS bytes
+            FROM audit_templates GROUP BY 1
+            UNION ALL
+            SELECT coalesce(CAST(created_at AS date), DATE '1970-01-01'),
+                   0, count(*), 0, 0, 0
+            FROM audit_reports GROUP BY 1
+            UNION ALL
+            SELECT coalesce(CAST(created_at AS date), DATE '1970-01-01'),
+                   0, 0, count(*), 0, 0
+            FROM template_comments GROUP BY 1
+            UNION ALL
+            SELECT coalesce(CAST(created_at AS date), DATE '1970-01-01'),
+                   0, 0, 0, count(*), sum(file_size)
+            FROM attachments GROUP BY 1
+        ) AS counts
+        GROUP BY day
+    """),
+    text("""
+        INSERT INTO template_rollups (template_id, comment_count, attachment_count)
+        SELECT audit_templates.id, coalesce(comments.n, 0), coalesce(attachments.n, 0)
+        FROM audit_templates
+        LEFT JOIN (
+            SELECT template_id, count(*) AS n
+            FROM template_comments GROUP BY template_id
+        ) AS comments ON comments.template_id = audit_templates.id
+        LEFT JOIN (
+            SELECT template_id, count(*) AS n
+            FROM attachments WHERE template_id IS NOT NULL
+            GROUP BY template_id
+        ) AS attachments ON attachments.template_id = audit_templates.id
+    """),
+    text("""
+        INSERT INTO rollup_counters (name, value)
+        SELECT 'templates_' || status, count(*) FROM audit_templates GROUP BY status
+        UNION ALL
+        SELECT 'storage_bytes',
+               (SELECT coalesce(sum(stored_size), 0) FROM attachment_blobs)
+               + (SELECT coalesce(sum(stored_size), 0) FROM attachments
+                  WHERE content_hash IS NULL)
+    """),
+]
+
+
+def _day(created_at: Optional[datetime]) -> date:
+    return created_at.date() if created_at else _EPOCH
+
+
+def _status_counter(status) -> str:
+    return f"templates_{getattr(status, 'value', status)}"
+
+
+def add_daily(db: Session, deltas_by_day: Dict[date, Dict[str, int]]) -> None:
+    """Add per-day deltas, e.g. ``{day: {"comments_created": 1}}``."""
+    analytics_cache.invalidate_on_commit(db)
+    recent_since = (datetime.utcnow() - timedelta(days=30)).date()
+    for day, deltas in deltas_by_day.items():
+        deltas = {column: delta for column, delta in deltas.items() if delta}
+        if not deltas:
+            continue
+        totals = {DASHBOARD_TOTALS[column]: delta for column, delta in deltas.items()}
+        events.add_deltas_on_commit(db, "overview", totals)
+        if day >= recent_since:
+            recent = {
+                DASHBOARD_RECENT[column]: delta
+                for column, delta in deltas.items()
+                if column in DASHBOARD_RECENT
+            }
+            events.add_deltas_on_commit(db, "overview", recent)
+        table = DailyRollup.__table__
+        db.execute(
+            insert(DailyRollup)
+            .values(day=day, **deltas)
+            .on_conflict_do_update(
+                index_elements=[DailyRollup.day],
+                set_={
+                    column: table.c[column] + delta for column, delta in deltas.items()
+                },
+            )
+        )
+
+
+def add_template_counts(
+    db: Session, template_id: int, comments: int = 0, attachments: int = 0
+) -> None:
+    if not comments and not attachments:
+        return
+    analytics_cache.invalidate_on_commit(db)
+    db.execute(
+        insert(TemplateRollup)
+        .values(
+            template_id=template_id,
+            comment_count=comments,
+            attachment_count=attachments,
+        )
+        .on_conflict_do_update(
+            index_elements=[TemplateRollup.template_id],
+            set_={
+                "comment_count": TemplateRollup.comment_count + comments,
+                "attachment_count": TemplateRollup.attachment_count + attachments,
+            },
+        )
+    )
+
+
+def add_counter(db: Session, name: str, delta: int) -> None:
+    if not delta:
+        return
+    analytics_cache.invalidate_on_commit(db)
+    if name == STORAGE_BYTES:
+        events.add_deltas_on_commit(db, "overview", {"physical_storage_bytes": delta})
+    elif name.startswith("templates_"):
+        status = name.removeprefix("templates_")
+        events.add_deltas_on_commit(db, "templates_by_status", {status: delta})
+    db.execute(
+        insert(RollupCounter)
+        .values(name=name, value=delta)
+        .on_conflict_do_update(
+            index_elements=[RollupCounter.name],
+            set_={"value": RollupCounter.value + delta},
+        )
+    )
+
+
+def template_created(db: Session, template: AuditTemplate) -> None:
+    """Count a new template. Call after it has been flushed."""
+    add_daily(db, {_day(template.created_at): {"templates_created": 1}})
+    db.execute(insert(TemplateRollup).values(template_id=template.id).on_conflict_do_nothing())
+    add_counter(db, _status_counter(template.status), 1)
+    event = events.activity_event("template_created", template.created_at, {
+        "id": template.id,
+        "name": template.name,
+        "status": getattr(template.status, "value", template.status),
+    })
+    events.publish_on_commit(db, event)
+
+
+def template_status_changed(db: Session, old_status, new_status) -> None:
+    """
+    Recount a template's status. Call on every edit, even when the status is
+    unchanged, since the analytics responses also show template names.
+    """
+    analytics_cache.invalidate_on_commit(db)
+    if _status_counter(old_status) == _status_counter(new_status):
+        return
+    add_counter(db, _status_counter(old_status), -1)
+    add_counter(db, _status_counter(new_status), 1)
+
+
+def template_deleted(db: Session, template: AuditTemplate) -> None:
+    """
+    Uncount a template and the comments and attachments deleted with it.
+    Call before deleting it; its template_rollups row goes with the template.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    deltas[_day(template.created_at)]["templates_created"] -= 1
+    comment_days = (
+        db.query(func.date(TemplateComment.created_at), func.count(TemplateComment.id))
+        .filter(TemplateComment.template_id == template.id)
+        .group_by(func.date(TemplateComment.created_at))
+        .all()
+    )
+    for day, count in comment_days:
+        deltas[day or _EPOCH]["comments_created"] -= count
+    attachment_days = (
+        db.query(
+            func.date(Attachment.created_at),
+            func.count(Attachment.id),
+            func.sum(Attachment.file_size),
+        )
+        .filter(Attachment.template_id == template.id)
+        .group_by(func.date(Attachment.created_at))
+        .all()
+    )
+    for day, count, size in attachment_days:
+        deltas[day or _EPOCH]["attachments_created"] -= count
+        deltas[day or _EPOCH]["attachment_bytes"] -= size
+    add_daily(db, deltas)
+    add_counter(db, _status_counter(template.status), -1)
+
+
+def reports_created(db: Session, reports: Iterable[AuditReport]) -> None:
+    """Count new reports. Call after they have been flushed."""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for report in reports:
+        deltas[_day(report.created_at)]["reports_generated"] += 1
+        event = events.activity_event("report_generated", report.created_at, {
+            "id": report.id,
+            "template_id": report.template_id,
+            "title": report.title,
+            "generated_by": report.generated_by,
+        })
+        events.publish_on_commit(db, event)
+    add_daily(db, deltas)
+
+
+def comment_created(db: Session, comment: TemplateComment) -> None:
+    add_daily(db, {_day(comment.created_at): {"comments_created": 1}})
+    add_template_counts(db, comment.template_id, comments=1)
+    event = events.activity_event("comment_added", comment.created_at, {
+        "id": comment.id,
+        "template_id": comment.template_id,
+        "author": comment.author,
+    })
+    events.publish_on_commit(db, event)
+
+
+def comment_deleted(db: Session, comment: TemplateComment) -> None:
+    add_daily(db, {_day(comment.created_at): {"comments_created": -1}})
+    add_template_counts(db, comment.template_id, comments=-1)
+
+
+def attachment_created(db: Session, attachment: Attachment) -> None:
+    deltas = {"attachments_created": 1, "attachment_bytes": attachment.file_size}
+    add_daily(db, {_day(attachment.created_at): deltas})
+    if attachment.template_id is not None:
+        add_template_counts(db, attachment.template_id, attachments=1)
+    event = events.activity_event("attachment_uploaded", attachment.created_at, {
+        "id": attachment.id,
+        "template_id": attachment.template_id,
+        "report_id": attachment.report_id,
+        "filename": attachment.original_filename,
+        "uploaded_by": attachment.uploaded_by,
+    })
+    events.publish_on_commit(db, event)
+
+
+def attachment_deleted(db: Session, attachment: Attachment) -> None:
+    deltas = {"attachments_created": -1, "attachment_bytes": -attachment.file_size}
+    add_daily(db, {_day(attachment.created_at): deltas})
+    if attachment.template_id is not None:
+        add_template_counts(db, attachment.template_id, attachments=-1)
+
+
+def rebuild(db: Session) -> None:
+    """
+    Recompute every rollup from the base tables. Writers are blocked until the
+    transaction commits, so no increment is lost or counted twice.
+    """
+    tables = "daily_rollups, template_rollups, rollup_counters"
+    db.execute(text(f"LOCK TABLE {tables} IN EXCLUSIVE MODE"))
+    for model in (DailyRollup, TemplateRollup, RollupCounter):
+        db.execute(delete(model))
+    for statement in REBUILD_STATEMENTS:
+        db.execute(statement)
+    analytics_cache.invalidate_on_commit(db)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the analytics rollup tables")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+    print("Analytics rollups rebuilt")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,163 +1,189 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
+from sqlalchemy import func, literal, select, text, tuple_, union_all
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 
 from ..database import get_db
-from ..models import AuditTemplate, AuditReport, TemplateComment, Attachment
+from ..models import (
+    Attachment,
+    AuditTemplate,
+    AuditReport,
+    ChecklistItem,
+    TemplateComment,
+    TemplateVersion,
+)
 from ..auth import get_current_user
+from ..cache import analytics_cache
+from ..events import broker, event_settings, stream_events
+from ..pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
 
+DASHBOARD_QUERY = text("""
+WITH daily_totals AS (
+    SELECT
+        coalesce(sum(templates_created), 0) AS total_templates,
+        coalesce(sum(templates_created) FILTER (WHERE day >= :recent_since), 0)
+            AS recent_templates,
+        coalesce(sum(reports_generated), 0) AS total_reports,
+        coalesce(sum(reports_generated) FILTER (WHERE day >= :recent_since), 0)
+            AS recent_reports,
+        coalesce(sum(comments_created), 0) AS total_comments,
+        coalesce(sum(attachments_created), 0) AS total_attachments,
+        CAST(coalesce(sum(attachment_bytes), 0) AS bigint) AS logical_bytes
+    FROM daily_rollups
+),
+counters AS (
+    SELECT
+        CAST(
+            coalesce(sum(value) FILTER (WHERE name = 'templates_draft'), 0)
+            AS bigint
+        ) AS draft,
+        CAST(
+            coalesce(sum(value) FILTER (WHERE name = 'templates_active'), 0)
+            AS bigint
+        ) AS active,
+        CAST(
+            coalesce(sum(value) FILTER (WHERE name = 'templates_archived'), 0)
+            AS bigint
+        ) AS archived,
+        CAST(
+            coalesce(sum(value) FILTER (WHERE name = 'storage_bytes'), 0)
+            AS bigint
+        ) AS physical_bytes
+    FROM rollup_counters
+),
+months AS (
+    SELECT generate_series(
+        CAST(:trend_since AS timestamp),
+        date_trunc('month', CAST(:now AS timestamp)),
+        interval '1 month'
+    ) AS month
+),
+per_month AS (
+    SELECT
+        date_trunc('month', CAST(day AS timestamp)) AS month,
+        sum(templates_created) AS templates,
+        sum(reports_generated) AS reports
+    FROM daily_rollups
+    WHERE day >= :trend_since
+    GROUP BY 1
+),
+trend AS (
+    SELECT json_agg(
+        json_build_array(
+            extract(year FROM months.month)::int,
+            extract(month FROM months.month)::int,
+            coalesce(per_month.templates, 0),
+            coalesce(per_month.reports, 0)
+        ) ORDER BY months.month
+    ) AS months
+    FROM months
+    LEFT JOIN per_month ON per_month.month = months.month
+),
+most_commented AS (
+    SELECT json_agg(
+        json_build_array(audit_templates.id, audit_templates.name, top.n)
+        ORDER BY top.n DESC, top.template_id
+    ) AS templates
+    FROM (
+        SELECT template_id, comment_count AS n
+        FROM template_rollups
+        ORDER BY comment_count DESC, template_id
+        LIMIT 5
+    ) AS top
+    JOIN audit_templates ON audit_templates.id = top.template_id
+),
+most_attachments AS (
+    SELECT json_agg(
+        json_build_array(audit_templates.id, audit_templates.name, top.n)
+        ORDER BY top.n DESC, top.template_id
+    ) AS templates
+    FROM (
+        SELECT template_id, attachment_count AS n
+        FROM template_rollups
+        ORDER BY attachment_count DESC, template_id
+        LIMIT 5
+    ) AS top
+    JOIN audit_templates ON audit_templates.id = top.template_id
+)
+SELECT
+    daily_totals.*,
+    counters.*,
+    trend.months AS trend,
+    most_commented.templates AS most_commented,
+    most_attachments.templates AS most_attachments
+FROM daily_totals, counters, trend, most_commented, most_attachments
+""")
+
+
 @router.get("/dashboard")
 def get_dashboard_stats(
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ) -> Dict[str, Any]:
     """Get comprehensive dashboard statistics"""
-
-    # Basic counts
-    total_templates = db.query(func.count(AuditTemplate.id)).scalar()
-    total_reports = db.query(func.count(AuditReport.id)).scalar()
-    total_comments = db.query(func.count(TemplateComment.id)).scalar()
-    total_attachments = db.query(func.count(Attachment.id)).scalar()
-
-    # Templates by status
-    templates_by_status = (
-        db.query(AuditTemplate.status, func.count(AuditTemplate.id))
-        .group_by(AuditTemplate.status)
-        .all()
-    )
-    status_counts = {status: count for status, count in templates_by_status}
-
-    # Recent templates (last 30 days)
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    recent_templates = (
-        db.query(func.count(AuditTemplate.id))
-        .filter(AuditTemplate.created_at >= thirty_days_ago)
-        .scalar()
-    )
-
-    # Recent reports (last 30 days)
-    recent_reports = (
-        db.query(func.count(AuditReport.id))
-        .filter(AuditReport.created_at >= thirty_days_ago)
-        .scalar()
+    return analytics_cache.get_or_compute(
+        "dashboard", {}, lambda: compute_dashboard_stats(db)
     )
 
-    # Templates created per month (last 12 months)
-    twelve_months_ago = datetime.utcnow() - timedelta(days=365)
-    templates_per_month = (
-        db.query(
-            extract("year", AuditTemplate.created_at).label("year"),
-            extract("month", AuditTemplate.created_at).label("month"),
-            func.count(AuditTemplate.id).label("count")
-        )
-        .filter(AuditTemplate.created_at >= twelve_months_ago)
-        .group_by("year", "month")
-        .order_by("year", "month")
-        .all()
-    )
-
-    monthly_data = [
-        {
-            "year": int(year),
-            "month": int(month),
-            "count": count,
-            "label": f"{int(year)}-{int(month):02d}"
-        }
-        for year, month, count in templates_per_month
-    ]
 
-    # Reports created per month (last 12 months)
-    reports_per_month = (
-        db.query(
-            extract("year", AuditReport.created_at).label("year"),
-            extract("month", AuditReport.created_at).label("month"),
-            func.count(AuditReport.id).label("count")
-        )
-        .filter(AuditReport.created_at >= twelve_months_ago)
-        .group_by("year", "month")
-        .order_by("year", "month")
-        .all()
-    )
-
-    reports_monthly_data = [
-        {
-            "year": int(year),
-            "month": int(month),
-            "count": count,
-            "label": f"{int(year)}-{int(month):02d}"
-        }
-        for year, month, count in reports_per_month
-    ]
+def compute_dashboard_stats(db: Session) -> Dict[str, Any]:
+    # Everything is read from the rollup tables (see app/rollups.py) in a
+    # single round trip, so the cost grows with the number of days rather
+    # than rows. "Recent" counts whole days. The trend covers the last 12
+    # calendar months, with empty months filled in with zeros.
+    now = datetime.utcnow()
+    first_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(11):
+        first_month = (first_month - timedelta(days=1)).replace(day=1)
+    params = {
+        "now": now,
+        "recent_since": (now - timedelta(days=30)).date(),
+        "trend_since": first_month,
+    }
+    row = db.execute(DASHBOARD_QUERY, params).mappings().one()
 
-    # Most commented templates
-    most_commented = (
-        db.query(
-            AuditTemplate.id,
-            AuditTemplate.name,
-            func.count(TemplateComment.id).label("comment_count")
-        )
-        .outerjoin(TemplateComment)
-        .group_by(AuditTemplate.id, AuditTemplate.name)
-        .order_by(func.count(TemplateComment.id).desc())
-        .limit(5)
-        .all()
-    )
+    monthly_data = []
+    reports_monthly_data = []
+    for year, month, templates_count, reports_count in row["trend"] or []:
+        label = f"{year}-{month:02d}"
+        point = {"year": year, "month": month, "label": label}
+        monthly_data.append({**point, "count": templates_count})
+        reports_monthly_data.append({**point, "count": reports_count})
 
     top_commented = [
-        {
-            "id": template_id,
-            "name": name,
-            "comments": count
-        }
-        for template_id, name, count in most_commented
+        {"id": template_id, "name": name, "comments": count}
+        for template_id, name, count in row["most_commented"] or []
     ]
-
-    # Templates with most attachments
-    most_attachments = (
-        db.query(
-            AuditTemplate.id,
-            AuditTemplate.name,
-            func.count(Attachment.id).label("attachment_count")
-        )
-        .outerjoin(Attachment, AuditTemplate.id == Attachment.template_id)
-        .group_by(AuditTemplate.id, AuditTemplate.name)
-        .order_by(func.count(Attachment.id).desc())
-        .limit(5)
-        .all()
-    )
-
     top_attachments = [
-        {
-            "id": template_id,
-            "name": name,
-            "attachments": count
-        }
-        for template_id, name, count in most_attachments
+        {"id": template_id, "name": name, "attachments": count}
+        for template_id, name, count in row["most_attachments"] or []
     ]
 
-    # Storage usage
-    total_storage = db.query(func.sum(Attachment.file_size)).scalar() or 0
+    total_storage = row["logical_bytes"]
+    physical_storage = row["physical_bytes"]
 
     return {
         "overview": {
-            "total_templates": total_templates,
-            "total_reports": total_reports,
-            "total_comments": total_comments,
-            "total_attachments": total_attachments,
-            "recent_templates_30d": recent_templates,
-            "recent_reports_30d": recent_reports,
+            "total_templates": row["total_templates"],
+            "total_reports": row["total_reports"],
+            "total_comments": row["total_comments"],
+            "total_attachments": row["total_attachments"],
+            "recent_templates_30d": row["recent_templates"],
+            "recent_reports_30d": row["recent_reports"],
             "total_storage_bytes": total_storage,
             "total_storage_mb": round(total_storage / (1024 * 1024), 2),
+            "physical_storage_bytes": physical_storage,
+            "physical_storage_mb": round(physical_storage / (1024 * 1024), 2),
         },
         "templates_by_status": {
-            "draft": status_counts.get("draft", 0),
-            "active": status_counts.get("active", 0),
-            "archived": status_counts.get("archived", 0),
+            "draft": row["draft"],
+            "active": row["active"],
+            "archived": row["archived"],
         },
         "trends": {
             "templates_per_month": monthly_data,
@@ -170,54 +196,151 @@ def get_dashboard_stats(
     }
 
 
+# Sources of the activity feed: (type, model, timestamp column, data fields).
+# The position in this list breaks ties between events with equal timestamps.
+ACTIVITY_SOURCES = [
+    ("template_created", AuditTemplate, AuditTemplate.created_at, {
+        "id": AuditTemplate.id,
+        "name": AuditTemplate.name,
+        "status": AuditTemplate.status,
+    }),
+    ("report_generated", AuditReport, AuditReport.created_at, {
+        "id": AuditReport.id,
+        "template_id": AuditReport.template_id,
+        "title": AuditReport.title,
+        "generated_by": AuditReport.generated_by,
+    }),
+    ("comment_added", TemplateComment, TemplateComment.created_at, {
+        "id": TemplateComment.id,
+        "template_id": TemplateComment.template_id,
+        "author": TemplateComment.author,
+    }),
+    ("attachment_uploaded", Attachment, Attachment.created_at, {
+        "id": Attachment.id,
+        "template_id": Attachment.template_id,
+        "report_id": Attachment.report_id,
+        "filename": Attachment.original_filename,
+        "uploaded_by": Attachment.uploaded_by,
+    }),
+    ("template_updated", TemplateVersion, TemplateVersion.created_at, {
+        "template_id": TemplateVersion.template_id,
+        "previous_version": TemplateVersion.version,
+        "name": TemplateVersion.name,
+        "changed_by": TemplateVersion.changed_by,
+    }),
+    ("checklist_item_completed", ChecklistItem, ChecklistItem.completed_at, {
+        "id": ChecklistItem.id,
+        "checklist_id": ChecklistItem.checklist_id,
+        "title": ChecklistItem.title,
+        "completed_by": ChecklistItem.completed_by,
+    }),
+]
+
+
 @router.get("/activity")
 def get_recent_activity(
-    limit: int = 20,
+    response: Response,
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ) -> List[Dict[str, Any]]:
-    """Get recent activity feed"""
+    """
+    Get recent activity feed, newest first; the next page's cursor is in the
+    X-Next-Cursor header.
+    """
+    if cursor is None:
+        # Only the first page is polled, so deeper pages bypass the cache
+        page = analytics_cache.get_or_compute(
+            "activity", {"limit": limit}, lambda: compute_recent_activity(db, limit)
+        )
+    else:
+        page = compute_recent_activity(db, limit, cursor)
+    if page["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
+    return page["items"]
 
-    activities = []
 
-    # Recent templates
-    recent_templates = (
-        db.query(AuditTemplate)
-        .order_by(AuditTemplate.created_at.desc())
-        .limit(limit // 2)
-        .all()
-    )
+def compute_recent_activity(
+    db: Session, limit: int, cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Merge all activity sources in one UNION ALL query ordered by (timestamp,
+    source, id) descending. Each branch applies the keyset condition and
+    limit itself, so every page reads at most ``limit + 1`` index entries per
+    source however deep it is.
+    """
+    position = None
+    if cursor is not None:
+        position = decode_cursor(cursor)
+        try:
+            position = (
+                datetime.fromisoformat(position["ts"]),
+                int(position["source"]),
+                int(position["id"]),
+            )
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    for template in recent_templates:
-        activities.append({
-            "type": "template_created",
-            "timestamp": template.created_at.isoformat(),
-            "data": {
-                "id": template.id,
-                "name": template.name,
-                "status": template.status,
-            }
-        })
-
-    # Recent reports
-    recent_reports = (
-        db.query(AuditReport)
-        .order_by(AuditReport.created_at.desc())
-        .limit(limit // 2)
-        .all()
-    )
+    branches = []
+    for source, (kind, model, timestamp, fields) in enumerate(ACTIVITY_SOURCES):
+        pairs = [arg for name, column in fields.items() for arg in (name, column)]
+        branch = select(
+            literal(source).label("source"),
+            timestamp.label("ts"),
+            model.id.label("id"),
+            func.json_build_object(*pairs).label("data"),
+        ).where(timestamp.isnot(None))
+        if position is not None:
+            after_ts, after_source, after_id = position
+            if source < after_source:
+                branch = branch.where(timestamp <= after_ts)
+            elif source == after_source:
+                branch = branch.where(
+                    tuple_(timestamp, model.id) < tuple_(after_ts, after_id)
+                )
+            else:
+                branch = branch.where(timestamp < after_ts)
+        branch = branch.order_by(timestamp.desc(), model.id.desc())
+        branches.append(branch.limit(limit + 1))
+
+    feed = union_all(*branches).subquery()
+    order = (feed.c.ts.desc(), feed.c.source.desc(), feed.c.id.desc())
+    rows = db.execute(select(feed).order_by(*order).limit(limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            {"ts": last.ts.isoformat(), "source": last.source, "id": last.id}
+        )
 
-    for report in recent_reports:
-        activities.append({
-            "type": "report_generated",
-            "timestamp": report.created_at.isoformat(),
-            "data": {
-                "id": report.id,
-                "title": report.title,
-                "generated_by": report.generated_by,
-            }
-        })
-
-    # Sort by timestamp and limit
-    activities.sort(key=lambda x: x["timestamp"], reverse=True)
-    return activities[:limit]
+    items = [
+        {
+            "type": ACTIVITY_SOURCES[row.source][0],
+            "timestamp": row.ts.isoformat(),
+            "data": row.data,
+        }
+        for row in rows
+    ]
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.get("/stream")
+async def stream_analytics(
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Server-Sent Events stream of ``activity`` items and ``dashboard_delta``
+    counter increments as they are committed. On a ``dropped`` event (the
+    client fell too far behind) reload the dashboard and reconnect.
+    """
+    subscription = broker.subscribe()
+    heartbeat = event_settings.events_heartbeat_seconds
+    return StreamingResponse(
+        stream_events(subscription, request.is_disconnected, heartbeat),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,27 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    status,
+    UploadFile,
+    File,
+    Header,
+    Request,
+)
 from sqlalchemy.orm import Session
-from typing import List
-import os
+from typing import List, Optional
+from datetime import datetime
 import uuid
-from pathlib import Path
 
 from ..database import get_db
-from ..models import Attachment, AuditTemplate, AuditReport
-from ..schemas import AttachmentResponse
+from ..models import Attachment, AuditTemplate, AuditReport, UploadSession
+from ..schemas import (
+    AttachmentResponse,
+    UploadSessionCreate,
+    UploadSessionResponse,
+    UploadPartResponse,
+)
 from ..auth import get_current_user
+from .. import rollups
+from ..storage import (
+    attachment_file_response,
+    delete_attachment,
+    discard_upload_parts,
+    list_upload_parts,
+    save_upload,
+    save_upload_part,
+    store_upload_parts,
+    upload_session_cutoff,
+)
 
 router = APIRouter(tags=["attachments"])
 
-# Create uploads directory if it doesn't exist
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+MAX_UPLOAD_PARTS = 10000
 
 
 @router.post("/audit/templates/{template_id}/attachments", response_model=AttachmentResponse, status_code=status.HTTP_201_CREATED)
 async def upload_template_attachment(
     template_id: int,
     file: UploadFile = File(...),
+    content_sha256: Optional[str] = Header(None, alias="X-Content-SHA256"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
@@ -30,30 +52,25 @@ async def upload_template_attachment(
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
 
-    # Generate unique filename
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
-
-    # Save file
-    try:
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    # Stream file into the blob store
+    stored = await save_upload(db, file, content_sha256)
 
     # Create attachment record
     attachment = Attachment(
         template_id=template_id,
-        filename=unique_filename,
+        filename=stored.filename,
         original_filename=file.filename,
-        file_path=str(file_path),
-        file_size=len(contents),
+        file_path=str(stored.path),
+        file_size=stored.size,
         mime_type=file.content_type or "application/octet-stream",
+        content_hash=stored.content_hash,
+        content_encoding=stored.content_encoding,
+        stored_size=stored.stored_size,
         uploaded_by=current_user.get("preferred_username", current_user.get("email", "Unknown")),
     )
     db.add(attachment)
+    db.flush()
+    rollups.attachment_created(db, attachment)
     db.commit()
     db.refresh(attachment)
     return attachment
@@ -83,6 +100,7 @@ def list_template_attachments(
 async def download_template_attachment(
     template_id: int,
     attachment_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
@@ -98,14 +116,7 @@ async def download_template_attachment(
     if not attachment:
         raise HTTPException(status_code=404, detail="Attachment not found")
 
-    if not os.path.exists(attachment.file_path):
-        raise HTTPException(status_code=404, detail="File not found on disk")
-
-    return FileResponse(
-        path=attachment.file_path,
-        filename=attachment.original_filename,
-        media_type=attachment.mime_type,
-    )
+    return attachment_file_response(request, attachment)
 
 
 @router.delete("/audit/templates/{template_id}/attachments/{attachment_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -127,14 +138,7 @@ def delete_template_attachment(
     if not attachment:
         raise HTTPException(status_code=404, detail="Attachment not found")
 
-    # Delete file from disk
-    try:
-        if os.path.exists(attachment.file_path):
-            os.remove(attachment.file_path)
-    except Exception as e:
-        print(f"Warning: Failed to delete file from disk: {str(e)}")
-
-    db.delete(attachment)
+    delete_attachment(db, attachment)
     db.commit()
     return None
 
@@ -143,6 +147,7 @@ def delete_template_attachment(
 async def upload_report_attachment(
     report_id: int,
     file: UploadFile = File(...),
+    content_sha256: Optional[str] = Header(None, alias="X-Content-SHA256"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
@@ -151,30 +156,25 @@ async def upload_report_attachment(
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
 
-    # Generate unique filename
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
-
-    # Save file
-    try:
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    # Stream file into the blob store
+    stored = await save_upload(db, file, content_sha256)
 
     # Create attachment record
     attachment = Attachment(
         report_id=report_id,
-        filename=unique_filename,
+        filename=stored.filename,
         original_filename=file.filename,
-        file_path=str(file_path),
-        file_size=len(contents),
+        file_path=str(stored.path),
+        file_size=stored.size,
         mime_type=file.content_type or "application/octet-stream",
+        content_hash=stored.content_hash,
+        content_encoding=stored.content_encoding,
+        stored_size=stored.stored_size,
         uploaded_by=current_user.get("preferred_username", current_user.get("email", "Unknown")),
     )
     db.add(attachment)
+    db.flush()
+    rollups.attachment_created(db, attachment)
     db.commit()
     db.refresh(attachment)
     return attachment
@@ -204,6 +204,7 @@ def list_report_attachments(
 async def download_report_attachment(
     report_id: int,
     attachment_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
@@ -219,14 +220,7 @@ async def download_report_attachment(
     if not attachment:
         raise HTTPException(status_code=404, detail="Attachment not found")
 
-    if not os.path.exists(attachment.file_path):
-        raise HTTPException(status_code=404, detail="File not found on disk")
-
-    return FileResponse(
-        path=attachment.file_path,
-        filename=attachment.original_filename,
-        media_type=attachment.mime_type,
-    )
+    return attachment_file_response(request, attachment)
 
 
 @router.delete("/audit/reports/{report_id}/attachments/{attachment_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -248,13 +242,202 @@ def delete_report_attachment(
     if not attachment:
         raise HTTPException(status_code=404, detail="Attachment not found")
 
-    # Delete file from disk
-    try:
-        if os.path.exists(attachment.file_path):
-            os.remove(attachment.file_path)
-    except Exception as e:
-        print(f"Warning: Failed to delete file from disk: {str(e)}")
+    delete_attachment(db, attachment)
+    db.commit()
+    return None
+
+
+def _upload_session_response(session: UploadSession) -> UploadSessionResponse:
+    response = UploadSessionResponse.model_validate(session)
+    response.parts = [
+        UploadPartResponse(part_number=number, size=size)
+        for number, size in list_upload_parts(session.id)
+    ]
+    return response
+
+
+def _get_upload_session(db: Session, session_id: str) -> UploadSession:
+    session = (
+        db.query(UploadSession)
+        .filter(
+            UploadSession.id == session_id,
+            UploadSession.updated_at >= upload_session_cutoff(),
+        )
+        .first()
+    )
+    if not session:
+        raise HTTPException(
+            status_code=404, detail="Upload session not found or expired"
+        )
+    return session
+
+
+def _create_upload_session(
+    db: Session,
+    session_data: UploadSessionCreate,
+    current_user: dict,
+    template_id=None,
+    report_id=None,
+) -> UploadSessionResponse:
+    session = UploadSession(
+        id=str(uuid.uuid4()),
+        template_id=template_id,
+        report_id=report_id,
+        original_filename=session_data.filename,
+        mime_type=session_data.mime_type or "application/octet-stream",
+        total_size=session_data.total_size,
+        created_by=current_user.get(
+            "preferred_username", current_user.get("email", "Unknown")
+        ),
+    )
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+    return _upload_session_response(session)
+
+
+@router.post(
+    "/audit/templates/{template_id}/attachments/uploads",
+    response_model=UploadSessionResponse,
+    status_code=status.HTTP_201_CREATED,
+)
+def create_template_upload_session(
+    template_id: int,
+    session_data: UploadSessionCreate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Start a resumable multi-part upload for a template attachment"""
+    template = db.query(AuditTemplate).filter(AuditTemplate.id == template_id).first()
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    return _create_upload_session(
+        db, session_data, current_user, template_id=template_id
+    )
+
+
+@router.post(
+    "/audit/reports/{report_id}/attachments/uploads",
+    response_model=UploadSessionResponse,
+    status_code=status.HTTP_201_CREATED,
+)
+def create_report_upload_session(
+    report_id: int,
+    session_data: UploadSessionCreate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Start a resumable multi-part upload for a report attachment"""
+    report = db.query(AuditReport).filter(AuditReport.id == report_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return _create_upload_session(db, session_data, current_user, report_id=report_id)
+
+
+@router.get("/attachments/uploads/{session_id}", response_model=UploadSessionResponse)
+def get_upload_session(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Get an upload session and the parts received so far"""
+    return _upload_session_response(_get_upload_session(db, session_id))
+
+
+@router.put(
+    "/attachments/uploads/{session_id}/parts/{part_number}",
+    response_model=UploadPartResponse,
+)
+async def upload_part(
+    session_id: str,
+    part_number: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Upload one numbered part; parts can be sent in any order and in parallel"""
+    if not 1 <= part_number <= MAX_UPLOAD_PARTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Part number must be between 1 and {MAX_UPLOAD_PARTS}",
+        )
+    session = _get_upload_session(db, session_id)
+
+    size = await save_upload_part(session_id, part_number, request.stream())
+    # Keep the session alive for as long as parts keep arriving
+    session.updated_at = datetime.utcnow()
+    db.commit()
+    return UploadPartResponse(part_number=part_number, size=size)
+
+
+@router.post(
+    "/attachments/uploads/{session_id}/complete",
+    response_model=AttachmentResponse,
+    status_code=status.HTTP_201_CREATED,
+)
+async def complete_upload_session(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Assemble the received parts into the final file and create the attachment"""
+    session = _get_upload_session(db, session_id)
+
+    parts = list_upload_parts(session_id)
+    if not parts:
+        raise HTTPException(status_code=400, detail="No parts have been uploaded")
+    part_numbers = [number for number, _ in parts]
+    missing = sorted(set(range(1, part_numbers[-1] + 1)) - set(part_numbers))
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing parts: {missing}")
+    total_size = sum(size for _, size in parts)
+    if session.total_size is not None and total_size != session.total_size:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Received {total_size} bytes"
+                f" but the session declared {session.total_size}"
+            ),
+        )
+
+    stored = await store_upload_parts(db, session_id, part_numbers, session.mime_type)
+
+    # Create attachment record
+    attachment = Attachment(
+        template_id=session.template_id,
+        report_id=session.report_id,
+        filename=stored.filename,
+        original_filename=session.original_filename,
+        file_path=str(stored.path),
+        file_size=stored.size,
+        mime_type=session.mime_type,
+        content_hash=stored.content_hash,
+        content_encoding=stored.content_encoding,
+        stored_size=stored.stored_size,
+        uploaded_by=session.created_by,
+    )
+    db.add(attachment)
+    db.flush()
+    rollups.attachment_created(db, attachment)
+    db.delete(session)
+    db.commit()
+    db.refresh(attachment)
+
+    discard_upload_parts(session_id)
+    return attachment
 
-    db.delete(attachment)
+
+@router.delete(
+    "/attachments/uploads/{session_id}", status_code=status.HTTP_204_NO_CONTENT
+)
+def abort_upload_session(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Abort an upload session and discard its parts"""
+    session = _get_upload_session(db, session_id)
+    db.delete(session)
     db.commit()
+    discard_upload_parts(session_id)
     return None
@@ -1,21 +1,47 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session, selectinload
+from typing import Dict, List, Optional, Set, Union
 from datetime import datetime
 
 from ..database import get_db
-from ..models import Checklist, ChecklistItem, AuditTemplate, AuditReport
+from ..models import (
+    Checklist,
+    ChecklistItem,
+    ChecklistItemDependency,
+    AuditTemplate,
+    AuditReport,
+)
 from ..schemas import (
     ChecklistCreate,
     ChecklistResponse,
     ChecklistItemCreate,
     ChecklistItemUpdate,
     ChecklistItemResponse,
+    ChecklistItemBulkCreate,
+    ChecklistItemBulkUpdate,
+    ChecklistGraphResponse,
+    ChecklistProgress,
 )
 from ..auth import get_current_user
+from ..cache import analytics_cache
+from ..checklist_clone import has_checklists, instantiate_checklists
+from ..checklist_graph import (
+    cached_graph,
+    find_cycle,
+    invalidate_graph,
+    load_graph,
+    lock_checklist,
+    set_dependencies,
+)
+from .. import events
 
 router = APIRouter(prefix="/checklists", tags=["checklists"])
 
+# Most items one bulk request may create, update or delete, and most
+# checklist ids one progress request may give
+MAX_BULK_ITEMS = 1000
+
 
 @router.post("/", response_model=ChecklistResponse, status_code=status.HTTP_201_CREATED)
 def create_checklist(
@@ -47,6 +73,68 @@ def create_checklist(
     return new_checklist
 
 
+def _progress_query(db: Session):
+    """Item counts per checklist, counted by the database in one pass"""
+    return (
+        db.query(
+            Checklist.id.label("checklist_id"),
+            func.count(ChecklistItem.id).label("total_items"),
+            func.count(ChecklistItem.id).filter(ChecklistItem.is_completed).label("completed_items"),
+            func.count(ChecklistItem.id).filter(ChecklistItem.is_mandatory).label("mandatory_items"),
+            func.count(ChecklistItem.id)
+            .filter(ChecklistItem.is_mandatory, ChecklistItem.is_completed)
+            .label("completed_mandatory"),
+        )
+        .outerjoin(ChecklistItem, ChecklistItem.checklist_id == Checklist.id)
+        .group_by(Checklist.id)
+    )
+
+
+def _progress(row) -> dict:
+    return {
+        **row._mapping,
+        "completion_percentage": (
+            (row.completed_items / row.total_items * 100) if row.total_items > 0 else 0
+        ),
+        "mandatory_completion_percentage": (
+            (row.completed_mandatory / row.mandatory_items * 100)
+            if row.mandatory_items > 0
+            else 0
+        ),
+    }
+
+
+@router.get("/progress", response_model=List[ChecklistProgress])
+def get_checklists_progress(
+    template_id: Optional[int] = None,
+    report_id: Optional[int] = None,
+    ids: Optional[List[int]] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Get progress statistics for all checklists of a template, of a report,
+    or with the given ids, ordered by checklist id. Unknown ids are skipped.
+    """
+    if sum(value is not None for value in (template_id, report_id, ids)) != 1:
+        raise HTTPException(
+            status_code=400, detail="Give exactly one of template_id, report_id or ids"
+        )
+    query = _progress_query(db)
+    if template_id is not None:
+        query = query.filter(Checklist.template_id == template_id)
+    elif report_id is not None:
+        query = query.filter(Checklist.report_id == report_id)
+    else:
+        if len(ids) > MAX_BULK_ITEMS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {MAX_BULK_ITEMS} ids can be given per request",
+            )
+        query = query.filter(Checklist.id.in_(ids))
+    return [_progress(row) for row in query.order_by(Checklist.id)]
+
+
 @router.get("/{checklist_id}", response_model=ChecklistResponse)
 def get_checklist(
     checklist_id: int,
@@ -54,7 +142,12 @@ def get_checklist(
     current_user: dict = Depends(get_current_user),
 ):
     """Get a checklist with all its items"""
-    checklist = db.query(Checklist).filter(Checklist.id == checklist_id).first()
+    checklist = (
+        db.query(Checklist)
+        .options(selectinload(Checklist.items).selectinload(ChecklistItem.dependencies))
+        .filter(Checklist.id == checklist_id)
+        .first()
+    )
     if not checklist:
         raise HTTPException(status_code=404, detail="Checklist not found")
     return checklist
@@ -71,10 +164,72 @@ def get_template_checklists(
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
 
-    checklists = db.query(Checklist).filter(Checklist.template_id == template_id).all()
+    # Items of every checklist in one more query, instead of one per checklist
+    checklists = (
+        db.query(Checklist)
+        .options(selectinload(Checklist.items).selectinload(ChecklistItem.dependencies))
+        .filter(Checklist.template_id == template_id)
+        .order_by(Checklist.id)
+        .all()
+    )
     return checklists
 
 
+@router.get("/report/{report_id}", response_model=List[ChecklistResponse])
+def get_report_checklists(
+    report_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Get all checklists for a report"""
+    report = db.query(AuditReport).filter(AuditReport.id == report_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    checklists = (
+        db.query(Checklist)
+        .options(selectinload(Checklist.items).selectinload(ChecklistItem.dependencies))
+        .filter(Checklist.report_id == report_id)
+        .order_by(Checklist.id)
+        .all()
+    )
+    return checklists
+
+
+@router.post(
+    "/report/{report_id}/instantiate",
+    response_model=List[ChecklistResponse],
+    status_code=status.HTTP_201_CREATED,
+)
+def instantiate_report_checklists(
+    report_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Copy the checklists of the report's template, with their items and
+    dependencies, onto the report.
+    """
+    report = db.query(AuditReport).filter(AuditReport.id == report_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    if has_checklists(db, report_id):
+        raise HTTPException(status_code=409, detail="Report already has checklists")
+
+    created_by = current_user.get(
+        "preferred_username", current_user.get("email", "Unknown")
+    )
+    checklist_ids = instantiate_checklists(db, report, created_by)
+    db.commit()
+    return (
+        db.query(Checklist)
+        .options(selectinload(Checklist.items).selectinload(ChecklistItem.dependencies))
+        .filter(Checklist.id.in_(checklist_ids))
+        .order_by(Checklist.id)
+        .all()
+    )
+
+
 @router.delete("/{checklist_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_checklist(
     checklist_id: int,
@@ -87,10 +242,53 @@ def delete_checklist(
         raise HTTPException(status_code=404, detail="Checklist not found")
 
     db.delete(checklist)
+    invalidate_graph(db, checklist_id)
     db.commit()
     return None
 
 
+@router.get("/{checklist_id}/graph", response_model=ChecklistGraphResponse)
+def get_checklist_graph(
+    checklist_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Get the dependency graph of a checklist: item order and what is
+    actionable or blocked.
+    """
+    checklist = db.query(Checklist.id).filter(Checklist.id == checklist_id).first()
+    if not checklist:
+        raise HTTPException(status_code=404, detail="Checklist not found")
+    return cached_graph(db, checklist_id)
+
+
+def _requested_dependencies(
+    item: Union[ChecklistItemCreate, ChecklistItemUpdate],
+) -> Optional[Set[int]]:
+    """
+    The dependencies an item create or update asks for, or None to leave them
+    as they are.
+    """
+    if not {"depends_on_id", "depends_on_ids"} & item.model_fields_set:
+        return None
+    depends_on_ids = set(item.depends_on_ids or ())
+    if item.depends_on_id is not None:
+        depends_on_ids.add(item.depends_on_id)
+    return depends_on_ids
+
+
+def _cycle_detail(cycle: List[int], titles: Dict[int, str]) -> str:
+    path = " -> ".join(f"'{titles[item_id]}'" for item_id in cycle + cycle[:1])
+    return f"Item dependencies would form a cycle: {path}"
+
+
+def _blocked_detail(title: str, dependencies: List[str]) -> str:
+    names = ", ".join(f"'{dependency}'" for dependency in dependencies)
+    noun = "Dependency" if len(dependencies) == 1 else "Dependencies"
+    return f"Cannot complete {title}. {noun} {names} must be completed first."
+
+
 @router.post("/{checklist_id}/items", response_model=ChecklistItemResponse, status_code=status.HTTP_201_CREATED)
 def create_checklist_item(
     checklist_id: int,
@@ -103,25 +301,284 @@ def create_checklist_item(
     if not checklist:
         raise HTTPException(status_code=404, detail="Checklist not found")
 
-    # Validate dependency if specified
-    if item.depends_on_id:
-        dep_item = db.query(ChecklistItem).filter(
-            ChecklistItem.id == item.depends_on_id,
+    # Validate dependencies if specified; a new item cannot close a cycle
+    depends_on_ids = _requested_dependencies(item) or set()
+    if depends_on_ids:
+        found = db.query(func.count(ChecklistItem.id)).filter(
+            ChecklistItem.id.in_(depends_on_ids),
             ChecklistItem.checklist_id == checklist_id
-        ).first()
-        if not dep_item:
+        ).scalar()
+        if found < len(depends_on_ids):
             raise HTTPException(status_code=404, detail="Dependency item not found in this checklist")
 
     new_item = ChecklistItem(
         checklist_id=checklist_id,
-        **item.model_dump()
+        **item.model_dump(exclude={"depends_on_id", "depends_on_ids"})
     )
+    set_dependencies(new_item, depends_on_ids)
     db.add(new_item)
+    invalidate_graph(db, checklist_id)
     db.commit()
     db.refresh(new_item)
     return new_item
 
 
+def _check_bulk_size(count: int) -> None:
+    if not count:
+        raise HTTPException(status_code=400, detail="No items given")
+    if count > MAX_BULK_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_ITEMS} items can be changed per request",
+        )
+
+
+@router.post(
+    "/{checklist_id}/items/bulk",
+    response_model=List[ChecklistItemResponse],
+    status_code=status.HTTP_201_CREATED,
+)
+def bulk_create_checklist_items(
+    checklist_id: int,
+    items: List[ChecklistItemBulkCreate],
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Add many items to a checklist in one transaction. An item can depend on
+    existing items (``depends_on_id``/``depends_on_ids``) and on other items
+    of the request, by position (``depends_on_index``/``depends_on_indexes``).
+    """
+    _check_bulk_size(len(items))
+    checklist = db.query(Checklist).filter(Checklist.id == checklist_id).first()
+    if not checklist:
+        raise HTTPException(status_code=404, detail="Checklist not found")
+
+    # Validate every dependency against one fetch of the checklist's items
+    item_ids = db.query(ChecklistItem.id).filter(
+        ChecklistItem.checklist_id == checklist_id
+    )
+    existing_ids = {item_id for (item_id,) in item_ids}
+    depends_on_ids: List[Set[int]] = []
+    depends_on_indexes: Dict[int, Set[int]] = {}
+    for index, item in enumerate(items):
+        dependency_ids = _requested_dependencies(item) or set()
+        if not dependency_ids <= existing_ids:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Item {index}: dependency item not found in this checklist",
+            )
+        dependency_indexes = set(item.depends_on_indexes)
+        if item.depends_on_index is not None:
+            dependency_indexes.add(item.depends_on_index)
+        if any(
+            not 0 <= other < len(items) or other == index
+            for other in dependency_indexes
+        ):
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"Item {index}: depends_on_index must refer to another item"
+                    " of this request"
+                ),
+            )
+        depends_on_ids.append(dependency_ids)
+        depends_on_indexes[index] = dependency_indexes
+    # Existing items cannot depend on new ones, so only the new ones can loop
+    cycle = find_cycle(depends_on_indexes)
+    if cycle:
+        titles = {index: item.title for index, item in enumerate(items)}
+        raise HTTPException(status_code=400, detail=_cycle_detail(cycle, titles))
+
+    # With the ids reserved up front, the items and then their dependencies
+    # are each written by a single INSERT
+    sequence = func.pg_get_serial_sequence(ChecklistItem.__tablename__, "id")
+    new_ids = db.execute(
+        select(func.nextval(sequence))
+        .select_from(func.generate_series(1, len(items)))
+    ).scalars().all()
+    now = datetime.utcnow()
+    dependency_fields = {
+        "depends_on_id", "depends_on_ids", "depends_on_index", "depends_on_indexes"
+    }
+    rows = [
+        {
+            **item.model_dump(exclude=dependency_fields),
+            "id": new_id,
+            "checklist_id": checklist_id,
+            "is_completed": False,
+            "created_at": now,
+        }
+        for item, new_id in zip(items, new_ids)
+    ]
+    for index, dependency_indexes in depends_on_indexes.items():
+        depends_on_ids[index] |= {new_ids[other] for other in dependency_indexes}
+    table = ChecklistItem.__table__
+    inserted = db.execute(insert(table).returning(*table.c), rows)
+    rows_by_id = {row.id: row._mapping for row in inserted}
+    dependencies = [
+        {"item_id": new_id, "depends_on_id": dependency_id}
+        for new_id, dependency_ids in zip(new_ids, depends_on_ids)
+        for dependency_id in dependency_ids
+    ]
+    if dependencies:
+        db.execute(insert(ChecklistItemDependency.__table__), dependencies)
+    created = []
+    for new_id, dependency_ids in zip(new_ids, depends_on_ids):
+        dependency_ids = sorted(dependency_ids)
+        created.append(ChecklistItemResponse.model_validate({
+            **rows_by_id[new_id],
+            "depends_on_ids": dependency_ids,
+            "depends_on_id": dependency_ids[0] if dependency_ids else None,
+        }))
+    invalidate_graph(db, checklist_id)
+    db.commit()
+    return created
+
+
+@router.put("/{checklist_id}/items/bulk", response_model=List[ChecklistItemResponse])
+def bulk_update_checklist_items(
+    checklist_id: int,
+    updates: List[ChecklistItemBulkUpdate],
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Update many items of a checklist in one transaction, e.g. to complete or
+    reorder them. Dependencies are checked against the state after the
+    whole update, so an item and its dependency can be completed together.
+    """
+    _check_bulk_size(len(updates))
+    checklist = lock_checklist(db, checklist_id)
+    if not checklist:
+        raise HTTPException(status_code=404, detail="Checklist not found")
+
+    items = {
+        item.id: item for item in
+        db.query(ChecklistItem).options(selectinload(ChecklistItem.dependencies))
+        .filter(ChecklistItem.checklist_id == checklist_id)
+    }
+    changes = {
+        update.id: update.model_dump(exclude_unset=True, exclude={"id"})
+        for update in updates
+    }
+    if len(changes) < len(updates):
+        raise HTTPException(
+            status_code=400, detail="Each item can only be updated once per request"
+        )
+    missing = sorted(changes.keys() - items.keys())
+    if missing:
+        raise HTTPException(
+            status_code=404, detail=f"Checklist items not found: {missing}"
+        )
+
+    # The dependencies and completion of every item once the update applies
+    depends_on = {item_id: item.depends_on_ids for item_id, item in items.items()}
+    is_completed = {item_id: item.is_completed for item_id, item in items.items()}
+    new_dependencies = {}
+    for update in updates:
+        dependency_ids = _requested_dependencies(update)
+        if dependency_ids is not None:
+            if not dependency_ids <= items.keys():
+                raise HTTPException(
+                    status_code=404,
+                    detail=(
+                        f"Item {update.id}: dependency item not found"
+                        " in this checklist"
+                    ),
+                )
+            depends_on[update.id] = new_dependencies[update.id] = sorted(dependency_ids)
+        if update.is_completed is not None:
+            is_completed[update.id] = update.is_completed
+    cycle = find_cycle(depends_on)
+    if cycle:
+        titles = {item_id: item.title for item_id, item in items.items()}
+        raise HTTPException(status_code=400, detail=_cycle_detail(cycle, titles))
+
+    changed_by = current_user.get(
+        "preferred_username", current_user.get("email", "Unknown")
+    )
+    now = datetime.utcnow()
+    completed = []
+    for item_id, change in changes.items():
+        item = items[item_id]
+        for key in ("is_completed", "depends_on_id", "depends_on_ids"):
+            change.pop(key, None)
+        if is_completed[item_id] != item.is_completed:
+            if is_completed[item_id]:
+                blocked_by = [
+                    items[other].title
+                    for other in depends_on[item_id]
+                    if not is_completed[other]
+                ]
+                if blocked_by:
+                    detail = _blocked_detail(f"'{item.title}'", blocked_by)
+                    raise HTTPException(status_code=400, detail=detail)
+                item.completed_by = changed_by
+                item.completed_at = now
+                completed.append(item)
+            else:
+                item.completed_by = None
+                item.completed_at = None
+            item.is_completed = is_completed[item_id]
+            # Completions show up in the activity feed
+            analytics_cache.invalidate_on_commit(db)
+        for key, value in change.items():
+            setattr(item, key, value)
+        if item_id in new_dependencies:
+            set_dependencies(item, new_dependencies[item_id])
+
+    for item in completed:
+        event = events.activity_event("checklist_item_completed", item.completed_at, {
+            "id": item.id,
+            "checklist_id": item.checklist_id,
+            "title": item.title,
+            "completed_by": item.completed_by,
+        })
+        events.publish_on_commit(db, event)
+
+    # The flush batches rows changing the same columns into one executemany
+    updated = [
+        ChecklistItemResponse.model_validate(items[item_id]) for item_id in changes
+    ]
+    invalidate_graph(db, checklist_id)
+    db.commit()
+    return updated
+
+
+@router.delete("/{checklist_id}/items", status_code=status.HTTP_204_NO_CONTENT)
+def bulk_delete_checklist_items(
+    checklist_id: int,
+    ids: List[int] = Query(...),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Delete many items of a checklist in one transaction"""
+    _check_bulk_size(len(ids))
+    checklist = db.query(Checklist).filter(Checklist.id == checklist_id).first()
+    if not checklist:
+        raise HTTPException(status_code=404, detail="Checklist not found")
+
+    found = dict(
+        db.query(ChecklistItem.id, ChecklistItem.is_completed)
+        .filter(ChecklistItem.checklist_id == checklist_id, ChecklistItem.id.in_(ids))
+        .all()
+    )
+    missing = sorted(set(ids) - found.keys())
+    if missing:
+        raise HTTPException(
+            status_code=404, detail=f"Checklist items not found: {missing}"
+        )
+
+    # Their dependency rows, both ways, go with them (ON DELETE CASCADE)
+    db.query(ChecklistItem).filter(ChecklistItem.id.in_(ids)).delete(synchronize_session=False)
+    if any(found.values()):
+        analytics_cache.invalidate_on_commit(db)
+    invalidate_graph(db, checklist_id)
+    db.commit()
+    return None
+
+
 @router.put("/{checklist_id}/items/{item_id}", response_model=ChecklistItemResponse)
 def update_checklist_item(
     checklist_id: int,
@@ -138,32 +595,67 @@ def update_checklist_item(
     if not item:
         raise HTTPException(status_code=404, detail="Checklist item not found")
 
+    # Dependency changes and completions are checked against the whole graph
+    depends_on_ids = _requested_dependencies(item_update)
+    completing = item_update.is_completed and not item.is_completed
+    if depends_on_ids is not None or completing:
+        lock_checklist(db, checklist_id)
+        graph = load_graph(db, checklist_id)
+        if depends_on_ids is not None:
+            if not depends_on_ids <= graph.nodes.keys():
+                raise HTTPException(
+                    status_code=404,
+                    detail="Dependency item not found in this checklist",
+                )
+            graph.nodes[item.id].depends_on_ids = sorted(depends_on_ids)
+            cycle = graph.find_cycle()
+            if cycle:
+                titles = {node_id: node.title for node_id, node in graph.nodes.items()}
+                raise HTTPException(
+                    status_code=400, detail=_cycle_detail(cycle, titles)
+                )
+            set_dependencies(item, depends_on_ids)
+        if completing:
+            blocked_by = [
+                graph.nodes[other].title for other in graph.blocked_by(item.id)
+            ]
+            if blocked_by:
+                raise HTTPException(
+                    status_code=400, detail=_blocked_detail("this item", blocked_by)
+                )
+
     # Check if marking as complete
+    completed = False
     if item_update.is_completed is not None and item_update.is_completed != item.is_completed:
         if item_update.is_completed:
-            # Check dependencies are met
-            if item.depends_on_id:
-                dependency = db.query(ChecklistItem).filter(ChecklistItem.id == item.depends_on_id).first()
-                if dependency and not dependency.is_completed:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Cannot complete this item. Dependency '{dependency.title}' must be completed first."
-                    )
-
             item.completed_by = current_user.get("preferred_username", current_user.get("email", "Unknown"))
             item.completed_at = datetime.utcnow()
+            completed = True
         else:
             item.completed_by = None
             item.completed_at = None
+        # Completions show up in the activity feed
+        analytics_cache.invalidate_on_commit(db)
 
     # Update other fields
-    update_data = item_update.model_dump(exclude_unset=True, exclude={"is_completed"})
+    exclude = {"is_completed", "depends_on_id", "depends_on_ids"}
+    update_data = item_update.model_dump(exclude_unset=True, exclude=exclude)
     for key, value in update_data.items():
         setattr(item, key, value)
 
     if item_update.is_completed is not None:
         item.is_completed = item_update.is_completed
 
+    if completed:
+        event = events.activity_event("checklist_item_completed", item.completed_at, {
+            "id": item.id,
+            "checklist_id": item.checklist_id,
+            "title": item.title,
+            "completed_by": item.completed_by,
+        })
+        events.publish_on_commit(db, event)
+
+    invalidate_graph(db, checklist_id)
     db.commit()
     db.refresh(item)
     return item
@@ -185,34 +677,19 @@ def delete_checklist_item(
         raise HTTPException(status_code=404, detail="Checklist item not found")
 
     db.delete(item)
+    invalidate_graph(db, checklist_id)
     db.commit()
     return None
 
 
-@router.get("/{checklist_id}/progress")
+@router.get("/{checklist_id}/progress", response_model=ChecklistProgress)
 def get_checklist_progress(
     checklist_id: int,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
     """Get progress statistics for a checklist"""
-    checklist = db.query(Checklist).filter(Checklist.id == checklist_id).first()
-    if not checklist:
+    row = _progress_query(db).filter(Checklist.id == checklist_id).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Checklist not found")
-
-    items = db.query(ChecklistItem).filter(ChecklistItem.checklist_id == checklist_id).all()
-
-    total_items = len(items)
-    completed_items = sum(1 for item in items if item.is_completed)
-    mandatory_items = sum(1 for item in items if item.is_mandatory)
-    completed_mandatory = sum(1 for item in items if item.is_mandatory and item.is_completed)
-
-    return {
-        "checklist_id": checklist_id,
-        "total_items": total_items,
-        "completed_items": completed_items,
-        "mandatory_items": mandatory_items,
-        "completed_mandatory": completed_mandatory,
-        "completion_percentage": (completed_items / total_items * 100) if total_items > 0 else 0,
-        "mandatory_completion_percentage": (completed_mandatory / mandatory_items * 100) if mandatory_items > 0 else 0,
-    }
+    return _progress(row)
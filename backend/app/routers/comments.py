@@ -6,6 +6,7 @@ from ..database import get_db
 from ..models import TemplateComment, AuditTemplate
 from ..schemas import TemplateCommentCreate, TemplateCommentResponse
 from ..auth import get_current_user
+from .. import rollups
 
 router = APIRouter(prefix="/audit/templates/{template_id}/comments", tags=["comments"])
 
@@ -48,6 +49,8 @@ def create_comment(
         content=comment.content,
     )
     db.add(new_comment)
+    db.flush()
+    rollups.comment_created(db, new_comment)
     db.commit()
     db.refresh(new_comment)
     return new_comment
@@ -72,6 +75,7 @@ def delete_comment(
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
 
+    rollups.comment_deleted(db, comment)
     db.delete(comment)
     db.commit()
     return None
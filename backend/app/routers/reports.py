@@ -1,39 +1,156 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from io import BytesIO
-from datetime import datetime, timezone
-from ..database import get_db
-from ..models import AuditTemplate, AuditReport
-from ..schemas import AuditReportCreate
+from concurrent.futures import FIRST_COMPLETED, wait
+from io import BytesIO, RawIOBase
+from datetime import datetime
+from typing import Dict, List, Optional
+import os
+import time
+import zipfile
+from ..database import SessionLocal, get_db
+from ..models import AuditTemplate, AuditReport, ReportStatus
+from ..schemas import AuditReportCreate, AuditReportResponse
+from ..auth import get_current_user
+from .. import rollups
+from ..checklist_clone import instantiate_checklists
+from ..rendering import (
+    RenderPoolBusy,
+    RenderTimeout,
+    render_pool,
+    render_report_pdf,
+    render_settings,
+    stamp_generated,
+)
+from ..render_cache import render_cache, render_template_pdf
+from ..report_jobs import report_jobs, store_report_pdf
 
 router = APIRouter(prefix="/audit/reports", tags=["reports"])
 
 
-def generate_pdf(template: AuditTemplate, title: str) -> BytesIO:
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
+def report_filename(title: str) -> str:
+    return f"{title.replace(' ', '_')}.pdf"
 
-    story.append(Paragraph(f"<b>{title}</b>", styles['Title']))
-    story.append(Spacer(1, 12))
-    story.append(Paragraph(f"Template: {template.name}", styles['Heading2']))
-    story.append(Spacer(1, 12))
-    story.append(Paragraph(f"Generated: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}", styles['Normal']))
-    story.append(Spacer(1, 12))
-    story.append(Paragraph("<b>Description:</b>", styles['Heading3']))
-    story.append(Paragraph(template.description or "No description", styles['Normal']))
-    story.append(Spacer(1, 12))
-    story.append(Paragraph("<b>Content:</b>", styles['Heading3']))
-    story.append(Paragraph(template.content, styles['Normal']))
 
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+class _ZipChunks(RawIOBase):
+    """Write-only sink that lets a ZipFile be drained chunk by chunk."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def _stream_report_zip(jobs: Dict[int, tuple]):
+    """
+    Render the batch on the pool and yield the ZIP archive incrementally,
+    adding each PDF as soon as it is ready. ``jobs`` maps report id to
+    (title, template name, description, content, cache key).
+
+    Reports still pending when the client disconnects are handed over to the
+    background job queue instead of being lost.
+    """
+    sink = _ZipChunks()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+    pending = list(jobs)
+    in_flight = {}
+    results = {}
+
+    def add_to_archive(
+        report_id: int, pdf_bytes: Optional[bytes] = None, error: Optional[str] = None
+    ):
+        title = jobs[report_id][0]
+        if pdf_bytes is not None:
+            pdf_bytes = stamp_generated(pdf_bytes)
+            archive.writestr(f"{report_id}_{report_filename(title)}", pdf_bytes)
+            path = store_report_pdf(report_id, pdf_bytes)
+            results[report_id] = (ReportStatus.DONE.value, path, None)
+        else:
+            archive.writestr(f"{report_id}_{report_filename(title)}.error.txt", error)
+            results[report_id] = (ReportStatus.FAILED.value, None, error)
+
+    try:
+        for report_id in list(pending):
+            pdf_bytes = render_cache.get(jobs[report_id][4])
+            if pdf_bytes is not None:
+                pending.remove(report_id)
+                add_to_archive(report_id, pdf_bytes)
+                yield sink.drain()
+
+        while pending or in_flight:
+            # Fill free pool slots; block for one only when nothing is running
+            while pending:
+                report_id = pending[0]
+                title, name, description, content, _ = jobs[report_id]
+                try:
+                    future = render_pool.submit(
+                        render_report_pdf, name, description, content, title,
+                        block=not in_flight,
+                    )
+                except RenderPoolBusy:
+                    break
+                pending.pop(0)
+                in_flight[future] = (report_id, time.monotonic() + render_pool.timeout)
+
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+            if not in_flight:
+                continue
+
+            next_deadline = min(deadline for _, deadline in in_flight.values())
+            done, _ = wait(
+                in_flight,
+                timeout=max(next_deadline - time.monotonic(), 0),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                report_id, _ = in_flight.pop(future)
+                try:
+                    pdf_bytes = future.result()
+                except Exception as e:
+                    add_to_archive(report_id, error=f"Report rendering failed: {e}")
+                else:
+                    render_cache.put(jobs[report_id][4], pdf_bytes)
+                    add_to_archive(report_id, pdf_bytes)
+            now = time.monotonic()
+            for future, (report_id, deadline) in list(in_flight.items()):
+                if deadline <= now:
+                    del in_flight[future]
+                    future.cancel()
+                    add_to_archive(report_id, error="Report rendering timed out")
+
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+
+        archive.close()
+        yield sink.drain()
+    finally:
+        unfinished = [report_id for report_id in jobs if report_id not in results]
+        db = SessionLocal()
+        try:
+            reports = db.query(AuditReport).filter(AuditReport.id.in_(list(jobs)))
+            for report in reports.all():
+                if report.id in results:
+                    report.status, report.file_path, report.error = results[report.id]
+                    report.completed_at = datetime.utcnow()
+                else:
+                    report.status = ReportStatus.QUEUED.value
+            db.commit()
+        finally:
+            db.close()
+        for report_id in unfinished:
+            report_jobs.enqueue(report_id)
 
 
 @router.post("/generate", response_class=StreamingResponse)
@@ -42,18 +159,181 @@ def generate_report(report_data: AuditReportCreate, db: Session = Depends(get_db
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
 
+    # Render before recording the report so a rejected request leaves no row behind
+    try:
+        pdf_bytes = render_template_pdf(template, report_data.title)
+    except RenderPoolBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Report renderer is busy, please retry later",
+            headers={"Retry-After": str(render_settings.render_retry_after_seconds)},
+        )
+    except RenderTimeout:
+        raise HTTPException(status_code=504, detail="Report rendering timed out")
+
     new_report = AuditReport(
         template_id=report_data.template_id,
         title=report_data.title,
-        generated_by="system"
+        due_date=report_data.due_date,
+        template_version=template.version,
+        status=ReportStatus.DONE.value,
+        generated_by="system",
+        completed_at=datetime.utcnow(),
     )
     db.add(new_report)
+    db.flush()
+    rollups.reports_created(db, [new_report])
+    if report_data.instantiate_checklists:
+        instantiate_checklists(db, new_report, new_report.generated_by)
+    # Keep the artifact so the report can be downloaded again without re-rendering
+    new_report.file_path = store_report_pdf(new_report.id, pdf_bytes)
     db.commit()
 
-    pdf_buffer = generate_pdf(template, report_data.title)
+    filename = report_filename(report_data.title)
+    return StreamingResponse(
+        BytesIO(pdf_bytes),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+@router.post("/generate/batch", response_class=StreamingResponse)
+def generate_report_batch(
+    reports_data: List[AuditReportCreate], db: Session = Depends(get_db)
+):
+    """Generate many reports at once and stream them back as a ZIP archive"""
+    if not reports_data:
+        raise HTTPException(status_code=400, detail="No reports requested")
+    max_items = render_settings.render_batch_max_items
+    if len(reports_data) > max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {max_items} reports can be generated per batch",
+        )
+
+    template_ids = {item.template_id for item in reports_data}
+    rows = db.query(AuditTemplate).filter(AuditTemplate.id.in_(template_ids)).all()
+    templates = {template.id: template for template in rows}
+    missing = sorted(template_ids - templates.keys())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Templates not found: {missing}")
+
+    new_reports = [
+        AuditReport(
+            template_id=item.template_id,
+            title=item.title,
+            due_date=item.due_date,
+            template_version=templates[item.template_id].version,
+            status=ReportStatus.RUNNING.value,
+            generated_by="system",
+        )
+        for item in reports_data
+    ]
+    db.add_all(new_reports)
+    db.flush()
+    rollups.reports_created(db, new_reports)
+    for item, report in zip(reports_data, new_reports):
+        if item.instantiate_checklists:
+            instantiate_checklists(db, report, report.generated_by)
+
+    jobs = {}
+    for report in new_reports:
+        template = templates[report.template_id]
+        jobs[report.id] = (
+            report.title,
+            template.name,
+            template.description,
+            template.content,
+            render_cache.key(template.id, template.version, report.title),
+        )
+    db.commit()
 
     return StreamingResponse(
-        pdf_buffer,
+        _stream_report_zip(jobs),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=reports.zip"},
+    )
+
+
+@router.get("/render/stats")
+def get_render_stats(current_user: dict = Depends(get_current_user)):
+    """Get render pool load and render cache hit/miss/eviction counters"""
+    return {"pool": render_pool.stats(), "cache": render_cache.stats()}
+
+
+@router.post(
+    "/", response_model=AuditReportResponse, status_code=status.HTTP_202_ACCEPTED
+)
+def enqueue_report(
+    report_data: AuditReportCreate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Queue a report for background rendering and return immediately"""
+    template = (
+        db.query(AuditTemplate)
+        .filter(AuditTemplate.id == report_data.template_id)
+        .first()
+    )
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+
+    new_report = AuditReport(
+        template_id=report_data.template_id,
+        title=report_data.title,
+        due_date=report_data.due_date,
+        template_version=template.version,
+        status=ReportStatus.QUEUED.value,
+        generated_by=current_user.get(
+            "preferred_username", current_user.get("email", "Unknown")
+        ),
+    )
+    db.add(new_report)
+    db.flush()
+    rollups.reports_created(db, [new_report])
+    if report_data.instantiate_checklists:
+        instantiate_checklists(db, new_report, new_report.generated_by)
+    db.commit()
+    db.refresh(new_report)
+
+    report_jobs.enqueue(new_report.id)
+    return new_report
+
+
+@router.get("/{report_id}", response_model=AuditReportResponse)
+def get_report(
+    report_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Get a report and the status of its rendering job"""
+    report = db.query(AuditReport).filter(AuditReport.id == report_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return report
+
+
+@router.get("/{report_id}/download")
+def download_report(
+    report_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Download the stored PDF of a rendered report"""
+    report = db.query(AuditReport).filter(AuditReport.id == report_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    if report.status != ReportStatus.DONE.value:
+        raise HTTPException(
+            status_code=409, detail=f"Report is not ready (status: {report.status})"
+        )
+
+    if not report.file_path or not os.path.exists(report.file_path):
+        raise HTTPException(status_code=404, detail="Report file not found on disk")
+
+    return FileResponse(
+        path=report.file_path,
+        filename=report_filename(report.title),
         media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={report_data.title.replace(' ', '_')}.pdf"}
     )
@@ -0,0 +1,132 @@
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..auth import get_current_user
+from ..database import get_db
+from ..pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from ..schemas import SearchResult
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+# Result kinds, in the order used to break ties between equal ranks
+SEARCH_KINDS = ["template", "comment"]
+
+HEADLINE_OPTIONS = (
+    "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2"
+)
+
+# Snippets are HTML: the text is escaped before ts_headline adds its <mark>
+# tags, so template and comment content can never inject markup.
+ESCAPE_HTML = "replace(replace(replace({}, '&', '&amp;'), '<', '&lt;'), '>', '&gt;')"
+TEMPLATE_SNIPPET_TEXT = ESCAPE_HTML.format(
+    "coalesce(audit_templates.description, '') || ' ' || audit_templates.content"
+)
+COMMENT_SNIPPET_TEXT = ESCAPE_HTML.format("template_comments.content")
+
+# Matches come from the GIN indexes on the generated search_vector columns.
+# Every match has to be ranked before the page can be cut, but snippets,
+# the expensive part, are only built for the rows of the page.
+SEARCH_QUERY = text(f"""
+WITH search AS (
+    SELECT websearch_to_tsquery('english', :q) AS query
+),
+hits AS (
+    SELECT 0 AS kind, audit_templates.id, audit_templates.id AS template_id,
+           ts_rank(audit_templates.search_vector, search.query) AS rank
+    FROM audit_templates, search
+    WHERE :include_templates AND audit_templates.search_vector @@ search.query
+    UNION ALL
+    SELECT 1, template_comments.id, template_comments.template_id,
+           ts_rank(template_comments.search_vector, search.query)
+    FROM template_comments, search
+    WHERE :include_comments AND template_comments.search_vector @@ search.query
+),
+page AS (
+    SELECT * FROM hits
+    WHERE NOT :has_cursor
+       OR (rank, kind, id) < (CAST(:after_rank AS real), :after_kind, :after_id)
+    ORDER BY rank DESC, kind DESC, id DESC
+    LIMIT :limit
+)
+SELECT
+    page.kind, page.id, page.template_id, page.rank, audit_templates.name AS title,
+    CASE page.kind
+        WHEN 0 THEN ts_headline(
+            'english',
+            {TEMPLATE_SNIPPET_TEXT},
+            search.query,
+            :headline_options
+        )
+        ELSE ts_headline(
+            'english',
+            {COMMENT_SNIPPET_TEXT},
+            search.query,
+            :headline_options
+        )
+    END AS snippet
+FROM page
+CROSS JOIN search
+JOIN audit_templates ON audit_templates.id = page.template_id
+LEFT JOIN template_comments ON page.kind = 1 AND template_comments.id = page.id
+ORDER BY page.rank DESC, page.kind DESC, page.id DESC
+""")
+
+
+@router.get("/", response_model=List[SearchResult])
+def search(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    scope: Literal["all", "templates", "comments"] = "all",
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Full-text search over templates (name, description, content) and
+    comments, best matches first, with <mark>-highlighted snippets. Snippets
+    are safe HTML: everything but the <mark> tags is escaped. ``q`` accepts
+    web search syntax: "quoted phrases", OR and -exclusions.
+    """
+    params = {
+        "q": q,
+        "include_templates": scope in ("all", "templates"),
+        "include_comments": scope in ("all", "comments"),
+        "has_cursor": cursor is not None,
+        "after_rank": 0.0,
+        "after_kind": 0,
+        "after_id": 0,
+        "limit": limit + 1,
+        "headline_options": HEADLINE_OPTIONS,
+    }
+    if cursor is not None:
+        position = decode_cursor(cursor)
+        try:
+            params["after_rank"] = float(position["rank"])
+            params["after_kind"] = SEARCH_KINDS.index(position["kind"])
+            params["after_id"] = int(position["id"])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    rows = db.execute(SEARCH_QUERY, params).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            {"rank": last.rank, "kind": SEARCH_KINDS[last.kind], "id": last.id}
+        )
+
+    return [
+        SearchResult(
+            kind=SEARCH_KINDS[row.kind],
+            id=row.id,
+            template_id=row.template_id,
+            title=row.title,
+            rank=row.rank,
+            snippet=row.snippet,
+        )
+        for row in rows
+    ]
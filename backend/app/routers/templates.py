@@ -1,10 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import cast, func, true, tuple_
 from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime
+from typing import List, Literal, Optional
 from ..database import get_db
-from ..models import AuditTemplate, TemplateVersion
-from ..schemas import AuditTemplateCreate, AuditTemplateUpdate, AuditTemplateResponse
+from ..models import AuditTemplate, UploadSession
+from ..schemas import (
+    AuditTemplateCreate,
+    AuditTemplateUpdate,
+    AuditTemplateResponse,
+    TagFacet,
+    TemplateStatus,
+)
 from ..auth import get_current_user
+from .. import events, rollups, version_store
+from ..storage import discard_upload_parts, release_file
+from ..pagination import (
+    NEXT_CURSOR_HEADER,
+    TOTAL_COUNT_HEADER,
+    decode_cursor,
+    encode_cursor,
+    total_count,
+)
 
 router = APIRouter(prefix="/audit/templates", tags=["templates"])
 
@@ -21,17 +38,127 @@ def create_template(
 
     new_template = AuditTemplate(**template.model_dump())
     db.add(new_template)
+    db.flush()
+    rollups.template_created(db, new_template)
     db.commit()
     db.refresh(new_template)
     return new_template
 
 
+def template_filters(
+    status_filter: Optional[TemplateStatus] = Query(None, alias="status"),
+    tags: Optional[List[str]] = Query(None),
+    tag_match: Literal["all", "any"] = "all",
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+) -> list:
+    """Filter conditions shared by the template listing and its tag facets"""
+    conditions = []
+    if status_filter is not None:
+        conditions.append(AuditTemplate.status == status_filter.value)
+    if tags:
+        # @> (has all) and && (has any) are both served by the GIN index on tags
+        tag_array = cast(tags, AuditTemplate.tags.type)
+        if tag_match == "any":
+            conditions.append(AuditTemplate.tags.op("&&")(tag_array))
+        else:
+            conditions.append(AuditTemplate.tags.op("@>")(tag_array))
+    if created_after is not None:
+        conditions.append(AuditTemplate.created_at >= created_after)
+    if created_before is not None:
+        conditions.append(AuditTemplate.created_at < created_before)
+    if updated_after is not None:
+        conditions.append(AuditTemplate.updated_at >= updated_after)
+    if updated_before is not None:
+        conditions.append(AuditTemplate.updated_at < updated_before)
+    return conditions
+
+
 @router.get("/", response_model=List[AuditTemplateResponse])
-def list_templates(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    templates = db.query(AuditTemplate).offset(skip).limit(limit).all()
+def list_templates(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    sort: Literal["updated_at", "name"] = "updated_at",
+    conditions: list = Depends(template_filters),
+    count: Literal["none", "exact", "estimate"] = "none",
+    skip: int = Query(0, ge=0, deprecated=True),
+    db: Session = Depends(get_db),
+):
+    """
+    List templates, most recently updated first (or by name), filtered by
+    status, tags (all or any of them) and created/updated ranges. Pass the
+    X-Next-Cursor response header back as ``cursor`` for the next page;
+    ``count`` adds an X-Total-Count header.
+    """
+    query = db.query(AuditTemplate).filter(*conditions)
+
+    total = total_count(db, query, count)
+    if total is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
+
+    if sort == "name":
+        query = query.order_by(AuditTemplate.name, AuditTemplate.id)
+    else:
+        query = query.order_by(AuditTemplate.updated_at.desc(), AuditTemplate.id.desc())
+
+    if cursor is not None:
+        position = decode_cursor(cursor)
+        if position.get("sort") != sort:
+            raise HTTPException(
+                status_code=400, detail="Cursor was issued for a different sort order"
+            )
+        try:
+            after_id = int(position["id"])
+            if sort == "name":
+                columns = tuple_(AuditTemplate.name, AuditTemplate.id)
+                query = query.filter(columns > tuple_(str(position["key"]), after_id))
+            else:
+                after_key = datetime.fromisoformat(position["key"])
+                columns = tuple_(AuditTemplate.updated_at, AuditTemplate.id)
+                query = query.filter(columns < tuple_(after_key, after_id))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    elif skip:
+        query = query.offset(skip)
+
+    templates = query.limit(limit + 1).all()
+    if len(templates) > limit:
+        templates = templates[:limit]
+        last = templates[-1]
+        key = last.name if sort == "name" else last.updated_at.isoformat()
+        next_cursor = encode_cursor({"sort": sort, "key": key, "id": last.id})
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return templates
 
 
+@router.get("/tags/facets", response_model=List[TagFacet])
+def get_tag_facets(
+    limit: int = Query(100, ge=1, le=1000),
+    conditions: list = Depends(template_filters),
+    db: Session = Depends(get_db),
+):
+    """
+    Count the templates carrying each tag, among those matching the same
+    filters as the listing.
+    """
+    tag = func.unnest(AuditTemplate.tags).table_valued("tag").render_derived()
+    template_count = func.count().label("count")
+    rows = (
+        db.query(tag.c.tag, template_count)
+        .select_from(AuditTemplate)
+        .join(tag, true())
+        .filter(*conditions)
+        .group_by(tag.c.tag)
+        .order_by(template_count.desc(), tag.c.tag)
+        .limit(limit)
+        .all()
+    )
+    return [TagFacet(tag=row.tag, count=row.count) for row in rows]
+
+
 @router.get("/{template_id}", response_model=AuditTemplateResponse)
 def get_template(template_id: int, db: Session = Depends(get_db)):
     template = db.query(AuditTemplate).filter(AuditTemplate.id == template_id).first()
@@ -52,25 +179,27 @@ def update_template(
         raise HTTPException(status_code=404, detail="Template not found")
 
     # Create version snapshot before updating
-    version_snapshot = TemplateVersion(
-        template_id=template.id,
-        version=template.version,
-        name=template.name,
-        description=template.description,
-        content=template.content,
-        tags=template.tags,
-        status=template.status,
-        changed_by=current_user.get("preferred_username", current_user.get("email", "Unknown")),
+    version_snapshot = version_store.create_snapshot(
+        db,
+        template,
+        current_user.get("preferred_username", current_user.get("email", "Unknown")),
     )
-    db.add(version_snapshot)
 
     # Update template
+    old_status = template.status
     update_data = template_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(template, key, value)
 
     # Increment version
     template.version += 1
+    rollups.template_status_changed(db, old_status, template.status)
+    events.publish_on_commit(db, events.activity_event("template_updated", None, {
+        "template_id": template.id,
+        "previous_version": version_snapshot.version,
+        "name": version_snapshot.name,
+        "changed_by": version_snapshot.changed_by,
+    }))
 
     db.commit()
     db.refresh(template)
@@ -83,6 +212,22 @@ def delete_template(template_id: int, db: Session = Depends(get_db)):
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
 
+    # Release stored attachment files; the rows go with the template
+    stored_files = [
+        (attachment.content_hash, attachment.file_path, attachment.stored_size)
+        for attachment in template.attachments
+    ]
+    # Unfinished uploads go too (ON DELETE CASCADE), but their parts are files
+    upload_sessions = db.query(UploadSession.id).filter(
+        UploadSession.template_id == template_id
+    )
+    upload_session_ids = [session_id for (session_id,) in upload_sessions]
+    rollups.template_deleted(db, template)
     db.delete(template)
+    db.flush()
+    for content_hash, file_path, stored_size in stored_files:
+        release_file(db, content_hash, file_path, stored_size)
     db.commit()
+    for session_id in upload_session_ids:
+        discard_upload_parts(session_id)
     return None
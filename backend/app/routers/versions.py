@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, defer, load_only
+from typing import List, Literal, Optional
 
+from ..cache import diff_cache
 from ..database import get_db
 from ..models import TemplateVersion, AuditTemplate
-from ..schemas import TemplateVersionResponse
+from ..schemas import (
+    TemplateVersionDiff,
+    TemplateVersionResponse,
+    TemplateVersionSummary,
+)
 from ..auth import get_current_user
+from ..pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from .. import events, rollups, version_store
 
 router = APIRouter(prefix="/audit/templates/{template_id}/versions", tags=["versions"])
 
@@ -27,9 +35,131 @@ def list_versions(
         .order_by(TemplateVersion.version.desc())
         .all()
     )
+    version_store.load_contents(db, versions)
     return versions
 
 
+@router.get("/summary", response_model=List[TemplateVersionSummary])
+def list_version_summaries(
+    template_id: int,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    List a template's versions without their content, newest first. Pass the
+    X-Next-Cursor response header back as ``cursor`` for the next page.
+    """
+    template = db.query(AuditTemplate).filter(AuditTemplate.id == template_id).first()
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+
+    query = (
+        db.query(TemplateVersion)
+        .options(load_only(
+            TemplateVersion.template_id,
+            TemplateVersion.version,
+            TemplateVersion.name,
+            TemplateVersion.status,
+            TemplateVersion.changed_by,
+            TemplateVersion.created_at,
+            TemplateVersion.content_size,
+            TemplateVersion.content_hash,
+        ))
+        .filter(TemplateVersion.template_id == template_id)
+        .order_by(TemplateVersion.version.desc(), TemplateVersion.id.desc())
+    )
+    if cursor is not None:
+        position = decode_cursor(cursor)
+        try:
+            after = tuple_(int(position["version"]), int(position["id"]))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        columns = tuple_(TemplateVersion.version, TemplateVersion.id)
+        query = query.filter(columns < after)
+
+    versions = query.limit(limit + 1).all()
+    if len(versions) > limit:
+        versions = versions[:limit]
+        last = versions[-1]
+        next_cursor = encode_cursor({"version": last.version, "id": last.id})
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return versions
+
+
+@router.get("/diff", response_model=TemplateVersionDiff)
+def diff_versions(
+    template_id: int,
+    from_version: int = Query(..., alias="from"),
+    to_version: Optional[int] = Query(None, alias="to"),
+    mode: Literal["unified", "word"] = "unified",
+    context: int = Query(3, ge=0, le=100),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Diff two versions of a template, or a version against the current
+    content when ``to`` is omitted. ``unified`` returns a unified diff with
+    ``context`` lines around changes, ``word`` a list of equal, delete and
+    insert segments.
+    """
+    template = db.query(AuditTemplate).filter(AuditTemplate.id == template_id).first()
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+
+    # Contents are only loaded on a cache miss
+    numbers = [from_version] if to_version is None else [from_version, to_version]
+    versions = {
+        version.version: version
+        for version in (
+            db.query(TemplateVersion)
+            .options(
+                defer(TemplateVersion.content), defer(TemplateVersion.content_delta)
+            )
+            .filter(
+                TemplateVersion.template_id == template_id,
+                TemplateVersion.version.in_(numbers),
+            )
+            .order_by(TemplateVersion.id)
+        )
+    }
+    if any(number not in versions for number in numbers):
+        raise HTTPException(status_code=404, detail="Version not found")
+    old = versions[from_version]
+    new = versions[to_version] if to_version is not None else None
+    old_label = f"v{from_version}"
+    new_label = f"v{to_version}" if new is not None else "current"
+
+    def compute():
+        version_store.load_contents(db, versions.values())
+        new_content = new.content if new is not None else template.content
+        if mode == "word":
+            return version_store.word_diff(old.content, new_content)
+        return version_store.unified_diff(
+            old.content, new_content, old_label, new_label, context
+        )
+
+    if new is not None:
+        new_hash = new.content_hash
+    else:
+        new_hash = version_store.content_hash(template.content)
+    params = {"from": old.content_hash, "to": new_hash, "mode": mode}
+    if mode == "unified":
+        params.update(labels=[old_label, new_label], context=context)
+    result = diff_cache.get_or_compute("diff", params, compute)
+
+    return TemplateVersionDiff(
+        template_id=template_id,
+        from_version=from_version,
+        to_version=to_version,
+        mode=mode,
+        diff=result if mode == "unified" else None,
+        segments=result if mode == "word" else None,
+    )
+
+
 @router.get("/{version_number}", response_model=TemplateVersionResponse)
 def get_version(
     template_id: int,
@@ -48,7 +178,7 @@ def get_version(
     )
     if not version:
         raise HTTPException(status_code=404, detail="Version not found")
-    return version
+    return version_store.load_content(db, version)
 
 
 @router.post("/{version_number}/restore", status_code=status.HTTP_200_OK)
@@ -73,27 +203,29 @@ def restore_version(
     )
     if not version:
         raise HTTPException(status_code=404, detail="Version not found")
+    version_store.load_content(db, version)
 
     # Create version snapshot of current state before restoring
-    current_snapshot = TemplateVersion(
-        template_id=template.id,
-        version=template.version,
-        name=template.name,
-        description=template.description,
-        content=template.content,
-        tags=template.tags,
-        status=template.status,
-        changed_by=current_user.get("preferred_username", current_user.get("email", "Unknown")),
+    current_snapshot = version_store.create_snapshot(
+        db,
+        template,
+        current_user.get("preferred_username", current_user.get("email", "Unknown")),
     )
-    db.add(current_snapshot)
 
     # Restore to selected version
+    rollups.template_status_changed(db, template.status, version.status)
     template.name = version.name
     template.description = version.description
     template.content = version.content
     template.tags = version.tags
     template.status = version.status
     template.version += 1
+    events.publish_on_commit(db, events.activity_event("template_updated", None, {
+        "template_id": template.id,
+        "previous_version": current_snapshot.version,
+        "name": current_snapshot.name,
+        "changed_by": current_snapshot.changed_by,
+    }))
 
     db.commit()
     db.refresh(template)
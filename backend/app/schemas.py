@@ -10,6 +10,13 @@ class TemplateStatus(str, Enum):
     ARCHIVED = "archived"
 
 
+class ReportStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
 class AuditTemplateBase(BaseModel):
     name: str
     description: Optional[str] = None
@@ -40,10 +47,17 @@ class AuditTemplateResponse(AuditTemplateBase):
         from_attributes = True
 
 
+class TagFacet(BaseModel):
+    tag: str
+    count: int
+
+
 class AuditReportCreate(BaseModel):
     template_id: int
     title: str
     due_date: Optional[datetime] = None
+    # Copy the template's checklists onto the new report
+    instantiate_checklists: bool = False
 
 
 class AuditReportResponse(BaseModel):
@@ -52,7 +66,11 @@ class AuditReportResponse(BaseModel):
     title: str
     generated_by: str
     due_date: Optional[datetime] = None
+    template_version: Optional[int] = None
+    status: ReportStatus
+    error: Optional[str] = None
     created_at: datetime
+    completed_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -80,6 +98,8 @@ class TemplateVersionResponse(BaseModel):
     name: str
     description: Optional[str] = None
     content: str
+    content_size: int
+    content_hash: str
     tags: List[str] = []
     status: str
     changed_by: str
@@ -89,6 +109,36 @@ class TemplateVersionResponse(BaseModel):
         from_attributes = True
 
 
+class TemplateVersionSummary(BaseModel):
+    id: int
+    template_id: int
+    version: int
+    name: str
+    status: str
+    changed_by: str
+    created_at: datetime
+    content_size: int
+    content_hash: str
+
+    class Config:
+        from_attributes = True
+
+
+class DiffSegment(BaseModel):
+    op: str
+    text: str
+
+
+class TemplateVersionDiff(BaseModel):
+    template_id: int
+    from_version: int
+    # None when compared with the template's current content
+    to_version: Optional[int] = None
+    mode: str
+    diff: Optional[str] = None
+    segments: Optional[List[DiffSegment]] = None
+
+
 class AttachmentResponse(BaseModel):
     id: int
     template_id: Optional[int] = None
@@ -96,6 +146,8 @@ class AttachmentResponse(BaseModel):
     filename: str
     original_filename: str
     file_size: int
+    stored_size: int
+    content_encoding: Optional[str] = None
     mime_type: str
     uploaded_by: str
     created_at: datetime
@@ -104,12 +156,39 @@ class AttachmentResponse(BaseModel):
         from_attributes = True
 
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    mime_type: Optional[str] = None
+    total_size: Optional[int] = None
+
+
+class UploadPartResponse(BaseModel):
+    part_number: int
+    size: int
+
+
+class UploadSessionResponse(BaseModel):
+    id: str
+    template_id: Optional[int] = None
+    report_id: Optional[int] = None
+    original_filename: str
+    mime_type: str
+    total_size: Optional[int] = None
+    created_by: str
+    created_at: datetime
+    parts: List[UploadPartResponse] = []
+
+    class Config:
+        from_attributes = True
+
+
 class ChecklistItemCreate(BaseModel):
     title: str
     description: Optional[str] = None
     is_mandatory: bool = False
     order: int = 0
     depends_on_id: Optional[int] = None
+    depends_on_ids: List[int] = []
     due_date: Optional[datetime] = None
 
 
@@ -119,10 +198,22 @@ class ChecklistItemUpdate(BaseModel):
     is_completed: Optional[bool] = None
     is_mandatory: Optional[bool] = None
     order: Optional[int] = None
+    # Setting either replaces all dependencies of the item
     depends_on_id: Optional[int] = None
+    depends_on_ids: Optional[List[int]] = None
     due_date: Optional[datetime] = None
 
 
+class ChecklistItemBulkCreate(ChecklistItemCreate):
+    # Positions of other items in the same request, besides depends_on_ids
+    depends_on_index: Optional[int] = None
+    depends_on_indexes: List[int] = []
+
+
+class ChecklistItemBulkUpdate(ChecklistItemUpdate):
+    id: int
+
+
 class ChecklistItemResponse(BaseModel):
     id: int
     checklist_id: int
@@ -132,6 +223,7 @@ class ChecklistItemResponse(BaseModel):
     is_mandatory: bool
     order: int
     depends_on_id: Optional[int] = None
+    depends_on_ids: List[int] = []
     completed_by: Optional[str] = None
     completed_at: Optional[datetime] = None
     due_date: Optional[datetime] = None
@@ -141,6 +233,37 @@ class ChecklistItemResponse(BaseModel):
         from_attributes = True
 
 
+class ChecklistGraphItem(BaseModel):
+    id: int
+    title: str
+    is_completed: bool
+    is_mandatory: bool
+    depends_on_ids: List[int]
+    # Incomplete dependencies
+    blocked_by: List[int]
+
+
+class ChecklistGraphResponse(BaseModel):
+    checklist_id: int
+    # Item ids, dependencies first
+    order: List[int]
+    actionable: List[int]
+    blocked: List[int]
+    # Items on or behind a dependency cycle, left out of the order
+    cyclic: List[int] = []
+    items: List[ChecklistGraphItem]
+
+
+class ChecklistProgress(BaseModel):
+    checklist_id: int
+    total_items: int
+    completed_items: int
+    mandatory_items: int
+    completed_mandatory: int
+    completion_percentage: float
+    mandatory_completion_percentage: float
+
+
 class ChecklistCreate(BaseModel):
     name: str
     description: Optional[str] = None
@@ -161,3 +284,12 @@ class ChecklistResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class SearchResult(BaseModel):
+    kind: str
+    id: int
+    template_id: int
+    title: str
+    rank: float
+    snippet: str
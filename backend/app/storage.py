@@ -0,0 +1,610 @@
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from pydantic_settings import BaseSettings
+from sqlalchemy import delete, event, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import rollups
+from .database import SessionLocal
+from .models import Attachment, AttachmentBlob, UploadSession
+
+logger = logging.getLogger(__name__)
+
+
+class StorageSettings(BaseSettings):
+    upload_dir: str = "uploads"
+    upload_chunk_size: int = 1024 * 1024
+    max_upload_size: int = 1024 * 1024 * 1024
+    compress_attachments: bool = False
+    compression_level: int = 6
+    # Unfinished multi-part uploads are discarded this long after their last part
+    upload_session_ttl_hours: float = 24.0
+    compressible_mime_types: List[str] = [
+        "text/*",
+        "application/json",
+        "application/xml",
+        "application/x-ndjson",
+        "application/csv",
+        "application/sql",
+    ]
+
+    model_config = {"env_file": ".env", "extra": "ignore"}
+
+
+storage_settings = StorageSettings()
+
+# Create uploads directory if it doesn't exist
+UPLOAD_DIR = Path(storage_settings.upload_dir)
+UPLOAD_DIR.mkdir(exist_ok=True)
+
+# Attachment contents are stored once per SHA-256 under blobs/ab/cd/<hash>
+BLOB_DIR = UPLOAD_DIR / "blobs"
+TMP_DIR = UPLOAD_DIR / "tmp"
+SESSION_DIR = UPLOAD_DIR / "sessions"
+BLOB_DIR.mkdir(exist_ok=True)
+TMP_DIR.mkdir(exist_ok=True)
+SESSION_DIR.mkdir(exist_ok=True)
+
+
+class StoredFile(NamedTuple):
+    filename: str
+    path: Path
+    size: int
+    content_hash: str
+    content_encoding: Optional[str]
+    stored_size: int
+
+
+def should_compress(mime_type: Optional[str]) -> bool:
+    """Whether new uploads of this MIME type are gzip-compressed at rest."""
+    if not storage_settings.compress_attachments or not mime_type:
+        return False
+    mime_type = mime_type.split(";")[0].strip().lower()
+    for pattern in storage_settings.compressible_mime_types:
+        if pattern == mime_type or (
+            pattern.endswith("/*") and mime_type.startswith(pattern[:-1])
+        ):
+            return True
+    return False
+
+
+def _gzip_compressor():
+    # wbits=31 writes a gzip container, which clients accept as Content-Encoding: gzip
+    return zlib.compressobj(storage_settings.compression_level, zlib.DEFLATED, 31)
+
+
+def blob_path(content_hash: str) -> Path:
+    return BLOB_DIR / content_hash[:2] / content_hash[2:4] / content_hash
+
+
+def _remove_quietly(path: Path) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _move_into_place(tmp_path: Path, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp_path, path)
+
+
+async def _iter_upload(file: UploadFile) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(storage_settings.upload_chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _stream_upload(
+    chunks: AsyncIterator[bytes], tmp_path: Optional[Path], compress: bool = False
+):
+    """
+    Consume an upload chunk by chunk, hashing the original bytes as it goes.
+    The data is written to ``tmp_path`` (gzip-compressed if ``compress``)
+    unless it is None. Returns (sha256, size, stored size).
+    """
+    digest = hashlib.sha256()
+    compressor = _gzip_compressor() if compress else None
+    size = 0
+    stored_size = 0
+    out = await run_in_threadpool(open, tmp_path, "wb") if tmp_path else None
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            max_size = storage_settings.max_upload_size
+            if size > max_size:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File exceeds the maximum upload size of {max_size} bytes",
+                )
+            digest.update(chunk)
+            if out:
+                data = compressor.compress(chunk) if compressor else chunk
+                stored_size += len(data)
+                await run_in_threadpool(out.write, data)
+        if out and compressor:
+            data = compressor.flush()
+            stored_size += len(data)
+            await run_in_threadpool(out.write, data)
+    finally:
+        if out:
+            await run_in_threadpool(out.close)
+    return digest.hexdigest(), size, stored_size if out else size
+
+
+def _claim_blob(
+    db: Session,
+    content_hash: str,
+    size: int,
+    content_encoding: Optional[str],
+    stored_size: int,
+):
+    """
+    Add a reference to a blob, creating its row if needed. Returns the blob's
+    (ref count, content encoding, stored size) after the claim.
+    """
+    stmt = (
+        insert(AttachmentBlob)
+        .values(
+            content_hash=content_hash,
+            file_path=str(blob_path(content_hash)),
+            file_size=size,
+            content_encoding=content_encoding,
+            stored_size=stored_size,
+            ref_count=1,
+        )
+        .on_conflict_do_update(
+            index_elements=[AttachmentBlob.content_hash],
+            set_={"ref_count": AttachmentBlob.ref_count + 1},
+        )
+        .returning(
+            AttachmentBlob.ref_count,
+            AttachmentBlob.content_encoding,
+            AttachmentBlob.stored_size,
+        )
+    )
+    claim = db.execute(stmt).one()
+    if claim.ref_count == 1:
+        rollups.add_counter(db, rollups.STORAGE_BYTES, claim.stored_size)
+    return claim
+
+
+async def save_upload(
+    db: Session, file: UploadFile, expected_hash: Optional[str] = None
+) -> StoredFile:
+    """
+    Stream an upload into the content-addressed blob store.
+
+    Memory use is bounded by ``upload_chunk_size`` whatever the file size, and
+    disk writes run in the threadpool so the event loop is never blocked. New
+    content goes to a temporary file that is renamed into its blob path once
+    complete; content that is already stored only gains a reference. When the
+    client announces an ``expected_hash`` that is already known, the upload is
+    only hashed to verify it and never written.
+
+    The blob reference is added to ``db`` but not committed.
+    """
+    claimed = False
+    if expected_hash:
+        expected_hash = expected_hash.lower()
+        known = (
+            db.query(AttachmentBlob.content_hash)
+            .filter(AttachmentBlob.content_hash == expected_hash)
+            .first()
+        )
+        if known and os.path.exists(blob_path(expected_hash)):
+            content_hash, size, _ = await _stream_upload(_iter_upload(file), None)
+            if content_hash != expected_hash:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Uploaded content does not match the declared SHA-256",
+                )
+            ref_count, content_encoding, stored_size = _claim_blob(
+                db, content_hash, size, None, size
+            )
+            if ref_count > 1:
+                return StoredFile(
+                    content_hash, blob_path(content_hash), size, content_hash,
+                    content_encoding, stored_size,
+                )
+            # The blob was released while we were hashing; write it after all
+            claimed = True
+            await file.seek(0)
+
+    compress = should_compress(file.content_type)
+    tmp_path = TMP_DIR / f"{uuid.uuid4()}.part"
+    try:
+        content_hash, size, stored_size = await _stream_upload(
+            _iter_upload(file), tmp_path, compress
+        )
+        if expected_hash and content_hash != expected_hash:
+            raise HTTPException(
+                status_code=400,
+                detail="Uploaded content does not match the declared SHA-256",
+            )
+        return await _store_staged(
+            db, tmp_path, content_hash, size, "gzip" if compress else None,
+            stored_size, claimed,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    finally:
+        await run_in_threadpool(_remove_quietly, tmp_path)
+
+
+async def _store_staged(
+    db: Session,
+    tmp_path: Path,
+    content_hash: str,
+    size: int,
+    content_encoding: Optional[str],
+    stored_size: int,
+    claimed: bool = False,
+) -> StoredFile:
+    """
+    Move a fully written temporary file into the blob store unless the same
+    content is already there, in which case the stored copy (and its
+    encoding) is reused.
+    """
+    path = blob_path(content_hash)
+    if claimed:
+        is_new = True
+    else:
+        ref_count, blob_encoding, blob_stored_size = _claim_blob(
+            db, content_hash, size, content_encoding, stored_size
+        )
+        is_new = ref_count == 1
+    if is_new or not os.path.exists(path):
+        await run_in_threadpool(_move_into_place, tmp_path, path)
+        if claimed or not is_new:
+            db.execute(
+                update(AttachmentBlob)
+                .where(AttachmentBlob.content_hash == content_hash)
+                .values(content_encoding=content_encoding, stored_size=stored_size)
+            )
+            # A claimed blob was recorded with its uncompressed size
+            previous_size = size if claimed else blob_stored_size
+            rollups.add_counter(db, rollups.STORAGE_BYTES, stored_size - previous_size)
+        return StoredFile(
+            content_hash, path, size, content_hash, content_encoding, stored_size
+        )
+    return StoredFile(
+        content_hash, path, size, content_hash, blob_encoding, blob_stored_size
+    )
+
+
+def _session_dir(session_id: str) -> Path:
+    return SESSION_DIR / session_id
+
+
+def list_upload_parts(session_id: str) -> List[Tuple[int, int]]:
+    """Return (part number, size) for every part received so far, in order."""
+    parts = []
+    for path in _session_dir(session_id).glob("*.part"):
+        parts.append((int(path.stem), path.stat().st_size))
+    return sorted(parts)
+
+
+async def save_upload_part(
+    session_id: str, part_number: int, chunks: AsyncIterator[bytes]
+) -> int:
+    """
+    Stream one part of a resumable upload to disk and return its size. Parts
+    may arrive in any order or concurrently; re-sending a part replaces it.
+    """
+    directory = _session_dir(session_id)
+    await run_in_threadpool(directory.mkdir, parents=True, exist_ok=True)
+    tmp_path = directory / f"{part_number}.{uuid.uuid4()}.tmp"
+    try:
+        _, size, _ = await _stream_upload(chunks, tmp_path)
+        await run_in_threadpool(os.replace, tmp_path, directory / f"{part_number}.part")
+    finally:
+        await run_in_threadpool(_remove_quietly, tmp_path)
+    return size
+
+
+def _assemble_parts(paths: List[Path], tmp_path: Path, compress: bool):
+    digest = hashlib.sha256()
+    compressor = _gzip_compressor() if compress else None
+    size = 0
+    stored_size = 0
+    with open(tmp_path, "wb") as out:
+        for path in paths:
+            with open(path, "rb") as part:
+                while chunk := part.read(storage_settings.upload_chunk_size):
+                    size += len(chunk)
+                    digest.update(chunk)
+                    data = compressor.compress(chunk) if compressor else chunk
+                    stored_size += len(data)
+                    out.write(data)
+        if compressor:
+            data = compressor.flush()
+            stored_size += len(data)
+            out.write(data)
+    return digest.hexdigest(), size, stored_size
+
+
+async def store_upload_parts(
+    db: Session, session_id: str, part_numbers: List[int], mime_type: Optional[str]
+) -> StoredFile:
+    """
+    Concatenate the given parts, in order, into the blob store. Not committed;
+    the parts are left in place until discard_upload_parts is called.
+    """
+    directory = _session_dir(session_id)
+    paths = [directory / f"{number}.part" for number in part_numbers]
+    compress = should_compress(mime_type)
+    tmp_path = TMP_DIR / f"{uuid.uuid4()}.part"
+    try:
+        content_hash, size, stored_size = await run_in_threadpool(
+            _assemble_parts, paths, tmp_path, compress
+        )
+        max_size = storage_settings.max_upload_size
+        if size > max_size:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File exceeds the maximum upload size of {max_size} bytes",
+            )
+        return await _store_staged(
+            db, tmp_path, content_hash, size, "gzip" if compress else None, stored_size
+        )
+    finally:
+        await run_in_threadpool(_remove_quietly, tmp_path)
+
+
+def discard_upload_parts(session_id: str) -> None:
+    shutil.rmtree(_session_dir(session_id), ignore_errors=True)
+
+
+def upload_session_cutoff() -> datetime:
+    """Sessions without a part received since this have expired."""
+    ttl = timedelta(hours=storage_settings.upload_session_ttl_hours)
+    return datetime.utcnow() - ttl
+
+
+def expire_upload_sessions(db: Session) -> int:
+    """
+    Delete expired upload sessions, then remove the part directories of
+    sessions that no longer exist: expired ones, and those of sessions the
+    database deleted along with their template or report. Directories of
+    unknown sessions are only removed once older than the TTL, so a session
+    created meanwhile keeps its parts. Commits; returns the directories removed.
+    """
+    cutoff = upload_session_cutoff()
+    expired = set(db.execute(
+        delete(UploadSession)
+        .where(UploadSession.updated_at < cutoff)
+        .returning(UploadSession.id)
+    ).scalars().all())
+    db.commit()
+    live = {session_id for (session_id,) in db.query(UploadSession.id)}
+    db.rollback()
+    stale_before = time.time() - storage_settings.upload_session_ttl_hours * 3600
+    removed = 0
+    for directory in SESSION_DIR.iterdir():
+        if directory.name in live:
+            continue
+        try:
+            mtime = directory.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        if directory.name in expired or mtime < stale_before:
+            discard_upload_parts(directory.name)
+            removed += 1
+    return removed
+
+
+def _remove_on_commit(db: Session, path) -> None:
+    """Unlink a file once ``db`` commits; nothing happens if it rolls back."""
+    try:
+        inode = os.stat(path).st_ino
+    except FileNotFoundError:
+        return
+    db.info.setdefault("remove_files", []).append((str(path), inode))
+
+
+@event.listens_for(Session, "after_commit")
+def _remove_after_commit(session: Session) -> None:
+    for path, inode in session.info.pop("remove_files", ()):
+        try:
+            # A blob uploaded again since it was released is a new file; keep it
+            if os.stat(path).st_ino == inode:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("Failed to delete file from disk: %s", e)
+
+
+@event.listens_for(Session, "after_rollback")
+def _keep_files(session: Session) -> None:
+    session.info.pop("remove_files", None)
+
+
+def release_file(
+    db: Session, content_hash: Optional[str], file_path: str, stored_size: int
+) -> None:
+    """
+    Drop one reference to a stored file once its attachment row has been
+    deleted and flushed. A blob is unlinked only when its last attachment goes
+    away, and only once ``db`` commits. Not committed.
+    """
+    if not content_hash:
+        rollups.add_counter(db, rollups.STORAGE_BYTES, -stored_size)
+        # Attachments uploaded before the blob store own their file
+        _remove_on_commit(db, file_path)
+        return
+
+    remaining = db.execute(
+        update(AttachmentBlob)
+        .where(AttachmentBlob.content_hash == content_hash)
+        .values(ref_count=AttachmentBlob.ref_count - 1)
+        .returning(AttachmentBlob.ref_count, AttachmentBlob.stored_size)
+    ).one_or_none()
+    if remaining is not None and remaining.ref_count <= 0:
+        # The row stays locked until commit, so a concurrent upload of the
+        # same content waits and then recreates the blob.
+        db.execute(
+            delete(AttachmentBlob).where(AttachmentBlob.content_hash == content_hash)
+        )
+        rollups.add_counter(db, rollups.STORAGE_BYTES, -remaining.stored_size)
+        _remove_on_commit(db, blob_path(content_hash))
+
+
+def delete_attachment(db: Session, attachment: Attachment) -> None:
+    """Delete an attachment row and release its stored file. Not committed."""
+    content_hash = attachment.content_hash
+    file_path, stored_size = attachment.file_path, attachment.stored_size
+    rollups.attachment_deleted(db, attachment)
+    db.delete(attachment)
+    db.flush()
+    release_file(db, content_hash, file_path, stored_size)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # GET uses weak comparison, so W/ prefixes are ignored
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag == "*" or tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _not_modified_since(if_modified_since: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since.timestamp()
+
+
+def _accepts_gzip(request: Request) -> bool:
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            quality = params.replace(" ", "").lower()
+            return quality not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def _iter_decompressed(path: str) -> Iterator[bytes]:
+    chunk_size = storage_settings.upload_chunk_size
+    decompressor = zlib.decompressobj(31)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            data = decompressor.decompress(chunk, chunk_size)
+            while data:
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def _content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def attachment_file_response(request: Request, attachment: Attachment) -> Response:
+    """
+    Serve an attachment with validators and conditional GET support.
+
+    The strong ETag is the content hash for blob-stored files, or size and
+    mtime for older ones. ``If-None-Match`` takes precedence over
+    ``If-Modified-Since``; either can answer 304 without sending the body.
+    Byte ranges (including multi-range and ``If-Range``) are handled by
+    FileResponse using the same ETag.
+
+    Compressed attachments are sent as stored with ``Content-Encoding: gzip``
+    when the client accepts it (ranges then apply to the encoded bytes), and
+    are decompressed on the fly otherwise.
+    """
+    try:
+        stat_result = os.stat(attachment.file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found on disk")
+
+    if attachment.content_hash:
+        etag = attachment.content_hash
+    else:
+        etag = f"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"
+    headers = {
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+    encoded = attachment.content_encoding == "gzip"
+    send_encoded = encoded and _accepts_gzip(request)
+    if encoded:
+        headers["Vary"] = "Accept-Encoding"
+        if send_encoded:
+            # Each representation needs its own strong validator
+            etag = f"{etag}-gzip"
+    etag = f'"{etag}"'
+    headers["ETag"] = etag
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif if_modified_since is not None:
+        if _not_modified_since(if_modified_since, stat_result.st_mtime):
+            return Response(status_code=304, headers=headers)
+
+    if encoded and not send_encoded:
+        headers["Content-Disposition"] = _content_disposition(
+            attachment.original_filename
+        )
+        headers["Content-Length"] = str(attachment.file_size)
+        return StreamingResponse(
+            _iter_decompressed(attachment.file_path),
+            media_type=attachment.mime_type,
+            headers=headers,
+        )
+
+    if send_encoded:
+        headers["Content-Encoding"] = "gzip"
+    return FileResponse(
+        path=attachment.file_path,
+        filename=attachment.original_filename,
+        media_type=attachment.mime_type,
+        headers=headers,
+        stat_result=stat_result,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the attachment store")
+    parser.add_argument("command", choices=["expire-uploads"])
+    parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        removed = expire_upload_sessions(db)
+    finally:
+        db.close()
+    print(f"Removed the parts of {removed} expired or orphaned upload sessions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Retention policy for template version history.
+
+A version is kept if any of these holds, and pruned otherwise:
+
+- it is one of the ``VERSION_RETENTION_KEEP_LAST`` newest versions of its
+  template, or younger than ``VERSION_RETENTION_DAILY_AFTER_DAYS``;
+- it is the newest version of its day (once older than the daily
+  threshold) or of its ISO week (once older than
+  ``VERSION_RETENTION_WEEKLY_AFTER_DAYS``);
+- a report was generated from it (``audit_reports.template_version``);
+- it is its template's latest keyframe, which new versions are encoded
+  against.
+
+Compaction runs one template at a time in short transactions of at most
+``VERSION_COMPACTION_BATCH_SIZE`` deletions: first the pruned deltas, then
+the pruned keyframes. Before a keyframe goes, the oldest version still
+based on it is rewritten as a keyframe and the others are re-encoded
+against that one. Run it periodically (e.g. nightly from cron)::
+
+    python -m app.version_retention compact [--dry-run]
+
+The bytes reported are column data; VACUUM makes the space reusable.
+"""
+import argparse
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from .database import engine
+from .models import AuditReport, TemplateVersion
+from .version_store import (
+    DELTA_ENCODING,
+    apply_delta,
+    encode_delta,
+    keyframe_cache,
+    version_settings,
+)
+
+# Key of the advisory lock held while compacting, so runs never overlap
+COMPACTION_LOCK_KEY = 7320419
+
+_STORED_SIZE = (
+    func.coalesce(func.pg_column_size(TemplateVersion.content), 0)
+    + func.coalesce(func.pg_column_size(TemplateVersion.content_delta), 0)
+)
+
+
+@dataclass
+class CompactionStats:
+    templates: int = 0
+    pruned: int = 0
+    rewritten: int = 0
+    bytes_reclaimed: int = 0
+
+
+def select_prunable(versions: Sequence, protected_versions: set, now: datetime) -> list:
+    """
+    Apply the retention policy to one template's versions, given newest
+    first with id, version, created_at and content_encoding.
+    """
+    daily_cutoff = now - timedelta(
+        days=version_settings.version_retention_daily_after_days
+    )
+    weekly_cutoff = now - timedelta(
+        days=version_settings.version_retention_weekly_after_days
+    )
+    latest_keyframe = next(
+        (version.id for version in versions if version.content_encoding is None), None
+    )
+    seen_buckets = set()
+    prunable = []
+    for index, version in enumerate(versions):
+        created_at = version.created_at or datetime.min
+        if created_at < weekly_cutoff:
+            bucket = ("week", *created_at.isocalendar()[:2])
+        elif created_at < daily_cutoff:
+            bucket = ("day", created_at.date())
+        else:
+            bucket = None
+        keep = (
+            index < version_settings.version_retention_keep_last
+            or bucket is None
+            or bucket not in seen_buckets
+            or version.version in protected_versions
+            or version.id == latest_keyframe
+        )
+        if bucket is not None:
+            seen_buckets.add(bucket)
+        if not keep:
+            prunable.append(version)
+    return prunable
+
+
+def _stored_bytes(db: Session, version_ids: List[int]) -> int:
+    if not version_ids:
+        return 0
+    total = func.coalesce(func.sum(_STORED_SIZE), 0)
+    return db.query(total).filter(TemplateVersion.id.in_(version_ids)).scalar()
+
+
+def _delete(db: Session, version_ids: List[int]) -> int:
+    """Delete versions and return the bytes they held."""
+    freed = _stored_bytes(db, version_ids)
+    db.query(TemplateVersion).filter(TemplateVersion.id.in_(version_ids)).delete(synchronize_session=False)
+    for version_id in version_ids:
+        keyframe_cache.discard(version_id)
+    return freed
+
+
+def _rebase_dependents(db: Session, keyframe_ids: List[int]) -> Tuple[int, int]:
+    """
+    Make the remaining versions based on ``keyframe_ids`` independent of
+    them. Returns how many were rewritten and the bytes this added.
+    """
+    dependents = (
+        db.query(
+            TemplateVersion.id,
+            TemplateVersion.version,
+            TemplateVersion.base_version_id,
+            TemplateVersion.content_delta,
+        )
+        .filter(TemplateVersion.base_version_id.in_(keyframe_ids))
+        .order_by(
+            TemplateVersion.base_version_id, TemplateVersion.version, TemplateVersion.id
+        )
+        .all()
+    )
+    if not dependents:
+        return 0, 0
+    dependent_ids = [dependent.id for dependent in dependents]
+    before = _stored_bytes(db, dependent_ids)
+    keyframes: Dict[int, str] = dict(
+        db.query(TemplateVersion.id, TemplateVersion.content)
+        .filter(TemplateVersion.id.in_(keyframe_ids))
+        .all()
+    )
+    new_keyframe: Dict[int, tuple] = {}
+    for dependent in dependents:
+        base = keyframes[dependent.base_version_id]
+        content = apply_delta(base, dependent.content_delta)
+        promoted = new_keyframe.get(dependent.base_version_id)
+        values = {
+            "content": content,
+            "content_encoding": None,
+            "base_version_id": None,
+            "content_delta": None,
+        }
+        if promoted is None:
+            new_keyframe[dependent.base_version_id] = (dependent.id, content)
+        else:
+            delta = encode_delta(promoted[1], content)
+            if len(delta) < len(content.encode()):
+                values = {
+                    "content": None,
+                    "content_encoding": DELTA_ENCODING,
+                    "base_version_id": promoted[0],
+                    "content_delta": delta,
+                }
+        query = db.query(TemplateVersion).filter(TemplateVersion.id == dependent.id)
+        query.update(values, synchronize_session=False)
+    return len(dependents), _stored_bytes(db, dependent_ids) - before
+
+
+def _batches(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def compact_template(
+    db: Session,
+    template_id: int,
+    stats: CompactionStats,
+    now: datetime,
+    dry_run: bool = False,
+) -> None:
+    versions = (
+        db.query(
+            TemplateVersion.id,
+            TemplateVersion.version,
+            TemplateVersion.created_at,
+            TemplateVersion.content_encoding,
+        )
+        .filter(TemplateVersion.template_id == template_id)
+        .order_by(TemplateVersion.version.desc(), TemplateVersion.id.desc())
+        .all()
+    )
+    reports = db.query(AuditReport.template_version).filter(
+        AuditReport.template_id == template_id,
+        AuditReport.template_version.isnot(None),
+    )
+    protected = {number for (number,) in reports.distinct()}
+    prunable = select_prunable(versions, protected, now)
+    if not prunable:
+        db.rollback()
+        return
+    stats.templates += 1
+    if dry_run:
+        stats.pruned += len(prunable)
+        stats.bytes_reclaimed += _stored_bytes(db, [version.id for version in prunable])
+        db.rollback()
+        return
+
+    batch_size = version_settings.version_compaction_batch_size
+    deltas = [
+        version.id for version in prunable if version.content_encoding == DELTA_ENCODING
+    ]
+    keyframes = [
+        version.id for version in prunable if version.content_encoding != DELTA_ENCODING
+    ]
+    for batch in _batches(deltas, batch_size):
+        stats.bytes_reclaimed += _delete(db, batch)
+        stats.pruned += len(batch)
+        db.commit()
+    for batch in _batches(keyframes, batch_size):
+        rewritten, added = _rebase_dependents(db, batch)
+        stats.bytes_reclaimed += _delete(db, batch) - added
+        stats.pruned += len(batch)
+        stats.rewritten += rewritten
+        db.commit()
+
+
+def compact(
+    db: Session, template_id: Optional[int] = None, dry_run: bool = False
+) -> CompactionStats:
+    """Apply the retention policy to every template (or just ``template_id``)."""
+    stats = CompactionStats()
+    now = datetime.utcnow()
+    query = db.query(TemplateVersion.template_id).group_by(TemplateVersion.template_id)
+    if template_id is not None:
+        query = query.filter(TemplateVersion.template_id == template_id)
+    else:
+        query = query.having(
+            func.count() > version_settings.version_retention_keep_last
+        )
+    query = query.order_by(TemplateVersion.template_id)
+    template_ids = [row.template_id for row in query]
+    db.rollback()
+    for candidate in template_ids:
+        compact_template(db, candidate, stats, now, dry_run)
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prune template version history")
+    parser.add_argument("command", choices=["compact"])
+    parser.add_argument(
+        "--dry-run", action="store_true", help="report what would be pruned"
+    )
+    parser.add_argument("--template-id", type=int, help="only compact this template")
+    args = parser.parse_args()
+
+    # A dedicated connection, so the advisory lock lasts across the batches
+    with engine.connect() as connection:
+        params = {"key": COMPACTION_LOCK_KEY}
+        locked = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), params)
+        if not locked.scalar():
+            raise SystemExit("Another compaction is running")
+        connection.commit()
+        try:
+            with Session(bind=connection) as db:
+                stats = compact(db, args.template_id, args.dry_run)
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), params)
+            connection.commit()
+
+    verb = "Would prune" if args.dry_run else "Pruned"
+    print(
+        f"{verb} {stats.pruned} versions of {stats.templates} templates "
+        f"({stats.rewritten} rewritten), {stats.bytes_reclaimed} bytes reclaimed"
+    )
+
+
+if __name__ == "__main__":
+    main()
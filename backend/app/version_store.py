@@ -0,0 +1,264 @@
+"""
+Delta-compressed storage of template version history.
+
+A TemplateVersion is either a keyframe, holding its full ``content``, or a
+delta: ``content`` is NULL and ``content_delta`` holds the zlib-compressed
+line diff from the keyframe ``base_version_id`` of the same template. A new
+keyframe is written every ``version_keyframe_interval`` versions (or sooner
+if a delta would not be smaller than the text), so any version is rebuilt
+from one keyframe and one delta. Keyframes never change, and the most
+recently used ones are cached per process.
+
+Read versions through ``load_content``/``load_contents``, which fill in
+``content`` on delta versions. With ``VERSION_STORAGE=full`` new versions
+are stored whole again; existing deltas stay readable.
+
+``unified_diff`` and ``word_diff`` compare two contents for the version diff
+endpoint.
+"""
+import difflib
+import hashlib
+import json
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from pydantic_settings import BaseSettings
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .models import AuditTemplate, TemplateVersion
+
+DELTA_ENCODING = "delta"
+
+
+class VersionSettings(BaseSettings):
+    version_storage: str = "delta"
+    version_keyframe_interval: int = 20
+    version_keyframe_cache_size: int = 256
+    # Retention, applied by ``python -m app.version_retention compact``
+    version_retention_keep_last: int = 50
+    version_retention_daily_after_days: int = 30
+    version_retention_weekly_after_days: int = 180
+    version_compaction_batch_size: int = 500
+
+    model_config = {"env_file": ".env", "extra": "ignore"}
+
+
+version_settings = VersionSettings()
+
+
+def encode_delta(base: str, content: str) -> bytes:
+    """
+    Diff ``content`` against ``base`` line by line. The delta is a JSON list
+    in which ``[i, j]`` copies base lines i to j and a string is new text.
+    """
+    base_lines = base.splitlines(keepends=True)
+    lines = content.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(lines[j1:j2]))
+    return zlib.compress(
+        json.dumps(ops, ensure_ascii=False, separators=(",", ":")).encode(), 9
+    )
+
+
+def apply_delta(base: str, delta: bytes) -> str:
+    base_lines = base.splitlines(keepends=True)
+    return "".join(
+        op if isinstance(op, str) else "".join(base_lines[op[0]:op[1]])
+        for op in json.loads(zlib.decompress(delta))
+    )
+
+
+class KeyframeCache:
+    """Thread-safe LRU cache of keyframe contents by version id."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[int, str]" = OrderedDict()
+
+    def get(self, version_id: int) -> Optional[str]:
+        with self._lock:
+            content = self._data.get(version_id)
+            if content is not None:
+                self._data.move_to_end(version_id)
+            return content
+
+    def put(self, version_id: int, content: str) -> None:
+        with self._lock:
+            self._data[version_id] = content
+            self._data.move_to_end(version_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, version_id: int) -> None:
+        with self._lock:
+            self._data.pop(version_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+keyframe_cache = KeyframeCache(version_settings.version_keyframe_cache_size)
+
+
+def _keyframe_contents(db: Session, version_ids: Iterable[int]) -> Dict[int, str]:
+    contents = {}
+    missing = set()
+    for version_id in version_ids:
+        content = keyframe_cache.get(version_id)
+        if content is None:
+            missing.add(version_id)
+        else:
+            contents[version_id] = content
+    if missing:
+        rows = db.query(TemplateVersion.id, TemplateVersion.content).filter(
+            TemplateVersion.id.in_(missing)
+        )
+        for version_id, content in rows:
+            keyframe_cache.put(version_id, content)
+            contents[version_id] = content
+    return contents
+
+
+def load_contents(db: Session, versions: Iterable[TemplateVersion]) -> None:
+    """Rebuild the content of the delta versions among ``versions``, in place."""
+    versions = list(versions)
+    keyframes = {
+        version.id: version.content
+        for version in versions
+        if version.content_encoding is None
+    }
+    deltas = [
+        version for version in versions if version.content_encoding == DELTA_ENCODING
+    ]
+    bases = {version.base_version_id for version in deltas}
+    for version_id in bases & keyframes.keys():
+        keyframe_cache.put(version_id, keyframes[version_id])
+    keyframes.update(_keyframe_contents(db, bases - keyframes.keys()))
+    for version in deltas:
+        # Not a change to the row: the session must not write it back
+        set_committed_value(
+            version,
+            "content",
+            apply_delta(keyframes[version.base_version_id], version.content_delta),
+        )
+
+
+def load_content(db: Session, version: TemplateVersion) -> TemplateVersion:
+    load_contents(db, [version])
+    return version
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def encode_content(db: Session, version: TemplateVersion, content: str) -> None:
+    """Store ``content`` on a new version as a keyframe or a delta."""
+    version.content_size = len(content.encode())
+    version.content_hash = content_hash(content)
+    version.content = content
+    version.content_encoding = None
+    version.base_version_id = None
+    version.content_delta = None
+    if version_settings.version_storage != DELTA_ENCODING:
+        return
+    keyframe = (
+        db.query(TemplateVersion.id, TemplateVersion.version)
+        .filter(
+            TemplateVersion.template_id == version.template_id,
+            TemplateVersion.content_encoding.is_(None),
+        )
+        .order_by(TemplateVersion.version.desc(), TemplateVersion.id.desc())
+        .first()
+    )
+    interval = version_settings.version_keyframe_interval
+    if keyframe is None or version.version - keyframe.version >= interval:
+        return
+    delta = encode_delta(_keyframe_contents(db, [keyframe.id])[keyframe.id], content)
+    if len(delta) >= len(content.encode()):
+        return
+    version.content = None
+    version.content_encoding = DELTA_ENCODING
+    version.base_version_id = keyframe.id
+    version.content_delta = delta
+
+
+def create_snapshot(
+    db: Session, template: AuditTemplate, changed_by: str
+) -> TemplateVersion:
+    """Record the current state of ``template`` as a version."""
+    version = TemplateVersion(
+        template_id=template.id,
+        version=template.version,
+        name=template.name,
+        description=template.description,
+        tags=template.tags,
+        status=template.status,
+        changed_by=changed_by,
+    )
+    encode_content(db, version, template.content)
+    db.add(version)
+    return version
+
+
+def unified_diff(
+    old: str, new: str, old_label: str, new_label: str, context: int = 3
+) -> str:
+    return "".join(difflib.unified_diff(
+        old.splitlines(keepends=True),
+        new.splitlines(keepends=True),
+        old_label,
+        new_label,
+        n=context,
+    ))
+
+
+def _tokens(text: str) -> List[str]:
+    # Words with their trailing whitespace, so joining the tokens gives the text back
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+def word_diff(old: str, new: str) -> List[Dict[str, str]]:
+    """
+    Diff as ``{"op": "equal" | "delete" | "insert", "text": ...}`` segments.
+    Lines are matched first and only changed lines are diffed word by word,
+    which keeps long documents cheap to compare.
+    """
+    segments: List[Dict[str, str]] = []
+
+    def add(op: str, text: str) -> None:
+        if not text:
+            return
+        if segments and segments[-1]["op"] == op:
+            segments[-1]["text"] += text
+        else:
+            segments.append({"op": op, "text": text})
+
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    line_matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    for tag, i1, i2, j1, j2 in line_matcher.get_opcodes():
+        if tag == "equal":
+            add("equal", "".join(old_lines[i1:i2]))
+            continue
+        old_words = _tokens("".join(old_lines[i1:i2]))
+        new_words = _tokens("".join(new_lines[j1:j2]))
+        word_matcher = difflib.SequenceMatcher(None, old_words, new_words)
+        for word_tag, a1, a2, b1, b2 in word_matcher.get_opcodes():
+            if word_tag == "equal":
+                add("equal", "".join(old_words[a1:a2]))
+            else:
+                add("delete", "".join(old_words[a1:a2]))
+                add("insert", "".join(new_words[b1:b2]))
+    return segments
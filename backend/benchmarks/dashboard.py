@@ -0,0 +1,205 @@
+"""
+Benchmark /analytics/dashboard: the previous query-per-metric implementation
+against the single-round-trip query.
+
+    poetry run python -m benchmarks.dashboard --seed \\
+        --templates 100000 --reports 1000000
+
+``--seed`` bulk-inserts synthetic rows into DATABASE_URL; only run it against
+a throwaway database. The rollups are rebuilt from the base tables, and both
+implementations must agree, before anything is timed.
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import extract, func, text
+
+from app import rollups
+from app.database import SessionLocal
+from app.models import (
+    Attachment,
+    AttachmentBlob,
+    AuditReport,
+    AuditTemplate,
+    TemplateComment,
+    TemplateStatus,
+)
+from app.routers.analytics import compute_dashboard_stats
+
+
+def seed(db, templates: int, reports: int) -> None:
+    db.execute(text("""
+        INSERT INTO audit_templates (
+            name, description, content, tags, status, version, created_at, updated_at
+        )
+        SELECT 'bench-template-' || g, 'benchmark', 'content', '{}',
+               (ARRAY['draft', 'active', 'archived'])[1 + g % 3]::templatestatus, 1,
+               now() - (g % 730) * interval '1 day', now()
+        FROM generate_series(1, :n) AS g
+    """), {"n": templates})
+    db.execute(text("""
+        INSERT INTO audit_reports (template_id, title, generated_by, status, created_at)
+        SELECT t.id, 'bench-report', 'system', 'done',
+               now() - (g % 730) * interval '1 day'
+        FROM generate_series(1, :n) AS g
+        JOIN audit_templates AS t
+            ON t.id = (SELECT min(id) FROM audit_templates) + g % :templates
+    """), {"n": reports, "templates": templates})
+    db.execute(text("""
+        INSERT INTO template_comments (template_id, author, content, created_at)
+        SELECT id, 'bench', 'comment', created_at FROM audit_templates WHERE id % 7 = 0
+    """))
+    db.commit()
+    db.execute(text("ANALYZE"))
+
+
+def legacy_dashboard(db) -> dict:
+    """
+    The dashboard computed as before, with one query per metric over the base
+    tables, but with the rollup semantics (whole days, zero-filled months,
+    ties broken by id) so that the results can be compared.
+    """
+    now = datetime.utcnow()
+    recent_since = datetime.combine(
+        (now - timedelta(days=30)).date(), datetime.min.time()
+    )
+    first_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(11):
+        first_month = (first_month - timedelta(days=1)).replace(day=1)
+    months = []
+    month = first_month
+    while month <= now:
+        months.append((month.year, month.month))
+        month = (month + timedelta(days=32)).replace(day=1)
+
+    def per_month(model) -> list:
+        counts = {
+            (int(year), int(month)): count
+            for year, month, count in db.query(
+                extract("year", model.created_at).label("year"),
+                extract("month", model.created_at).label("month"),
+                func.count(model.id),
+            )
+            .filter(model.created_at >= first_month)
+            .group_by("year", "month")
+        }
+        return [
+            {
+                "year": year,
+                "month": month,
+                "count": counts.get((year, month), 0),
+                "label": f"{year}-{month:02d}",
+            }
+            for year, month in months
+        ]
+
+    def top(count_column, join, key: str) -> list:
+        rows = (
+            db.query(AuditTemplate.id, AuditTemplate.name, func.count(count_column))
+            .outerjoin(*join)
+            .group_by(AuditTemplate.id, AuditTemplate.name)
+            .order_by(func.count(count_column).desc(), AuditTemplate.id)
+            .limit(5)
+        )
+        return [
+            {"id": template_id, "name": name, key: count}
+            for template_id, name, count in rows
+        ]
+
+    by_status = dict(
+        db.query(AuditTemplate.status, func.count(AuditTemplate.id))
+        .group_by(AuditTemplate.status)
+        .all()
+    )
+    total_storage = db.query(func.coalesce(func.sum(Attachment.file_size), 0)).scalar()
+    blob_storage = db.query(
+        func.coalesce(func.sum(AttachmentBlob.stored_size), 0)
+    ).scalar()
+    legacy_storage = (
+        db.query(func.coalesce(func.sum(Attachment.stored_size), 0))
+        .filter(Attachment.content_hash.is_(None))
+        .scalar()
+    )
+    physical_storage = blob_storage + legacy_storage
+    return {
+        "overview": {
+            "total_templates": db.query(func.count(AuditTemplate.id)).scalar(),
+            "total_reports": db.query(func.count(AuditReport.id)).scalar(),
+            "total_comments": db.query(func.count(TemplateComment.id)).scalar(),
+            "total_attachments": db.query(func.count(Attachment.id)).scalar(),
+            "recent_templates_30d": db.query(func.count(AuditTemplate.id))
+            .filter(AuditTemplate.created_at >= recent_since)
+            .scalar(),
+            "recent_reports_30d": db.query(func.count(AuditReport.id))
+            .filter(AuditReport.created_at >= recent_since)
+            .scalar(),
+            "total_storage_bytes": total_storage,
+            "total_storage_mb": round(total_storage / (1024 * 1024), 2),
+            "physical_storage_bytes": physical_storage,
+            "physical_storage_mb": round(physical_storage / (1024 * 1024), 2),
+        },
+        "templates_by_status": {
+            status.value: by_status.get(status, 0) for status in TemplateStatus
+        },
+        "trends": {
+            "templates_per_month": per_month(AuditTemplate),
+            "reports_per_month": per_month(AuditReport),
+        },
+        "top_templates": {
+            "most_commented": top(TemplateComment.id, (TemplateComment,), "comments"),
+            "most_attachments": top(
+                Attachment.id,
+                (Attachment, AuditTemplate.id == Attachment.template_id),
+                "attachments",
+            ),
+        },
+    }
+
+
+def timed(fn, db, runs: int) -> float:
+    fn(db)  # warm-up
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(db)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--seed", action="store_true", help="insert synthetic data first"
+    )
+    parser.add_argument("--templates", type=int, default=100_000)
+    parser.add_argument("--reports", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.seed:
+            seed(db, args.templates, args.reports)
+        # The seed bypasses the ORM hooks that maintain the rollups
+        rollups.rebuild(db)
+        db.commit()
+        if legacy_dashboard(db) != compute_dashboard_stats(db):
+            raise SystemExit(
+                "The rollup dashboard differs from the base tables; not timing it"
+            )
+        legacy_ms = timed(legacy_dashboard, db, args.runs)
+        current_ms = timed(compute_dashboard_stats, db, args.runs)
+    finally:
+        db.close()
+
+    print(f"legacy dashboard:  {legacy_ms:8.1f} ms (median of {args.runs})")
+    print(f"current dashboard: {current_ms:8.1f} ms (median of {args.runs})")
+    print(f"speed-up:          {legacy_ms / current_ms:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
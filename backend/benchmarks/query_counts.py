@@ -0,0 +1,166 @@
+"""
+Check that read endpoints execute a fixed number of SQL statements, whatever
+the size of the result (no N+1 queries).
+
+    poetry run python -m benchmarks.query_counts --small 1 --large 30
+
+Seeds a data set through the API with ``--small`` checklists, items per
+checklist, comments, versions, attachments and tagged templates, plus a
+report with copies of the checklists and attachments, and takes the
+X-Query-Count of every endpoint. It then seeds a ``--large`` data set and
+counts again: endpoints about a template or report now read the large one,
+and the dashboard and activity feed (about all data) see it added. Response
+caches are invalidated before every request, so what is counted is the
+uncached computation. Exits non-zero on a difference. It writes to
+DATABASE_URL and the upload directory; only run it against a throwaway
+database.
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ["QUERY_COUNT_HEADER"] = "true"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.cache import analytics_cache, checklist_graph_cache, diff_cache  # noqa: E402
+from app.database import QUERY_COUNT_HEADER  # noqa: E402
+from app.main import app  # noqa: E402
+
+# Read endpoints, formatted with the ids and name (also a tag) of a data set
+ENDPOINTS = [
+    "/audit/templates/?tags={name}",
+    "/audit/templates/tags/facets?tags={name}",
+    "/audit/templates/{template_id}",
+    "/audit/templates/{template_id}/versions/",
+    "/audit/templates/{template_id}/versions/summary",
+    "/audit/templates/{template_id}/versions/1",
+    "/audit/templates/{template_id}/versions/diff?from=1",
+    "/audit/templates/{template_id}/comments/",
+    "/audit/templates/{template_id}/attachments",
+    "/audit/reports/{report_id}",
+    "/audit/reports/{report_id}/attachments",
+    "/analytics/dashboard",
+    "/analytics/activity?limit=200",
+    "/checklists/template/{template_id}",
+    "/checklists/report/{report_id}",
+    "/checklists/{checklist_id}",
+    "/checklists/{checklist_id}/progress",
+    "/checklists/{checklist_id}/graph",
+    "/checklists/progress?template_id={template_id}",
+    "/search/?q={name}",
+]
+
+# Response caches would hide the queries of the computation they cache
+RESPONSE_CACHES = [analytics_cache, checklist_graph_cache, diff_cache]
+
+
+def check(response):
+    if response.status_code >= 400:
+        request = response.request
+        raise SystemExit(
+            f"{request.method} {request.url}: {response.status_code} {response.text}"
+        )
+    return response
+
+
+def seed(client: TestClient, size: int) -> dict:
+    name = f"querycount{size}x{int(time.time() * 1000)}"
+    tags = [name, *(f"{name}-{tag}" for tag in range(size))]
+    template = check(client.post(
+        "/audit/templates/",
+        json={"name": name, "content": "clause\n" * 20, "tags": tags},
+    )).json()
+    template_id = template["id"]
+    for other in range(1, size):
+        check(client.post(
+            "/audit/templates/",
+            json={"name": f"{name} {other}", "content": "clause\n", "tags": [name]},
+        ))
+    for version in range(size):
+        content = f"clause {version}\n" * 20
+        check(client.put(f"/audit/templates/{template_id}", json={"content": content}))
+    for comment in range(size):
+        check(client.post(
+            f"/audit/templates/{template_id}/comments/",
+            json={"content": f"{name} {comment}"},
+        ))
+    for attachment in range(size):
+        note = f"{name} {attachment}".encode()
+        check(client.post(
+            f"/audit/templates/{template_id}/attachments",
+            files={"file": (f"note{attachment}.txt", note, "text/plain")},
+        ))
+    checklist_id = None
+    for checklist in range(size):
+        checklist_id = check(client.post(
+            "/checklists/",
+            json={"name": f"{name} {checklist}", "template_id": template_id},
+        )).json()["id"]
+        for item in range(size):
+            check(client.post(
+                f"/checklists/{checklist_id}/items",
+                json={"title": f"item {item}", "order": -item},
+            ))
+    report_id = check(client.post(
+        "/audit/reports/",
+        json={
+            "template_id": template_id,
+            "title": name,
+            "instantiate_checklists": True,
+        },
+    )).json()["id"]
+    for attachment in range(size):
+        evidence = f"{name} {attachment}".encode()
+        check(client.post(
+            f"/audit/reports/{report_id}/attachments",
+            files={"file": (f"evidence{attachment}.txt", evidence, "text/plain")},
+        ))
+    return {
+        "template_id": template_id,
+        "checklist_id": checklist_id,
+        "report_id": report_id,
+        "name": name,
+    }
+
+
+def query_count(client: TestClient, path: str) -> int:
+    for cache in RESPONSE_CACHES:
+        cache.invalidate()
+    return int(check(client.get(path)).headers[QUERY_COUNT_HEADER])
+
+
+def measure(client: TestClient, data_set: dict) -> list:
+    counts = []
+    for endpoint in ENDPOINTS:
+        path = endpoint.format(**data_set)
+        # Warm up per-process caches (e.g. keyframes), which would otherwise
+        # skew the count; response caches are bypassed every time
+        query_count(client, path)
+        counts.append(query_count(client, path))
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--small", type=int, default=1)
+    parser.add_argument("--large", type=int, default=30)
+    args = parser.parse_args()
+
+    with TestClient(app) as client:
+        small_counts = measure(client, seed(client, args.small))
+        large_counts = measure(client, seed(client, args.large))
+    failures = 0
+    for endpoint, small, large in zip(ENDPOINTS, small_counts, large_counts):
+        status = "ok" if small == large else "N+1"
+        failures += status != "ok"
+        print(f"{status:>4}  {small:3d} / {large:3d} queries  {endpoint}")
+    if failures:
+        sys.exit(f"{failures} endpoints run more queries for larger results")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark /search against a large synthetic corpus, next to the ILIKE scan a
+client-side-style substring filter would need.
+
+    poetry run python -m benchmarks.search --seed --templates 1000000
+
+``--seed`` bulk-inserts synthetic templates into DATABASE_URL; only run it
+against a throwaway database.
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.routers.search import HEADLINE_OPTIONS, SEARCH_QUERY
+
+WORDS = [
+    "audit", "fire", "safety", "inspection", "ledger", "invoice", "payroll",
+    "vendor", "access", "backup", "encryption", "policy", "retention", "incident",
+    "server", "warehouse", "inventory", "forklift", "ventilation", "electrical",
+    "compliance", "contract", "signature", "approval", "quarterly",
+]
+
+# Half of each body is common vocabulary, half rare terms ("t<n>", each in
+# roughly rows * 60 / RARE_TERMS documents), so queries have realistic selectivity
+RARE_TERMS = 100_000
+
+QUERIES = ["t4242", "t1234 t5678", "fire t777", '"t99 t100"', "t31337 OR t27182"]
+
+
+def seed(db, templates: int) -> None:
+    db.execute(text("""
+        INSERT INTO audit_templates
+            (name, description, content, tags, status, version, created_at, updated_at)
+        SELECT 'bench-search-' || g,
+               (SELECT string_agg((CAST(:words AS text[]))[1 + (g * k) % :n], ' ')
+                FROM generate_series(1, 8) AS k),
+               (SELECT string_agg(
+                           CASE WHEN k % 2 = 0
+                                THEN (CAST(:words AS text[]))[1 + ((g + k) * 7919) % :n]
+                                ELSE 't' || ((g * 31 + k * 7919) % :rare) END,
+                           ' ')
+                FROM generate_series(1, 120) AS k),
+               '{}', 'draft', 1, now(), now()
+        FROM generate_series(1, :templates) AS g
+    """), {"words": WORDS, "n": len(WORDS), "rare": RARE_TERMS, "templates": templates})
+    db.commit()
+    db.execute(text("ANALYZE audit_templates"))
+
+
+def full_text(db, q: str) -> None:
+    db.execute(SEARCH_QUERY, {
+        "q": q, "include_templates": True, "include_comments": True,
+        "has_cursor": False, "after_rank": 0.0, "after_kind": 0, "after_id": 0,
+        "limit": 21, "headline_options": HEADLINE_OPTIONS,
+    }).all()
+
+
+def substring_scan(db, q: str) -> None:
+    # Ranking needs every match, so the scan cannot stop at the first page
+    term = q.split()[-1].strip('"')
+    db.execute(text("""
+        SELECT id FROM audit_templates
+        WHERE name ILIKE :pattern OR description ILIKE :pattern
+           OR content ILIKE :pattern
+    """), {"pattern": f"%{term} %"}).all()
+
+
+def timed(fn, db, runs: int) -> float:
+    samples = []
+    for q in QUERIES:
+        fn(db, q)  # warm-up
+        for _ in range(runs):
+            start = time.perf_counter()
+            fn(db, q)
+            samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--seed", action="store_true", help="insert synthetic data first"
+    )
+    parser.add_argument("--templates", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.seed:
+            seed(db, args.templates)
+        fts_ms = timed(full_text, db, args.runs)
+        scan_ms = timed(substring_scan, db, args.runs)
+    finally:
+        db.close()
+
+    print(f"full-text search (ranked, with snippets): {fts_ms:8.1f} ms (median)")
+    print(f"ILIKE scan (all matches, unranked):      {scan_ms:8.1f} ms (median)")
+
+
+if __name__ == "__main__":
+    main()
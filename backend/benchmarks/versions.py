@@ -0,0 +1,143 @@
+"""
+Benchmark template version storage: bytes on disk and reconstruction latency
+with full copies against keyframes plus deltas.
+
+    poetry run python -m benchmarks.versions --seed --versions 500 --lines 2000
+
+``--seed`` creates two templates with the same synthetic edit history, one
+per storage mode, in DATABASE_URL; only run it against a throwaway database.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy import func
+
+from app.database import SessionLocal
+from app.models import AuditTemplate, TemplateStatus, TemplateVersion
+from app.version_store import (
+    create_snapshot,
+    keyframe_cache,
+    load_content,
+    load_contents,
+    version_settings,
+)
+
+MODES = ["full", "delta"]
+
+
+def edit(lines: list, rng: random.Random) -> None:
+    """A typical revision: reword, insert or drop a few clauses."""
+    for _ in range(rng.randint(1, 5)):
+        position = rng.randrange(len(lines))
+        action = rng.random()
+        if action < 0.6:
+            number = rng.randrange(10**6)
+            lines[position] = f"{lines[position].rstrip('.')} (amended {number})."
+        elif action < 0.8:
+            number = rng.randrange(10**6)
+            clause = f"New clause {number}: record the outcome and sign it off."
+            lines.insert(position, clause)
+        elif len(lines) > 1:
+            del lines[position]
+
+
+def seed(db, versions: int, lines: int) -> None:
+    for mode in MODES:
+        version_settings.version_storage = mode
+        rng = random.Random(42)
+        text_lines = [
+            f"Clause {i}: the auditor shall verify control {rng.randrange(10**6)}"
+            " and retain evidence for seven years."
+            for i in range(lines)
+        ]
+        template = AuditTemplate(
+            name=f"bench-versions-{mode}",
+            content="\n".join(text_lines),
+            tags=[],
+            status=TemplateStatus.DRAFT,
+        )
+        db.add(template)
+        db.flush()
+        for _ in range(versions):
+            create_snapshot(db, template, "bench")
+            db.flush()
+            edit(text_lines, rng)
+            template.content = "\n".join(text_lines)
+            template.version += 1
+        db.commit()
+
+
+def template_id(db, mode: str) -> int:
+    name = f"bench-versions-{mode}"
+    return db.query(AuditTemplate.id).filter(AuditTemplate.name == name).scalar()
+
+
+def stored_bytes(db, mode: str) -> int:
+    return db.query(
+        func.sum(func.coalesce(func.pg_column_size(TemplateVersion.content), 0)
+                 + func.coalesce(func.pg_column_size(TemplateVersion.content_delta), 0))
+    ).filter(TemplateVersion.template_id == template_id(db, mode)).scalar()
+
+
+def timed(fn, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--seed", action="store_true", help="insert synthetic data first"
+    )
+    parser.add_argument("--versions", type=int, default=500)
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.seed:
+            seed(db, args.versions, args.lines)
+        for mode in MODES:
+            tid = template_id(db, mode)
+            versions = db.query(TemplateVersion).filter(
+                TemplateVersion.template_id == tid
+            )
+            numbers = [n for (n,) in versions.with_entities(TemplateVersion.version)]
+            rng = random.Random(7)
+
+            def get_version(cold: bool):
+                if cold:
+                    keyframe_cache.clear()
+                db.expunge_all()
+                version = versions.filter(
+                    TemplateVersion.version == rng.choice(numbers)
+                ).first()
+                load_content(db, version)
+
+            def list_versions():
+                db.expunge_all()
+                load_contents(db, versions.all())
+
+            stored = stored_bytes(db, mode) / 1024
+            cold = timed(lambda: get_version(True), args.runs)
+            warm = timed(lambda: get_version(False), args.runs)
+            listing = timed(list_versions, max(1, args.runs // 4))
+            print(f"{mode:>5}: {stored:10.1f} KiB stored for {len(numbers)} versions")
+            print(f"{'':>5}  get_version (cold cache) {cold:8.2f} ms (median)")
+            print(f"{'':>5}  get_version (warm cache) {warm:8.2f} ms (median)")
+            print(f"{'':>5}  list_versions            {listing:8.2f} ms (median)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -32,6 +32,7 @@ export interface AuditReportCreate {
   template_id: number;
   title: string;
   due_date?: string;
+  instantiate_checklists?: boolean;
 }
 
 export interface TemplateComment {
@@ -130,6 +131,7 @@ export interface ChecklistItem {
   is_mandatory: boolean;
   order: number;
   depends_on_id?: number;
+  depends_on_ids?: number[];
   completed_by?: string;
   completed_at?: string;
   due_date?: string;
@@ -161,6 +163,7 @@ export interface ChecklistItemCreate {
   is_mandatory?: boolean;
   order?: number;
   depends_on_id?: number;
+  depends_on_ids?: number[];
   due_date?: string;
 }
 
@@ -171,6 +174,7 @@ export interface ChecklistItemUpdate {
   is_mandatory?: boolean;
   order?: number;
   depends_on_id?: number;
+  depends_on_ids?: number[];
   due_date?: string;
 }
 
@@ -199,9 +203,18 @@ class ApiClient {
   }
 
   async getTemplates(): Promise<AuditTemplate[]> {
-    const response = await fetch(`${this.baseUrl}/audit/templates`);
-    if (!response.ok) throw new Error("Failed to fetch templates");
-    return response.json();
+    // The listing is paged; follow X-Next-Cursor until every template is loaded
+    const templates: AuditTemplate[] = [];
+    let cursor: string | null = null;
+    do {
+      const params = new URLSearchParams({ limit: "500" });
+      if (cursor) params.append("cursor", cursor);
+      const response = await fetch(`${this.baseUrl}/audit/templates/?${params}`);
+      if (!response.ok) throw new Error("Failed to fetch templates");
+      templates.push(...(await response.json()));
+      cursor = response.headers.get("X-Next-Cursor");
+    } while (cursor);
+    return templates;
   }
 
   async getTemplate(id: number): Promise<AuditTemplate> {
@@ -441,6 +454,18 @@ class ApiClient {
     if (!response.ok) throw new Error("Failed to fetch checklist progress");
     return response.json();
   }
+
+  async getChecklistsProgress(filter: { template_id?: number; report_id?: number; ids?: number[] }): Promise<ChecklistProgress[]> {
+    const params = new URLSearchParams();
+    if (filter.template_id !== undefined) params.append("template_id", String(filter.template_id));
+    if (filter.report_id !== undefined) params.append("report_id", String(filter.report_id));
+    filter.ids?.forEach((id) => params.append("ids", String(id)));
+    const response = await fetch(`${this.baseUrl}/checklists/progress?${params}`, {
+      headers: this.getHeaders(),
+    });
+    if (!response.ok) throw new Error("Failed to fetch checklist progress");
+    return response.json();
+  }
 }
 
 export const api = new ApiClient(API_BASE_URL);